@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Benchmark suite for packet.
+
+Run it with ``python -m benchmarks`` (see ``python -m benchmarks --help``).
+Results are printed as a table and may be written as JSON, so the results
+of two commits can be compared with ``--compare``.
+
+benchmarks.receive_allocations measures the memory allocated per frame by
+the FrameReader receive loop, benchmarks.parallel_codec the throughput of
+ParallelCodec and benchmarks.server_connections the memory used by idle
+PacketServer connections.
+"""
+
+import timeit
+
+_timer = timeit.default_timer
+
+
+class Result(object):
+    """
+    Timing of a benchmark case: throughput and latency percentiles.
+    """
+
+    def __init__(self, name, params, latencies, total, extra=None):
+        """
+        :param name: Unique name of the case
+        :type name: str
+        :param params: Parameters of the case (class, serializer, ...)
+        :type params: dict
+        :param latencies: Duration of every call, in seconds
+        :type latencies: list[float]
+        :param total: Total duration of the calls, in seconds
+        :type total: float
+        :param extra: Other measurements of the case (e.g. payload size)
+        :type extra: dict
+        """
+        self.name = name
+        self.params = params
+        self.latencies = sorted(latencies)
+        self.total = total
+        self.extra = extra or {}
+
+    def percentile(self, p):
+        latencies = self.latencies
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+    def to_dict(self):
+        count = len(self.latencies)
+        result = {
+            "name": self.name,
+            "params": self.params,
+            "calls": count,
+            "ops_per_sec": count / self.total if self.total else 0.0,
+            "mean_us": self.total / count * 1e6,
+            "p50_us": self.percentile(50) * 1e6,
+            "p90_us": self.percentile(90) * 1e6,
+            "p99_us": self.percentile(99) * 1e6,
+            "max_us": self.latencies[-1] * 1e6,
+        }
+        result.update(self.extra)
+        return result
+
+
+def measure(function, min_time, min_calls=5, warmup=3):
+    """
+    Call function repeatedly, for at least min_time seconds and min_calls
+    calls, timing every call.
+    :return: latencies (seconds) and total time
+    :rtype: tuple[list[float], float]
+    """
+    for _ in range(warmup):
+        function()
+    latencies = []
+    total = 0.0
+    while total < min_time or len(latencies) < min_calls:
+        start = _timer()
+        function()
+        elapsed = _timer() - start
+        latencies.append(elapsed)
+        total += elapsed
+    return latencies, total
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Run the benchmark suite:
+
+    python -m benchmarks [--quick] [--filter REGEX] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+import packet
+from benchmarks import Result, measure
+from benchmarks.cases import all_cases
+
+
+def _git_commit():
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def _metadata():
+    return {
+        "commit": _git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cipher_backend": packet.get_cipher_backend(),
+    }
+
+
+def run(cases, min_time, log=sys.stderr):
+    results = []
+    for i, case in enumerate(cases):
+        function, extra, cleanup = case.setup()
+        try:
+            latencies, total = measure(function, min_time)
+        finally:
+            if cleanup is not None:
+                cleanup()
+        result = Result(case.name, case.params, latencies, total, extra).to_dict()
+        results.append(result)
+        log.write("[{}/{}] {:<56} {:>12.0f} ops/s  p50 {:>9.1f} us  p99 {:>9.1f} us\n".format(
+            i + 1, len(cases), case.name, result["ops_per_sec"], result["p50_us"], result["p99_us"]))
+    return results
+
+
+def compare(results, baseline, threshold, out=sys.stdout):
+    """
+    Print the change of the median time of every case against a baseline,
+    and return the names of the cases which are slower by more than
+    threshold. The median is used as it is less affected by noise (e.g.
+    other processes) than the mean.
+    """
+    baseline = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        change = result["p50_us"] / old["p50_us"] - 1
+        mark = ""
+        if change > threshold:
+            mark = "  REGRESSION"
+            regressions.append(result["name"])
+        out.write("{:<56} {:>10.1f} us -> {:>10.1f} us  {:>+7.1%}{}\n".format(
+            result["name"], old["p50_us"], result["p50_us"], change, mark))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run the packet benchmark suite.")
+    parser.add_argument("--quick", action="store_true", help="time every case for a shorter time")
+    parser.add_argument("--min-time", type=float, help="minimum time per case, in seconds (default 0.2)")
+    parser.add_argument("--filter", help="only run the cases whose name matches this regular expression")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    parser.add_argument("--output", help="write the results as JSON to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="compare the results with a JSON file from a previous run")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown reported as a regression by --compare (default 0.1)")
+    args = parser.parse_args(argv)
+
+    cases = all_cases()
+    if args.filter:
+        pattern = re.compile(args.filter)
+        cases = [case for case in cases if pattern.search(case.name)]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return 0
+
+    min_time = args.min_time if args.min_time is not None else 0.05 if args.quick else 0.2
+    results = run(cases, min_time)
+    report = {"metadata": dict(_metadata(), min_time=min_time), "results": results}
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    elif args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            regressions = compare(results, json.load(fp), args.threshold)
+        if regressions:
+            print("{} regression(s) above {:.0%}".format(len(regressions), args.threshold))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
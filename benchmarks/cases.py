@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Benchmark cases. Every case has a unique name, and a setup function which
+prepares the case and returns the function to time, the extra measurements
+of the case and a function to call once the case is timed (or None).
+"""
+
+import threading
+
+import packet
+from benchmarks.payloads import PACKET_CLASSES, SHAPES, SIZES, packet_class
+
+SERIALIZERS = {"json": packet.json_serializer, "ast": packet.ast_serializer}
+MODES = {"CTR": packet.CTR_MODE, "CBC": packet.CBC_MODE}
+ENCRYPTION_KEY = "benchmark-key"
+
+
+class Case(object):
+    def __init__(self, name, params, setup):
+        self.name = name
+        self.params = params
+        self.setup = setup
+
+
+def _serializers(class_name):
+    # Inspected packets serialize with integer keys, which JSON does not allow
+    return ["ast"] if "Inspected" in class_name else sorted(SERIALIZERS)
+
+
+def _modes(class_name):
+    return sorted(MODES) if "Safe" in class_name else [None]
+
+
+def _new_packet(class_name, shape, size, serializer, mode):
+    if mode is not None:
+        packet.set_packet_encryption_key(ENCRYPTION_KEY)
+        packet.set_packet_encryption_mode(MODES[mode])
+    p = packet_class(PACKET_CLASSES[class_name], shape, size, fields=class_name.startswith("Fields"))()
+    p.set_serializer(SERIALIZERS[serializer])
+    return p
+
+
+def _dumps_case(class_name, shape, size, serializer, mode):
+    def setup():
+        p = _new_packet(class_name, shape, size, serializer, mode)
+        return p.dumps, {"bytes": len(p.dumps())}, None
+    return setup
+
+
+def _loads_case(class_name, shape, size, serializer, mode):
+    def setup():
+        p = _new_packet(class_name, shape, size, serializer, mode)
+        data = p.dumps()
+        return lambda: p.loads(data), {"bytes": len(data)}, None
+    return setup
+
+
+def _setattr_case(class_name):
+    def setup():
+        p = _new_packet(class_name, "flat", "medium", _serializers(class_name)[0], _modes(class_name)[0])
+
+        def set_attribute():
+            p.int0 = 1
+        return set_attribute, {}, None
+    return setup
+
+
+def _contention_case(class_name, operation, threads):
+    """
+    Time dumps while threads set attributes, or set attributes while
+    threads dump the packet.
+    """
+    def setup():
+        p = _new_packet(class_name, "nested", "medium", _serializers(class_name)[0], _modes(class_name)[0])
+        stop = threading.Event()
+
+        def set_attributes():
+            value = 0
+            while not stop.is_set():
+                p.id = value
+                value += 1
+
+        def dump():
+            while not stop.is_set():
+                p.dumps()
+
+        def set_attribute():
+            p.name = "value"
+
+        target, function = (set_attributes, p.dumps) if operation == "dumps" else (dump, set_attribute)
+        workers = [threading.Thread(target=target) for _ in range(threads)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        def cleanup():
+            stop.set()
+            for w in workers:
+                w.join()
+        return function, {}, cleanup
+    return setup
+
+
+def all_cases():
+    """
+    :rtype: list[Case]
+    """
+    cases = []
+    for class_name in sorted(PACKET_CLASSES):
+        for serializer in _serializers(class_name):
+            for mode in _modes(class_name):
+                for shape in sorted(SHAPES):
+                    for size in sorted(SIZES, key=SIZES.get):
+                        params = {"class": class_name, "serializer": serializer, "mode": mode,
+                                  "shape": shape, "size": size}
+                        for operation, factory in (("dumps", _dumps_case), ("loads", _loads_case)):
+                            name = ".".join(p for p in (operation, class_name, serializer, mode, shape, size) if p)
+                            params = dict(params, operation=operation)
+                            cases.append(Case(name, params, factory(class_name, shape, size, serializer, mode)))
+
+        cases.append(Case("setattr." + class_name, {"class": class_name, "operation": "setattr"},
+                          _setattr_case(class_name)))
+        for operation in ("dumps", "setattr"):
+            params = {"class": class_name, "operation": operation, "threads": 2}
+            cases.append(Case("contention.{}.{}".format(operation, class_name), params,
+                              _contention_case(class_name, operation, 2)))
+    return cases
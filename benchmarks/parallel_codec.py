@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Throughput of ParallelCodec against dumps and loads in a single process.
+
+SafePacket payloads are dumped and loaded with the given cipher backend
+(pyaes by default, as it is the one limited by the GIL), first one by one
+and then with a ParallelCodec with 1 to the given number of workers.
+
+    python -m benchmarks.parallel_codec [packets] [max_workers] [backend]
+"""
+
+import os
+import sys
+import timeit
+
+import packet
+from benchmarks.payloads import packet_class
+from packet.parallel import ParallelCodec
+
+
+def _throughput(function, count):
+    return count / min(timeit.repeat(function, number=1, repeat=3))
+
+
+def main(count=2000, max_workers=os.cpu_count() or 1, backend="pyaes"):
+    packet.set_cipher_backend(backend)
+    packet.set_packet_encryption_key("benchmark-key")
+    packet.set_packet_encryption_mode(packet.CBC_MODE)
+    cls = packet_class(packet.SafePacket, "nested", "medium")
+    packets = [cls() for _ in range(count)]
+    payloads = [p.dumps() for p in packets]
+
+    def loads():
+        for p, payload in zip(packets, payloads):
+            p.loads(payload)
+
+    print("{} {} packets of {} bytes, {} backend".format(count, cls.__name__, len(payloads[0]), backend))
+    print("{:<12} {:>14} {:>14}".format("workers", "dumps/s", "loads/s"))
+    print("{:<12} {:>14.0f} {:>14.0f}".format(
+        "sequential", _throughput(lambda: [p.dumps() for p in packets], count), _throughput(loads, count)))
+    for workers in range(1, max_workers + 1):
+        with ParallelCodec([cls], workers=workers, chunk_size=32) as codec:
+            codec.dumps_many(packets[:workers])  # start the workers
+            print("{:<12} {:>14.0f} {:>14.0f}".format(
+                workers, _throughput(lambda: codec.dumps_many(packets), count),
+                _throughput(lambda: codec.loads_many(packets, payloads), count)))
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:3]] + sys.argv[3:4])
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Packet classes with payloads of several shapes and sizes.
+
+Payloads only use types supported by every serializer and packet class, so
+the same payloads are used for all the cases.
+"""
+
+import copy
+
+import packet
+from packet.fields import Field
+
+SIZES = {"small": 4, "medium": 64, "large": 1024}
+
+
+def _flat(self, n):
+    # Many attributes of simple types
+    for i in range(n):
+        setattr(self, "int{}".format(i), i)
+        setattr(self, "float{}".format(i), i * 0.5)
+        setattr(self, "str{}".format(i), "value {}".format(i))
+
+
+def _nested(self, n):
+    # A few attributes holding nested containers
+    self.id = 1
+    self.name = "nested"
+    self.items = [{"id": i, "tags": ["a", "b"], "position": [i * 1.5, -i * 1.5], "active": i % 2 == 0}
+                  for i in range(n)]
+    self.index = {"key{}".format(i): [i, str(i)] for i in range(n)}
+
+
+def _numbers(self, n):
+    # Large lists of numbers
+    self.ints = list(range(n * 8))
+    self.floats = [i / 3.0 for i in range(n * 8)]
+
+
+SHAPES = {"flat": _flat, "nested": _nested, "numbers": _numbers}
+
+
+class _Sample(object):
+    pass
+
+
+def _declare_fields(fill, n):
+    # Fields with the types and values of a sample payload
+    sample = _Sample()
+    fill(sample, n)
+    fields = {}
+    for name, value in sorted(sample.__dict__.items()):
+        if isinstance(value, (list, dict)):
+            fields[name] = Field(type(value), factory=lambda value=value: copy.deepcopy(value))
+        else:
+            fields[name] = Field(type(value), value)
+    return fields
+
+
+def packet_class(base, shape, size, fields=False):
+    """
+    Create a subclass of base whose instances hold a payload of the given
+    shape and size.
+    :param base: Packet class
+    :type base: type
+    :param shape: Name of the payload shape (see SHAPES)
+    :type shape: str
+    :param size: Name of the payload size (see SIZES)
+    :type size: str
+    :param fields: Whether the payload attributes are declared as fields
+    instead of being set in __init__
+    :type fields: bool
+    :rtype: type
+    """
+    fill = SHAPES[shape]
+    n = SIZES[size]
+    name = "{}{}{}".format("Fields" if fields else "", base.__name__, shape.title()) + size.title()
+
+    if fields:
+        return type(name, (base,), _declare_fields(fill, n))
+
+    class BenchmarkPacket(base):
+        def __init__(self):
+            fill(self, n)
+
+    BenchmarkPacket.__name__ = name
+    return BenchmarkPacket
+
+
+PACKET_CLASSES = {
+    "Packet": packet.Packet,
+    "SafePacket": packet.SafePacket,
+    "InspectedPacket": packet.InspectedPacket,
+    "InspectedSafePacket": packet.InspectedSafePacket,
+    # Packet declared with fields (see packet.fields)
+    "FieldsPacket": packet.Packet,
+}
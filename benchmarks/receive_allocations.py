@@ -0,0 +1,58 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Memory allocated per frame by the FrameReader receive loop.
+
+Frames are sent over a socket pair and read back with FrameReader.receive().
+For every frame, the memory allocated on top of what was already in use
+(the tracemalloc peak) is measured; the buffers reused by the reader do not
+count, the bytes objects created per read or per frame do.
+
+    python -m benchmarks.receive_allocations [frames] [body_size]
+"""
+
+import socket
+import sys
+import timeit
+import tracemalloc
+
+from packet import FrameReader, pack_frame
+
+
+def _receive(reader, count, measure):
+    allocated = 0
+    for _ in range(count):
+        if measure:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+        frame = reader.receive()
+        if measure:
+            allocated += tracemalloc.get_traced_memory()[1] - current
+        del frame
+    return allocated
+
+
+def main(count=200, body_size=512):
+    sender, receiver = socket.socketpair()
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+    data = pack_frame(b"x" * body_size, "tag") * count
+
+    def run(measure=False):
+        sender.sendall(data)
+        return _receive(FrameReader(receiver), count, measure)
+
+    run()
+    tracemalloc.start()
+    allocated = run(True)
+    tracemalloc.stop()
+    seconds = min(timeit.repeat(run, number=20, repeat=5)) / 20
+    print("{} frames of {} bytes".format(count, body_size))
+    print("allocated per frame: {:.0f} bytes".format(allocated / float(count)))
+    print("time per frame: {:.2f} us".format(seconds / count * 1e6))
+    sender.close()
+    receiver.close()
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:]])
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Memory used by idle PacketServer connections, and round trip time of a
+packet over every one of them.
+
+Plain sockets are connected to a server in the same process (so each
+connection takes two file descriptors) and left idle. The memory allocated
+by the server per connection (tracemalloc) is measured, then a packet is
+sent over every connection and echoed back by the server.
+
+    python -m benchmarks.server_connections [connections]
+"""
+
+import socket
+import sys
+import time
+import tracemalloc
+
+import packet
+from packet.server import PacketServer
+
+
+class Ping(packet.Packet):
+    def __init__(self):
+        self.value = 0
+
+
+def main(count=5000):
+    server = PacketServer(("127.0.0.1", 0), workers=4)
+    server.register(Ping, lambda connection, p: connection.send(p))
+    server.start()
+
+    tracemalloc.start()
+    current = tracemalloc.get_traced_memory()[0]
+    sockets = [socket.create_connection(server.address) for _ in range(count)]
+    while server.stats()["connections"] < count:
+        time.sleep(0.01)
+    allocated = tracemalloc.get_traced_memory()[0] - current
+    tracemalloc.stop()
+    print("{} idle connections".format(count))
+    print("allocated per connection: {:.0f} bytes".format(allocated / float(count)))
+
+    frame = packet.pack_frame(Ping().dumps(), "Ping")
+    start = time.time()
+    for sock in sockets:
+        sock.sendall(frame)
+    for sock in sockets:
+        reader = packet.FrameReader(sock)
+        assert reader.receive().tag == "Ping"
+    elapsed = time.time() - start
+    print("round trip over every connection: {:.3f} s ({:.0f} packets/s)".format(elapsed, count / elapsed))
+    print(server.stats())
+
+    for sock in sockets:
+        sock.close()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(*[int(argument) for argument in sys.argv[1:]])
@@ -2,17 +2,27 @@
 # -*- coding: UTF-8 -*-
 
 from packet.basepacket import Packet, InspectedPacket, InspectedSafePacket, SafePacket, \
-    set_packet_encryption_key, set_packet_encryption_mode, set_cbc_mode, set_ctr_mode
+    set_packet_encryption_key, set_packet_encryption_mode, set_cbc_mode, set_ctr_mode, set_gcm_mode
+from packet.ciphers import get_cipher_backend, set_cipher_backend
 from packet.evaluate import safe_eval
-from packet.serializers import ast_serializer, json_serializer
-from packet.utils import CBC_MODE, CTR_MODE
+from packet.fields import Field
+from packet.framing import BufferPool, FLAG_CORRELATION_ID, Frame, FrameReader, pack_frame, send_frame
+from packet.log import LogRecord, PacketLogReader, PacketLogWriter
+from packet.metrics import MetricsAggregator, get_metrics_hook, set_metrics_hook
+from packet.router import PacketRouter
+from packet.serializers import ast_serializer, binary_serializer, json_serializer
+from packet.utils import CBC_MODE, CTR_MODE, GCM_MODE
 from packet.utils import UnknownPacket, InvalidData, UnknownEncryption, \
-    NotSerializable
+    NotSerializable, ChannelClosed
 
 __all__ = [
-    "Packet", "SafePacket", "InspectedPacket", "InspectedSafePacket",
-    "UnknownPacket", "InvalidData", "UnknownEncryption", "NotSerializable",
-    "ast_serializer", "json_serializer", "safe_eval",
+    "Packet", "SafePacket", "InspectedPacket", "InspectedSafePacket", "Field",
+    "UnknownPacket", "InvalidData", "UnknownEncryption", "NotSerializable", "ChannelClosed",
+    "ast_serializer", "binary_serializer", "json_serializer", "safe_eval",
     "set_packet_encryption_key", "set_packet_encryption_mode",
-    "set_cbc_mode", "set_ctr_mode", "CBC_MODE", "CTR_MODE",
+    "set_cbc_mode", "set_ctr_mode", "set_gcm_mode", "CBC_MODE", "CTR_MODE", "GCM_MODE",
+    "get_cipher_backend", "set_cipher_backend",
+    "BufferPool", "FLAG_CORRELATION_ID", "Frame", "FrameReader", "pack_frame", "send_frame", "PacketRouter",
+    "LogRecord", "PacketLogReader", "PacketLogWriter",
+    "MetricsAggregator", "get_metrics_hook", "set_metrics_hook",
 ]
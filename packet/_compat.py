@@ -9,16 +9,52 @@ PY2 = PY_VERSION[0] == 2
 
 if PY3:
     string_types = str,
+    text_type = str
+    integer_types = int,
 
     def get_items(o):
         return o.items()
+
+    def xor_bytes(a, b):
+        return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+    def decode_text(data):
+        return data if isinstance(data, str) else str(data, "utf-8")
+
+    def to_bytes(data):
+        return bytes(data)
+
+    def release_view(view):
+        view.release()
 else:
     # noinspection PyUnresolvedReferences
     string_types = basestring,  # NOQA
+    # noinspection PyUnresolvedReferences
+    text_type = unicode  # NOQA
+    # noinspection PyUnresolvedReferences
+    integer_types = int, long  # NOQA
 
     def get_items(o):
         return o.iteritems()
 
+    def xor_bytes(a, b):
+        return bytes(bytearray(x ^ y for x, y in zip(bytearray(a), bytearray(b))))
+
+    def decode_text(data):
+        if isinstance(data, unicode):  # NOQA
+            return data
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return bytes(data).decode("utf-8")
+
+    def to_bytes(data):
+        # bytes(memoryview) is the repr of the view in Python 2
+        return data.tobytes() if isinstance(data, memoryview) else bytes(data)
+
+    def release_view(view):
+        # Python 2 memoryviews can't be released
+        pass
+
 
 def with_metaclass(meta, *bases):
     class Metaclass(meta):
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+asyncio support (Python 3.5+).
+
+Packets are exchanged as frames (see packet.framing) over asyncio streams.
+Serialization and encryption may be offloaded to an executor, so the event
+loop neither runs CPU heavy work nor waits on packet locks.
+"""
+
+import asyncio
+import functools
+
+from packet.framing import DEFAULT_MAX_FRAME_SIZE, FRAME_HEADER_SIZE, Frame, _CORRELATION_ID, _HEADER, \
+    _correlation_id_size, _decode_tag, _pack_header
+from packet.utils import InvalidData, UnknownPacket
+
+# asyncio.get_running_loop is new in Python 3.7, get_event_loop is deprecated
+# in coroutines since Python 3.10
+_get_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+async def _run(executor, function, *args):
+    if executor is None:
+        return function(*args)
+    return await _get_running_loop().run_in_executor(executor, functools.partial(function, *args))
+
+
+async def read_frame(reader, max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+    """
+    Read a whole frame from an asyncio.StreamReader.
+    Returns None if the stream ended before a whole frame was read.
+    Raises InvalidData if the frame is larger than max_frame_size, or its
+    tag is not valid.
+    :param reader: Stream reader
+    :type reader: asyncio.StreamReader
+    :param max_frame_size: Maximum frame size
+    :type max_frame_size: int
+    :return: frame or None
+    :rtype: Frame
+    """
+    try:
+        length, flags, tag_length = _HEADER.unpack(await reader.readexactly(FRAME_HEADER_SIZE))
+        if length > max_frame_size:
+            raise InvalidData("Frame too large ({} bytes)".format(length))
+        body_start = tag_length + _correlation_id_size(flags)
+        data = await reader.readexactly(body_start + length)
+    except asyncio.IncompleteReadError:
+        return None
+    tag = _decode_tag(data[:tag_length]) if tag_length else None
+    correlation_id = _CORRELATION_ID.unpack_from(data, tag_length)[0] if body_start != tag_length else None
+    return Frame(tag, flags, data[body_start:], correlation_id)
+
+
+async def send_packet(packet, writer, executor=None):
+    """
+    Send packet as a frame to an asyncio.StreamWriter.
+    :param packet: Packet to send
+    :type packet: packet.Packet
+    :param writer: Stream writer
+    :type writer: asyncio.StreamWriter
+    :param executor: Executor where to dump the packet, or None to dump it
+    in the event loop
+    :type executor: concurrent.futures.Executor
+    :return: Bytes sent
+    :rtype: int
+    """
+    body = await _run(executor, packet._dump_payload)
+    header = _pack_header(len(body), packet.__tag__)
+    # Header and body are written as separate buffers, the body is not copied
+    writer.write(header)
+    writer.write(body)
+    await writer.drain()
+    return len(header) + len(body)
+
+
+async def receive_packet(packet, reader, executor=None):
+    """
+    Receive a frame from an asyncio.StreamReader and load it into packet.
+    If there is an error loading data or no data is obtained, returns False,
+    otherwise returns True.
+    :param packet: Packet to update
+    :type packet: packet.Packet
+    :param reader: Stream reader
+    :type reader: asyncio.StreamReader
+    :param executor: Executor where to load the packet, or None to load it
+    in the event loop
+    :type executor: concurrent.futures.Executor
+    :return: Success
+    :rtype: bool
+    """
+    try:
+        frame = await read_frame(reader)
+    except InvalidData:
+        return False
+    if frame is None or (frame.tag is not None and frame.tag != packet.__tag__):
+        return False
+    try:
+        await _run(executor, packet.loads, frame.body)
+    except (UnknownPacket, InvalidData):
+        return False
+    return True
+
+
+class iter_packets(object):
+    """
+    Asynchronous iterator of the packets received from an
+    asyncio.StreamReader. For each frame, a new packet is created with
+    factory() and the frame is loaded into it. Iteration stops when the
+    stream ends.
+    Raises UnknownPacket or InvalidData if a frame can not be loaded.
+
+        async for p in iter_packets(reader, MyPacket):
+            ...
+    """
+
+    def __init__(self, reader, factory, executor=None, max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+        self._reader = reader
+        self._factory = factory
+        self._executor = executor
+        self._max_frame_size = max_frame_size
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await read_frame(self._reader, self._max_frame_size)
+        if frame is None:
+            raise StopAsyncIteration
+        packet = self._factory()
+        if frame.tag is not None and frame.tag != packet.__tag__:
+            raise InvalidData("Expected data with tag '{}'".format(packet.__tag__))
+        await _run(self._executor, packet.loads, frame.body)
+        return packet
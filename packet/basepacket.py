@@ -1,25 +1,40 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
 
-import hashlib
-import os
+import copy
 import threading
 from typing import BinaryIO  # noqa
 
-import pyaes
-
+from packet import compiler
 from packet._compat import get_items, with_metaclass
-from packet.serializers import json_serializer, ast_serializer, _get_attributes, _Serializable, _Serializer
-from packet.utils import CTR_MODE, CBC_MODE, UnknownEncryption
+from packet.ciphers import _get_cipher, _clear_ciphers
+from packet.compression import MAX_DICTIONARY_SIZE, compress, decompress, train_dictionary
+from packet.fields import _declare_fields
+from packet.framing import FrameReader, default_pool, send_frame
+from packet.metrics import timer
+from packet.serializers import json_serializer, ast_serializer, binary_serializer, _get_attributes, \
+    _get_class_slots, _invalidate_attributes, _Serializable, _Serializer, _SERIALIZABLE_SLOTS
+from packet.utils import CTR_MODE, CBC_MODE, GCM_MODE, UnknownEncryption
 from packet.utils import UnknownPacket, InvalidData
 
 
+# Locks shared by the instances of classes declared with fields, so every
+# instance does not need one of its own. Two packets may get the same lock,
+# so code running with a packet lock held (e.g. property setters) must not
+# use another packet of such a class: two threads doing so in opposite
+# order can deadlock. The packet methods never hold two packet locks.
+_shared_locks = tuple(threading.RLock() for _ in range(64))
+
+
 class _PacketMetaClass(type):
     """
     MetaClass to be used in Packet in order to set _INITIALISED flag
-    after __init__ is called
+    after __init__ is called, and to declare the fields of packet classes
     """
 
+    def __new__(mcs, name, bases, namespace):
+        return super(_PacketMetaClass, mcs).__new__(mcs, name, bases, _declare_fields(bases, namespace))
+
     def __call__(cls, *args, **kwargs):
         self = super(_PacketMetaClass, cls).__call__(*args, **kwargs)
         object.__setattr__(self, "_packet_initialised", True)
@@ -31,13 +46,48 @@ class Packet(with_metaclass(_PacketMetaClass, _Serializable)):
     """
     General packet class. This is the main "Packet" class.
     Every packet classes should inherit from this one.
+
+    Packet attributes are either set in __init__, or declared as fields
+    (see packet.fields.Field), so they are stored in __slots__.
+
+    Serialized data is compressed (before being encrypted, if applicable)
+    if compression_threshold is set: payloads of at least that many bytes
+    are deflated with zlib, using compression_dict as preset dictionary
+    (see train_compression). Sender and receiver must use the same
+    compression settings.
     """
 
+    compression_threshold = None
+    compression_dict = None
+    compression_level = 6
+
+    # Metrics hook (see packet.metrics.set_metrics_hook)
+    _packet_metrics_hook = None
+
+    # Fields of the class, set by _PacketMetaClass: the Field objects, their
+    # names (in order) and a mapping from name to Field
+    _packet_field_defs = None
+    _packet_fields = None
+    _packet_field_map = None
+
+    # Subclasses not declared with fields still have a __dict__
+    __slots__ = ()
+
     def __new__(cls, *args, **kwargs):
         self = super(Packet, cls).__new__(cls, *args, **kwargs)
         object.__setattr__(self, "_packet_serializer", json_serializer)
-        object.__setattr__(self, "_packet_lock", threading.RLock())
         object.__setattr__(self, "_packet_initialised", False)
+        fields = cls._packet_field_defs
+        if fields is None:
+            object.__setattr__(self, "_packet_lock", threading.RLock())
+        else:
+            object.__setattr__(self, "_packet_lock", _shared_locks[(id(self) >> 4) % len(_shared_locks)])
+            for field in fields:
+                object.__setattr__(self, field.name, field.initial())
+        object.__setattr__(self, "_packet_attributes", cls._packet_field_set)
+        object.__setattr__(self, "_packet_dirty", None)
+        object.__setattr__(self, "_packet_baseline", None)
+        object.__setattr__(self, "_packet_snapshot", None)
         return self
 
     def set_json_serializer(self):
@@ -54,10 +104,18 @@ class Packet(with_metaclass(_PacketMetaClass, _Serializable)):
        """
         self.set_serializer(ast_serializer)
 
+    def set_binary_serializer(self):
+        """
+       Set binary_serializer as the serializer to be used.
+       Same as self.set_packet_serializer(binary_serializer).
+       """
+        self.set_serializer(binary_serializer)
+
     def set_serializer(self, serializer):
         """
         Set serializer to be used.
-        Serializer must be either json_serializer or ast_serializer.
+        Serializer must be either json_serializer, ast_serializer or
+        binary_serializer.
         :param serializer: Serializer to use
         :type serializer: _Serializer
         """
@@ -74,12 +132,33 @@ class Packet(with_metaclass(_PacketMetaClass, _Serializable)):
         """
         return self.__class__.__name__
 
-    def _generate_dict(self):
+    def _snapshot(self):
+        """
+        Return a shallow copy of the packet attributes as a dictionary.
+        The copy is reused until an attribute is set or the packet is
+        loaded, so taking it again is free. Must be called with the packet
+        lock held; the copy itself can be used without the lock.
+        :rtype: dict
+        """
+        snapshot = self._packet_snapshot
+        if snapshot is None:
+            if self._packet_fields is not None:
+                snapshot = self._packet_fields_snapshot(self)
+            elif _get_class_slots(self.__class__) or not hasattr(self, "__dict__"):
+                snapshot = {attribute: getattr(self, attribute) for attribute in _get_attributes(self)}
+            else:
+                snapshot = self.__dict__.copy()
+            object.__setattr__(self, "_packet_snapshot", snapshot)
+        return snapshot
+
+    def _generate_dict(self, values):
         """
         Return packet as a dictionary
+        :param values: snapshot of the packet attributes (see _snapshot)
+        :type values: dict
         :rtype: dict
         """
-        return {attribute: getattr(self, attribute) for attribute in _get_attributes(self)}
+        return values
 
     def dump(self, fp):
         """
@@ -96,10 +175,191 @@ class Packet(with_metaclass(_PacketMetaClass, _Serializable)):
         Raises NotSerializable if the packet is not serializable.
         :rtype: bytes
         """
+        return bytes(self._dump_payload())
+
+    def dumps_into(self, buffer, offset=0):
+        """
+        Serialize packet object into a caller-supplied buffer, starting at
+        offset, and return the number of bytes written. A bytearray is
+        extended if the data does not fit; for any other writable buffer
+        (e.g. a memoryview), ValueError is raised instead.
+        When appending to a bytearray (offset is its length) a packet which
+        is neither compressed nor encrypted is serialized straight into it,
+        without an intermediate buffer (with the binary serializer, which
+        writes bytearrays, nothing is copied at all).
+        Raises NotSerializable if the packet is not serializable.
+        :param buffer: Writable buffer
+        :type buffer: bytearray or memoryview
+        :param offset: Position in buffer to write the data at
+        :type offset: int
+        :return: Bytes written
+        :rtype: int
+        """
+        if offset < 0 or offset > len(buffer):
+            raise ValueError("Offset out of buffer bounds")
+        if isinstance(buffer, bytearray) and offset == len(buffer) and self._packet_metrics_hook is None and \
+                self.compression_threshold is None and self._encrypt.__func__ is Packet._encrypt.__func__:
+            with self._packet_lock:
+                values = self._snapshot()
+            try:
+                self._packet_serializer._dump_append({self.__tag__: self._generate_dict(values)}, buffer)
+            except Exception:
+                # Drop the data written before the error
+                del buffer[offset:]
+                raise
+            return len(buffer) - offset
+
+        payload = self._dump_payload()
+        end = offset + len(payload)
+        if end > len(buffer) and not isinstance(buffer, bytearray):
+            raise ValueError("Buffer too small: {} bytes needed".format(end))
+        buffer[offset:end] = payload
+        return len(payload)
+
+    def _dump_payload(self):
+        """
+        Serialize, compress and encrypt packet object. The result may be a
+        bytearray owned by the caller, so it can be sent or copied without
+        an intermediate bytes object.
+        :rtype: bytes or bytearray
+        """
+        hook = self._packet_metrics_hook
+        if hook is not None:
+            return self._measured_dump_payload(hook)
+        return self._encode_payload(self._serialize())
+
+    def _measured_dump_payload(self, hook):
+        """
+        Same as _dump_payload, reporting the time of each phase to hook.
+        """
+        tag = self.__tag__
+        lock = self._packet_lock
+        start = timer()
+        with lock:
+            locked = timer()
+            values = self._snapshot()
+        snapshot = timer()
+        _data = self._generate_dict(values)
+        generated = timer()
+        data = self._packet_serializer._dump_buffer({tag: _data})
+        serialized = timer()
+        serialized_size = len(data)
+        compressed = None
+        if self.compression_threshold is not None:
+            data = compress(data, self.compression_threshold, self.compression_level, self.compression_dict)
+            compressed = timer()
+        payload = self._encrypt(data)
+        end = timer()
+
+        hook(tag, "lock", locked - start, 0)
+        hook(tag, "snapshot", snapshot - locked, 0)
+        hook(tag, "generate", generated - snapshot, 0)
+        hook(tag, "serialize", serialized - generated, serialized_size)
+        if compressed is not None:
+            hook(tag, "compress", compressed - serialized, len(data))
+        hook(tag, "encrypt", end - (compressed or serialized), len(payload))
+        hook(tag, "dumps", end - start, len(payload))
+        return payload
+
+    def _serialize(self):
+        """
+        Serialize packet object, without compressing or encrypting it.
+        :rtype: bytes or bytearray
+        """
         with self._packet_lock:
-            _data = self._generate_dict()
+            values = self._snapshot()
 
-        return self._packet_serializer.dumps({self.__tag__: _data})
+        # The snapshot is not modified by writers, so it is serialized
+        # without holding the packet lock
+        _data = self._generate_dict(values)
+        return self._packet_serializer._dump_buffer({self.__tag__: _data})
+
+    @classmethod
+    def dumps_many(cls, packets, serializer=None):
+        """
+        Serialize a list of packets (which may be of different classes) into
+        a single payload, so the serializer (and, for SafePacket classes, the
+        encryption) is called only once. The payload can be loaded with
+        loads_many.
+        Raises NotSerializable if any of the packets is not serializable.
+        :param packets: Packets to serialize
+        :type packets: list[Packet]
+        :param serializer: Serializer to use. Defaults to the serializer of
+        the first packet.
+        :type serializer: _Serializer
+        :rtype: bytes
+        """
+        if serializer is None:
+            serializer = packets[0]._packet_serializer if packets else json_serializer
+        items = []
+        for packet in packets:
+            with packet._packet_lock:
+                values = packet._snapshot()
+            items.append({packet.__tag__: packet._generate_dict(values)})
+
+        return cls._encode_payload(serializer.dumps(items))
+
+    @classmethod
+    def train_compression(cls, samples, size=MAX_DICTIONARY_SIZE):
+        """
+        Train a preset compression dictionary from sample packets, and set
+        it as the compression_dict of this class. The dictionary is made of
+        the fragments (tag, attribute names, common values) shared by the
+        serialized samples, so even small packets are compressed well.
+        The receiving side must use the same dictionary, so it is returned
+        to be stored or shared. Compression is enabled by setting
+        compression_threshold.
+        :param samples: Sample packets, typically of this class
+        :type samples: list[Packet]
+        :param size: Maximum dictionary size (up to 32 KiB)
+        :type size: int
+        :return: Dictionary
+        :rtype: bytes
+        """
+        cls.compression_dict = train_dictionary([packet._serialize() for packet in samples], size)
+        return cls.compression_dict
+
+    @classmethod
+    def _encode_payload(cls, data):
+        """
+        Compress (if enabled) and encrypt serialized data.
+        :type data: bytes or bytearray
+        :rtype: bytes or bytearray
+        """
+        if cls.compression_threshold is not None:
+            data = compress(data, cls.compression_threshold, cls.compression_level, cls.compression_dict)
+        return cls._encrypt(data)
+
+    @classmethod
+    def _decode_payload(cls, data):
+        """
+        Decrypt and decompress (if enabled) data.
+        Raises UnknownEncryption or UnknownPacket if not possible.
+        :type data: bytes or memoryview
+        :rtype: bytes or memoryview
+        """
+        data = cls._decrypt(data)
+        if cls.compression_threshold is not None:
+            data = decompress(data, cls.compression_dict)
+        return data
+
+    @classmethod
+    def _encrypt(cls, data):
+        """
+        Encrypt serialized data. Packet data is not encrypted.
+        :type data: bytes
+        :rtype: bytes
+        """
+        return data
+
+    @classmethod
+    def _decrypt(cls, data):
+        """
+        Decrypt serialized data. Packet data is not encrypted.
+        :type data: bytes
+        :rtype: bytes
+        """
+        return data
 
     def _update_dict(self, data):
         """
@@ -111,9 +371,58 @@ class Packet(with_metaclass(_PacketMetaClass, _Serializable)):
             raise InvalidData("Expected dictionary data")
         if set(data) != _get_attributes(self):
             raise InvalidData("Attributes do not match")
-        for k, v in get_items(data):
+        for k, v in self._validate_fields(data):
             object.__setattr__(self, k, v)
 
+    def _validate_fields(self, data):
+        """
+        Check the values of the given data against the field types, for
+        classes declared with fields. Every value is checked before any
+        attribute is updated, so invalid data leaves the packet unchanged.
+        Raises InvalidData if a value is not valid.
+        :param data: new data
+        :type data: dict
+        :return: (attribute, value) pairs
+        """
+        fields = self._packet_field_map
+        if fields is None:
+            return get_items(data)
+        items = []
+        try:
+            for k, v in get_items(data):
+                field = fields[k]
+                if v.__class__ is not field.type:
+                    v = field.validate(v)
+                items.append((k, v))
+        except TypeError as e:
+            raise InvalidData(e)
+        return items
+
+    def _load_dict(self, data):
+        """
+        Update packet with the given deserialized data, which must be a
+        dictionary with the packet tag as key.
+        :param data: deserialized data
+        """
+        with self._packet_lock:
+            self._load_dict_locked(data)
+
+    def _load_dict_locked(self, data):
+        """
+        Same as _load_dict, but must be called with the packet lock held.
+        :param data: deserialized data
+        """
+        tag = self.__tag__
+        if not isinstance(data, dict):
+            raise UnknownPacket("Expected dictionary data")
+        if tag not in data:
+            raise InvalidData("Expected data with tag '{}'".format(tag))
+
+        try:
+            self._update_dict(data[tag])
+        finally:
+            object.__setattr__(self, "_packet_snapshot", None)
+
     def load(self, fp):
         """
         Deserialize data from fp (a .read()-supporting file-like object) and
@@ -128,28 +437,197 @@ class Packet(with_metaclass(_PacketMetaClass, _Serializable)):
         """
         Deserialize data and update packet object.
         Raises UnknownPacket or InvalidData if the data is not deserializable.
+        :type data: bytes or str or memoryview
+        """
+        hook = self._packet_metrics_hook
+        if hook is not None:
+            return self._measured_loads(data, hook)
+        data = self._decode_payload(data)
+        try:
+            _data = self._packet_serializer.loads(data)
+        except Exception as e:
+            raise UnknownPacket(e)
+        self._load_dict(_data)
+
+    def _measured_loads(self, data, hook):
+        """
+        Same as loads, reporting the time of each phase to hook.
+        """
+        tag = self.__tag__
+        start = timer()
+        decrypted = self._decrypt(data)
+        end_decrypt = timer()
+        decompressed = decrypted
+        end_decompress = None
+        if self.compression_threshold is not None:
+            decompressed = decompress(decrypted, self.compression_dict)
+            end_decompress = timer()
+        try:
+            _data = self._packet_serializer.loads(decompressed)
+        except Exception as e:
+            raise UnknownPacket(e)
+        parsed = timer()
+        with self._packet_lock:
+            locked = timer()
+            self._load_dict_locked(_data)
+        end = timer()
+
+        hook(tag, "decrypt", end_decrypt - start, len(data))
+        if end_decompress is not None:
+            hook(tag, "decompress", end_decompress - end_decrypt, len(decrypted))
+        hook(tag, "parse", parsed - (end_decompress or end_decrypt), len(decompressed))
+        hook(tag, "lock", locked - parsed, 0)
+        hook(tag, "load", end - locked, 0)
+        hook(tag, "loads", end - start, len(data))
+
+    @classmethod
+    def loads_many(cls, packets, data, serializer=None):
+        """
+        Deserialize a payload created with dumps_many and update each of the
+        given packets, in order.
+        The tags of all the packets are checked before updating any of them,
+        but if the data of a packet is invalid, the previous packets are
+        still updated.
+        Raises UnknownPacket or InvalidData if the data is not deserializable.
+        :param packets: Packets to update
+        :type packets: list[Packet]
+        :param data: Serialized packets
+        :type data: bytes or str
+        :param serializer: Serializer to use. Defaults to the serializer of
+        the first packet.
+        :type serializer: _Serializer
+        """
+        if serializer is None:
+            serializer = packets[0]._packet_serializer if packets else json_serializer
+        data = cls._decode_payload(data)
+        try:
+            items = serializer.loads(data)
+        except Exception as e:
+            raise UnknownPacket(e)
+        if not isinstance(items, list):
+            raise UnknownPacket("Expected list data")
+        if len(items) != len(packets):
+            raise InvalidData("Expected {} packets but got {}".format(len(packets), len(items)))
+        for packet, item in zip(packets, items):
+            if not isinstance(item, dict) or packet.__tag__ not in item:
+                raise InvalidData("Expected data with tag '{}'".format(packet.__tag__))
+
+        for packet, item in zip(packets, items):
+            packet._load_dict(item)
+
+    def enable_delta(self):
+        """
+        Start tracking which attributes change, so only those are serialized
+        by dumps_delta. The first delta contains all the attributes.
+        Attributes modified in place (e.g. list.append) are not detected,
+        and must be marked with mark_dirty.
+        """
+        with self._packet_lock:
+            object.__setattr__(self, "_packet_dirty", set(_get_attributes(self)))
+            object.__setattr__(self, "_packet_baseline", None)
+
+    def mark_dirty(self, *names):
+        """
+        Mark attributes as changed, so they are included in the next delta.
+        Raises AttributeError if an attribute does not exist.
+        :param names: Attribute names
+        """
+        with self._packet_lock:
+            attributes = _get_attributes(self)
+            for name in names:
+                if name not in attributes:
+                    raise AttributeError("'{}' is not an attribute of '{}' packet".format(
+                        name, self.__class__.__name__))
+            if self._packet_dirty is not None:
+                self._packet_dirty.update(names)
+
+    def dumps_delta(self):
+        """
+        Serialize only the attributes which changed since the last
+        dumps_delta (see enable_delta). The result must be loaded with
+        loads_delta.
+        Raises ValueError if delta tracking is not enabled.
+        Raises NotSerializable if the packet is not serializable.
+        :rtype: bytes
+        """
+        with self._packet_lock:
+            dirty = self._packet_dirty
+            if dirty is None:
+                raise ValueError("Delta tracking is not enabled")
+            baseline = advanced = self._packet_baseline
+            object.__setattr__(self, "_packet_dirty", set())
+        try:
+            with self._packet_lock:
+                _data = self._generate_delta(dirty, self._snapshot())
+                advanced = self._packet_baseline
+            return self._encode_payload(self._packet_serializer.dumps({self.__tag__: _data}))
+        except Exception:
+            # Nothing was serialized, so the changes go in the next delta
+            with self._packet_lock:
+                if self._packet_dirty is not None:
+                    self._packet_dirty.update(dirty)
+                if self._packet_baseline is advanced:
+                    object.__setattr__(self, "_packet_baseline", baseline)
+            raise
+
+    def _generate_delta(self, names, values):
+        """
+        Return the given attributes of the packet as a dictionary
+        :param names: attributes which changed
+        :type names: set
+        :param values: snapshot of the packet attributes (see _snapshot)
+        :type values: dict
+        :rtype: dict
+        """
+        return {attribute: values[attribute] for attribute in names}
+
+    def _update_delta(self, data):
+        """
+        Update some of the packet attributes with the given data.
+        :param data: new data
+        :type data: dict
+        """
+        if not isinstance(data, dict):
+            raise InvalidData("Expected dictionary data")
+        if not _get_attributes(self).issuperset(data):
+            raise InvalidData("Attributes do not match")
+        for k, v in self._validate_fields(data):
+            object.__setattr__(self, k, v)
+
+    def loads_delta(self, data):
+        """
+        Deserialize data created with dumps_delta and update the packet
+        attributes in it.
+        Raises UnknownPacket or InvalidData if the data is not deserializable.
         :type data: bytes or str
         """
+        data = self._decode_payload(data)
+        try:
+            _data = self._packet_serializer.loads(data)
+        except Exception as e:
+            raise UnknownPacket(e)
         with self._packet_lock:
             tag = self.__tag__
-            try:
-                _data = self._packet_serializer.loads(data)
-            except Exception as e:
-                raise UnknownPacket(e)
             if not isinstance(_data, dict):
                 raise UnknownPacket("Expected dictionary data")
             if tag not in _data:
                 raise InvalidData("Expected data with tag '{}'".format(tag))
 
-            self._update_dict(_data[tag])
+            try:
+                self._update_delta(_data[tag])
+            finally:
+                object.__setattr__(self, "_packet_snapshot", None)
 
     def receive_from(self, conn, buffer_size=512):
         """
         Receive data from a connection conn (typically a socket connection)
-        by doing conn.recv(buffer_size) and loads the received data into the
-        packet. If there is an error loading data or no data is obtained,
-        returns False, otherwise returns True.
-        :param conn: Socket connection
+        by reading up to buffer_size bytes from it and loads the received
+        data into the packet. If conn supports recv_into, the data is read
+        into a pooled buffer instead of a new bytes object. If conn is a
+        FrameReader, a whole frame is read from it instead, regardless of
+        how many reads it takes. If there is an error loading data or no
+        data is obtained, returns False, otherwise returns True.
+        :param conn: Socket connection or FrameReader
         :param buffer_size: Socket buffer size
         :type buffer_size: int
         :return: Success
@@ -157,28 +635,84 @@ class Packet(with_metaclass(_PacketMetaClass, _Serializable)):
         """
         if conn is None:
             return False
-        data = conn.recv(buffer_size)
-        if not data:
-            return False
+        if isinstance(conn, FrameReader):
+            try:
+                frame = conn.receive()
+            except InvalidData:
+                return False
+            if frame is None or (frame.tag is not None and frame.tag != self.__tag__):
+                return False
+            return self._receive(frame.body)
+
+        recv_into = getattr(conn, "recv_into", None)
+        if recv_into is None:
+            data = conn.recv(buffer_size)
+            return bool(data) and self._receive(data)
+        # Read into a pooled buffer instead of a new bytes object
+        buffer = default_pool.acquire(buffer_size)
+        try:
+            size = recv_into(buffer, buffer_size)
+            return bool(size) and self._receive(memoryview(buffer)[:size])
+        finally:
+            default_pool.release(buffer)
+
+    def _receive(self, data):
         try:
             self.loads(data)
         except (UnknownPacket, InvalidData):
             return False
         return True
 
-    def send_to(self, conn):
+    def send_to(self, conn, framed=False):
         """
         Send data to a connection conn (typically a socket connection).
         If no connection, returns None, otherwise returns the same as
         conn.send(data).
+        If framed is True, the data is sent as a whole frame (length header
+        and packet tag), to be read on the other end with a FrameReader, and
+        the number of bytes sent is returned.
         :param conn: Socket connection
+        :param framed: Send data as a frame
+        :type framed: bool
         :rtype: int
         :return: Bytes sent
         """
         if conn is None:
             return None
+        if framed:
+            return send_frame(conn, self._dump_payload(), self.__tag__)
         return conn.send(self.dumps())
 
+    def send_async(self, writer, executor=None):
+        """
+        Send packet as a frame to an asyncio.StreamWriter (Python 3.5+).
+        Returns a coroutine, which returns the number of bytes sent.
+        If an executor is given, the packet is dumped there instead of in
+        the event loop.
+        :param writer: Stream writer
+        :type writer: asyncio.StreamWriter
+        :param executor: Executor where to dump the packet
+        :type executor: concurrent.futures.Executor
+        """
+        from packet import aio
+        return aio.send_packet(self, writer, executor)
+
+    def receive_async(self, reader, executor=None):
+        """
+        Receive a frame from an asyncio.StreamReader and load it into the
+        packet (Python 3.5+). Returns a coroutine, which returns False if
+        there is an error loading data or no data is obtained, otherwise
+        returns True.
+        If an executor is given, the data is loaded there instead of in the
+        event loop.
+        :param reader: Stream reader
+        :type reader: asyncio.StreamReader
+        :param executor: Executor where to load the packet
+        :type executor: concurrent.futures.Executor
+        """
+        from packet import aio
+        return aio.receive_packet(self, reader, executor)
+
     def __setattr__(self, name, value):
         """
         Set attribute in a Packet instance.
@@ -186,15 +720,32 @@ class Packet(with_metaclass(_PacketMetaClass, _Serializable)):
         :type name: str
         :param value: value of attribute to set
         """
-        if name in _Serializable.__slots__:
+        if name in _SERIALIZABLE_SLOTS:
             raise AttributeError("'{}' is not a valid attribute name")
-
-        if (self._packet_initialised and name not in _get_attributes(self) and
-                not isinstance(getattr(self.__class__, name, None), property)):
-            raise AttributeError("'{}' is not an attribute of '{}' packet".format(name, self.__class__.__name__))
-
-        with self._packet_lock:
-            object.__setattr__(self, name, value)
+        fields = self._packet_field_map
+        if fields is not None and name in fields:
+            # Raises TypeError if the value is not valid
+            value = fields[name].validate(value)
+
+        if self._packet_initialised:
+            if name in _get_attributes(self):
+                with self._packet_lock:
+                    object.__setattr__(self, name, value)
+                    object.__setattr__(self, "_packet_snapshot", None)
+                    if self._packet_dirty is not None:
+                        self._packet_dirty.add(name)
+            elif isinstance(getattr(self.__class__, name, None), property):
+                with self._packet_lock:
+                    object.__setattr__(self, name, value)
+            else:
+                raise AttributeError("'{}' is not an attribute of '{}' packet".format(name, self.__class__.__name__))
+        else:
+            # Attributes are still being defined, so the cached layout is no longer valid
+            with self._packet_lock:
+                object.__setattr__(self, name, value)
+                object.__setattr__(self, "_packet_snapshot", None)
+                if fields is None:
+                    _invalidate_attributes(self)
 
     def __delattr__(self, item):
         raise AttributeError("Can't delete {}".format(item))
@@ -205,63 +756,39 @@ class InspectedPacket(Packet):
     Inspected packet class
     """
 
-    def _generate_dict(self):
-        return self._packet_serializer.serialize_object(self)
-
-    def _update_dict(self, data):
-        self._packet_serializer.deserialize_object(self, data)
-
-
-def _random_iv():
-    """
-    Generate a random initialization vector (suitable for cryptographic use).
-    :return: iv
-    :rtype: bytes
-    """
-    return os.urandom(16)
-
-
-class _CTRCipher:
-    """
-    Counter (CTR) Cipher mode
-    """
-
-    def __init__(self, key):
-        if isinstance(key, str):
-            key = key.encode()
-        self.__key = hashlib.sha256(key).digest()
-
-    def encrypt(self, raw):
-        return pyaes.AESModeOfOperationCTR(self.__key).encrypt(raw)
-
-    def decrypt(self, enc):
-        return pyaes.AESModeOfOperationCTR(self.__key).decrypt(enc)
+    __slots__ = ()
 
+    def _generate_dict(self, values):
+        return compiler.serialize_object(self._packet_serializer, self, values)
 
-class _CBCCipher:
-    """
-    Cipher Block Chaining (CBC) mode
-    """
+    def _update_dict(self, data):
+        compiler.deserialize_object(self._packet_serializer, self, data)
 
-    def __init__(self, key, block_size=16):
-        if isinstance(key, str):
-            key = key.encode()
-        self.__key = hashlib.sha256(key).digest()
-        self.__block_size = block_size
-
-    def encrypt(self, raw):
-        iv = _random_iv()
-        aes = pyaes.Encrypter(pyaes.AESModeOfOperationCBC(self.__key, iv=iv))
-        data = aes.feed(raw)
-        data += aes.feed()
-        return iv + data
-
-    def decrypt(self, enc):
-        iv = enc[:16]
-        aes = pyaes.Decrypter(pyaes.AESModeOfOperationCBC(self.__key, iv=iv))
-        data = aes.feed(enc[16:])
-        data += aes.feed()
-        return data
+    def _generate_delta(self, names, values):
+        """
+        Besides the attributes which were set, the attributes holding class
+        instances are compared with the previous delta, so changes made to
+        their attributes are also detected.
+        """
+        serializer = self._packet_serializer
+        data = self._generate_dict(values)
+        attributes = data[serializer._class_type]
+        baseline = self._packet_baseline or {}
+        delta = {}
+        for attribute, value in get_items(attributes):
+            if attribute in names:
+                delta[attribute] = value
+            elif serializer._class_type in value:
+                change = serializer.diff_serialized(baseline.get(attribute), value)
+                if change is not None:
+                    delta[attribute] = change
+        object.__setattr__(self, "_packet_baseline", {
+            attribute: copy.deepcopy(value) for attribute, value in get_items(attributes)
+            if serializer._class_type in value})
+        return {serializer._class_type: delta}
+
+    def _update_delta(self, data):
+        self._packet_serializer.deserialize_object(self, data, partial=True)
 
 
 def set_cbc_mode():
@@ -270,6 +797,7 @@ def set_cbc_mode():
     Same as set_packet_encryption_mode(CBC_MODE).
     """
     SafePacket.encryption_mode = CBC_MODE
+    _clear_ciphers()
 
 
 def set_ctr_mode():
@@ -278,6 +806,17 @@ def set_ctr_mode():
     Same as set_packet_encryption_mode(CTR_MODE).
     """
     SafePacket.encryption_mode = CTR_MODE
+    _clear_ciphers()
+
+
+def set_gcm_mode():
+    """
+    Set GCM_MODE as the encryption mode to be used when serializing packets.
+    GCM_MODE authenticates the encrypted data, so tampered data is rejected.
+    Same as set_packet_encryption_mode(GCM_MODE).
+    """
+    SafePacket.encryption_mode = GCM_MODE
+    _clear_ciphers()
 
 
 def set_packet_encryption_key(key):
@@ -290,65 +829,61 @@ def set_packet_encryption_key(key):
     if not isinstance(key, str):
         raise ValueError("Key must be a string")
     SafePacket.encryption_key = key
+    _clear_ciphers()
 
 
 def set_packet_encryption_mode(mode):
     """
     Set encryption mode to be used when serializing packets.
-    Encryption mode must be either CBC_MODE or CTR_MODE.
+    Encryption mode must be either CBC_MODE, CTR_MODE or GCM_MODE.
     :param mode: Encryption mode
     :type mode: int
     """
-    if not isinstance(mode, int) or (mode != CBC_MODE and mode != CTR_MODE):
+    if not isinstance(mode, int) or mode not in (CBC_MODE, CTR_MODE, GCM_MODE):
         raise ValueError("Unknown mode")
     SafePacket.encryption_mode = mode
+    _clear_ciphers()
 
 
 class SafePacket(Packet):
     """
-    General SafePacket class
+    General SafePacket class. Data is encrypted when dumped, and decrypted
+    when loaded, using the specified encryption_key and encryption_mode.
+    Raises UnknownEncryption if not possible to decrypt the data.
     """
 
     encryption_key = ""
     encryption_mode = CTR_MODE
 
-    def dumps(self):
+    __slots__ = ()
+
+    @classmethod
+    def _encrypt(cls, data):
         """
-        Serialize packet object and encrypt it using the specified
-        encryption_key and encryption_mode.
+        Encrypt serialized data using the specified encryption_key and
+        encryption_mode.
+        :type data: bytes
         :rtype: bytes
         """
-        cipher = self.__get_cipher()
-        return cipher.encrypt(super(SafePacket, self).dumps())
+        return _get_cipher(cls.encryption_key, cls.encryption_mode).encrypt(data)
 
-    def loads(self, data):
+    @classmethod
+    def _decrypt(cls, data):
         """
-        Deserialize encrypted data using the specified encryption_key and
-        encryption_mode and update packet object.
+        Decrypt data using the specified encryption_key and encryption_mode.
         Raises UnknownEncryption if not possible to decrypt the data.
-        Raises UnknownPacket or InvalidData if the data is not deserializable.
-        :param data: Encrypted data
         :type data: bytes
+        :rtype: bytes
         """
-        cipher = self.__get_cipher()
         try:
-            decoded = cipher.decrypt(data)
+            return _get_cipher(cls.encryption_key, cls.encryption_mode).decrypt(data)
         except Exception as e:
             raise UnknownEncryption(e)
-        return super(SafePacket, self).loads(decoded)
-
-    def __get_cipher(self):
-        """
-        Get the cipher as specified by encryption_mode.
-        If no cipher is specified, return the default cipher (CTR).
-        :return: cipher
-        """
-        if self.encryption_mode == CBC_MODE:
-            return _CBCCipher(self.encryption_key)
-        return _CTRCipher(self.encryption_key)
 
 
 class InspectedSafePacket(InspectedPacket, SafePacket):
     """
     Inspected and safe packet class
     """
+
+    __slots__ = ()
@@ -0,0 +1,335 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Request/response multiplexing over a single connection (Python 3.2+).
+
+Every request sent through a MultiplexedChannel is a frame stamped with a
+new correlation ID (see packet.framing). The peer sends its response with
+the same correlation ID (see packet.server.Connection.reply), so many
+threads can have requests in flight on the same connection, and responses
+are matched to their requests in whatever order they arrive:
+
+    channel = MultiplexedChannel(socket.create_connection(address))
+    future = channel.request(query, QueryResult)
+    result = future.result(timeout=5)  # or channel.call(query, QueryResult, timeout=5)
+
+Requests return a concurrent.futures.Future, so coroutines can await
+asyncio.wrap_future(channel.request(...)). A ChannelPool spreads requests
+over several channels, opening a new one only when the open ones are busy.
+"""
+
+import itertools
+import logging
+import socket
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from packet.framing import DEFAULT_MAX_FRAME_SIZE, MAX_CORRELATION_ID, Frame, FrameReader, send_frame
+from packet.utils import ChannelClosed, InvalidData, UnknownEncryption, UnknownPacket
+
+logger = logging.getLogger(__name__)
+
+
+class MultiplexedChannel(object):
+    """
+    Client side of request/response exchanges over a connection. Requests
+    may be sent from any thread; responses are read by a background thread,
+    which completes the future of the matching request.
+    """
+
+    def __init__(self, conn, router=None, max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+        """
+        :param conn: Connected socket. The channel takes ownership of it.
+        :type conn: socket.socket
+        :param router: Router where frames without a correlation ID (e.g.
+        notifications from the server) are dispatched
+        :type router: packet.PacketRouter
+        :param max_frame_size: Maximum frame size
+        :type max_frame_size: int
+        """
+        self._conn = conn
+        self._router = router
+        self._reader = FrameReader(conn, max_frame_size=max_frame_size)
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Futures of the requests in flight, and where to load their responses
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._closed = False
+        self._thread = threading.Thread(target=self._receive)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def closed(self):
+        """
+        Whether the channel is closed.
+        :rtype: bool
+        """
+        return self._closed
+
+    @property
+    def pending(self):
+        """
+        Number of requests waiting for a response.
+        :rtype: int
+        """
+        return len(self._pending)
+
+    def request(self, packet, response=None):
+        """
+        Send packet as a request, and return a future of its response.
+        The response is loaded into response (a packet instance, or a
+        packet class to create a new instance for it) and set as the
+        result of the future. If response is None, the result is the
+        response frame. Cancelling the future discards the response.
+        Raises ChannelClosed if the channel is closed. The future raises
+        ChannelClosed if the channel is closed before the response
+        arrives, or UnknownPacket, InvalidData or UnknownEncryption (or any
+        other exception raised by the response packet) if the response
+        can't be loaded.
+        :param packet: Request
+        :type packet: packet.Packet
+        :param response: Packet or packet class where to load the response
+        :return: Future of the response
+        :rtype: concurrent.futures.Future
+        """
+        payload = packet._dump_payload()
+        future = Future()
+        correlation_id = next(self._ids) & MAX_CORRELATION_ID
+        with self._lock:
+            if self._closed:
+                raise ChannelClosed("Channel closed")
+            self._pending[correlation_id] = (future, response)
+        future.add_done_callback(lambda f: f.cancelled() and self._forget(correlation_id))
+        try:
+            with self._send_lock:
+                send_frame(self._conn, payload, packet.__tag__, correlation_id=correlation_id)
+        except socket.error as e:
+            self._close(ChannelClosed(e))
+            raise ChannelClosed(e)
+        return future
+
+    def call(self, packet, response=None, timeout=None):
+        """
+        Send packet as a request and wait for its response (see request).
+        Raises concurrent.futures.TimeoutError if the response does not
+        arrive within timeout seconds.
+        :param packet: Request
+        :type packet: packet.Packet
+        :param response: Packet or packet class where to load the response
+        :param timeout: Maximum time to wait, in seconds
+        :type timeout: float
+        :return: Response
+        """
+        future = self.request(packet, response)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self):
+        """
+        Close the channel and its connection. Requests waiting for a
+        response fail with ChannelClosed.
+        """
+        self._close(ChannelClosed("Channel closed"))
+        try:
+            self._conn.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._conn.close()
+
+    def _forget(self, correlation_id):
+        with self._lock:
+            self._pending.pop(correlation_id, None)
+
+    def _close(self, error):
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    def _receive(self):
+        error = "Connection closed"
+        try:
+            for frame in self._reader:
+                if frame.correlation_id is None:
+                    self._dispatch(frame)
+                    continue
+                with self._lock:
+                    entry = self._pending.pop(frame.correlation_id, None)
+                if entry is not None:
+                    self._complete(frame, *entry)
+        except (socket.error, InvalidData) as e:
+            error = e
+        finally:
+            self._close(ChannelClosed(error))
+
+    def _dispatch(self, frame):
+        if self._router is not None:
+            try:
+                self._router.dispatch(frame)
+            except (UnknownPacket, InvalidData, UnknownEncryption):
+                pass
+            except Exception:
+                # An error of a handler must not stop the responses
+                logger.exception("Error dispatching a %s frame", frame.tag)
+
+    @staticmethod
+    def _complete(frame, future, response):
+        if not future.set_running_or_notify_cancel():
+            return
+        if response is None:
+            # The body is only valid until the next frame is read
+            future.set_result(Frame(frame.tag, frame.flags, bytes(frame.body), frame.correlation_id))
+            return
+        try:
+            if isinstance(response, type):
+                response = response()
+            if frame.tag is not None and frame.tag != response.__tag__:
+                raise InvalidData("Expected response with tag '{}'".format(response.__tag__))
+            response.loads(frame.body)
+        except Exception as e:
+            # The future is running, so it must be completed whatever the error
+            future.set_exception(e)
+        else:
+            future.set_result(response)
+
+
+class ChannelPool(object):
+    """
+    Pool of MultiplexedChannels to the same address. Requests are sent over
+    the channel with the fewest requests in flight. A new channel is only
+    opened when every open channel has max_pending requests in flight, up
+    to size channels.
+    """
+
+    def __init__(self, address, size=4, max_pending=32, timeout=None, router=None,
+                 max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+        """
+        :param address: Address to connect to
+        :type address: tuple
+        :param size: Maximum number of channels
+        :type size: int
+        :param max_pending: Number of requests in flight on every channel
+        above which a new channel is opened
+        :type max_pending: int
+        :param timeout: Connection timeout, in seconds
+        :type timeout: float
+        :param router: Router where frames without a correlation ID are
+        dispatched
+        :type router: packet.PacketRouter
+        :param max_frame_size: Maximum frame size
+        :type max_frame_size: int
+        """
+        if size < 1:
+            raise ValueError("Invalid pool size")
+        self._address = address
+        self._size = size
+        self._max_pending = max_pending
+        self._timeout = timeout
+        self._router = router
+        self._max_frame_size = max_frame_size
+        self._channels = []
+        # Number of channels being opened
+        self._connecting = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def channels(self):
+        """
+        Open channels.
+        :rtype: list[MultiplexedChannel]
+        """
+        with self._lock:
+            return [channel for channel in self._channels if not channel.closed]
+
+    def request(self, packet, response=None):
+        """
+        Send a request over one of the channels (see
+        MultiplexedChannel.request).
+        :rtype: concurrent.futures.Future
+        """
+        return self._channel().request(packet, response)
+
+    def call(self, packet, response=None, timeout=None):
+        """
+        Send a request over one of the channels and wait for its response
+        (see MultiplexedChannel.call).
+        """
+        return self._channel().call(packet, response, timeout)
+
+    def close(self):
+        """
+        Close all the channels.
+        """
+        with self._lock:
+            self._closed = True
+            channels, self._channels = self._channels, []
+            self._changed.notify_all()
+        for channel in channels:
+            channel.close()
+
+    def _channel(self):
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise ChannelClosed("Pool closed")
+                channels = self._channels = [channel for channel in self._channels if not channel.closed]
+                channel = None
+                for candidate in channels:
+                    if channel is None or candidate.pending < channel.pending:
+                        channel = candidate
+                full = len(channels) + self._connecting >= self._size
+                if channel is not None and (channel.pending < self._max_pending or full):
+                    return channel
+                if not full:
+                    break
+                # Every channel is being opened
+                self._changed.wait()
+            self._connecting += 1
+
+        # Connecting may take long, so other requests are not blocked meanwhile
+        try:
+            channel = self._connect()
+        except Exception:
+            with self._lock:
+                self._connecting -= 1
+                self._changed.notify_all()
+            raise
+        with self._lock:
+            self._connecting -= 1
+            self._changed.notify_all()
+            if not self._closed:
+                self._channels.append(channel)
+                return channel
+        channel.close()
+        raise ChannelClosed("Pool closed")
+
+    def _connect(self):
+        conn = socket.create_connection(self._address, self._timeout)
+        # The timeout only applies to connecting
+        conn.settimeout(None)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return MultiplexedChannel(conn, self._router, self._max_frame_size)
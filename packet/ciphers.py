@@ -0,0 +1,361 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Cipher contexts used by SafePacket.
+
+Ciphers are provided by a backend. If the cryptography package is installed
+it is used as the default backend, otherwise the pure-Python pyaes backend
+is used. Both backends produce the same wire format.
+"""
+
+import binascii
+import hashlib
+import hmac
+import os
+import struct
+import threading
+
+import pyaes
+
+from packet._compat import to_bytes, xor_bytes
+from packet.utils import CTR_MODE, CBC_MODE, GCM_MODE
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    Cipher = None
+
+# Maximum keystream size kept by each CTR cipher context
+_MAX_KEYSTREAM_SIZE = 64 * 1024
+# Maximum number of cached cipher contexts
+_MAX_CIPHERS = 32
+
+# Initial counter block used by CTR mode (same as pyaes.Counter())
+_CTR_INITIAL_COUNTER = b"\x00" * 15 + b"\x01"
+
+_BLOCK_SIZE = 16
+_GCM_NONCE_SIZE = 12
+_GCM_TAG_SIZE = 16
+# GCM reduction polynomial (bit-reflected)
+_GCM_R = 0xE1 << 120
+
+
+def _random_iv(size=16):
+    """
+    Generate a random initialization vector (suitable for cryptographic use).
+    :return: iv
+    :rtype: bytes
+    """
+    return os.urandom(size)
+
+
+def _derive_key(key):
+    """
+    Derive the AES key from the encryption key.
+    :param key: Encryption key
+    :type key: str or bytes
+    :rtype: bytes
+    """
+    if isinstance(key, str):
+        key = key.encode()
+    return hashlib.sha256(key).digest()
+
+
+def _bytes_to_int(data):
+    return int(binascii.hexlify(data), 16) if data else 0
+
+
+def _int_to_block(value):
+    return binascii.unhexlify("{:032x}".format(value))
+
+
+class _CTRCipher:
+    """
+    Counter (CTR) Cipher mode
+    Every message is encrypted starting from the same counter (1), so the
+    keystream is the same for every message and is generated only once.
+    """
+
+    def __init__(self, key):
+        self.__aes = pyaes.AES(_derive_key(key))
+        self.__keystream = b""
+        self.__lock = threading.Lock()
+
+    def __generate_keystream(self, start_block, blocks):
+        counter = pyaes.Counter(initial_value=start_block + 1)
+        keystream = bytearray()
+        for _ in range(blocks):
+            keystream.extend(self.__aes.encrypt(counter.value))
+            counter.increment()
+        return bytes(keystream)
+
+    def __get_keystream(self, size):
+        keystream = self.__keystream
+        if size <= len(keystream):
+            return keystream[:size]
+        if size > _MAX_KEYSTREAM_SIZE:
+            keystream = self.__get_keystream(_MAX_KEYSTREAM_SIZE)
+            return keystream + self.__generate_keystream(
+                _MAX_KEYSTREAM_SIZE // 16, (size - _MAX_KEYSTREAM_SIZE + 15) // 16)[:size - _MAX_KEYSTREAM_SIZE]
+        with self.__lock:
+            keystream = self.__keystream
+            if size > len(keystream):
+                # Grow the keystream geometrically, so it is extended only a few times
+                new_size = min(max(size, 2 * len(keystream), 1024), _MAX_KEYSTREAM_SIZE)
+                keystream += self.__generate_keystream(len(keystream) // 16, (new_size - len(keystream) + 15) // 16)
+                self.__keystream = keystream
+        return keystream[:size]
+
+    def encrypt(self, raw):
+        return xor_bytes(raw, self.__get_keystream(len(raw)))
+
+    def decrypt(self, enc):
+        return self.encrypt(enc)
+
+
+class _CBCCipher:
+    """
+    Cipher Block Chaining (CBC) mode
+    """
+
+    def __init__(self, key, block_size=_BLOCK_SIZE):
+        self.__aes = pyaes.AES(_derive_key(key))
+        self.__block_size = block_size
+
+    def encrypt(self, raw):
+        iv = _random_iv()
+        pad = self.__block_size - len(raw) % self.__block_size
+        raw = bytearray(raw)
+        raw.extend(bytearray((pad,)) * pad)
+        data = bytearray(iv)
+        last_block = data
+        for i in range(0, len(raw), self.__block_size):
+            last_block = self.__aes.encrypt([p ^ l for p, l in zip(raw[i:i + self.__block_size], last_block)])
+            data.extend(last_block)
+        return bytes(data)
+
+    def decrypt(self, enc):
+        enc = bytearray(enc)
+        if len(enc) <= self.__block_size or len(enc) % self.__block_size != 0:
+            raise ValueError("invalid length")
+        data = bytearray()
+        for i in range(self.__block_size, len(enc), self.__block_size):
+            block = enc[i:i + self.__block_size]
+            data.extend(p ^ l for p, l in zip(self.__aes.decrypt(block), enc[i - self.__block_size:i]))
+        pad = data[-1]
+        if not 0 < pad <= self.__block_size:
+            raise ValueError("invalid padding byte")
+        return bytes(data[:-pad])
+
+
+class _GHash:
+    """
+    GHASH function of GCM mode, using 4-bit tables of multiples of H.
+    """
+
+    def __init__(self, h):
+        # basis[i] is H multiplied by the i-th bit (most significant first)
+        basis = []
+        for _ in range(128):
+            basis.append(h)
+            h = (h >> 1) ^ _GCM_R if h & 1 else h >> 1
+        self.__tables = []
+        for i in range(0, 128, 4):
+            table = []
+            for nibble in range(16):
+                value = 0
+                for bit in range(4):
+                    if nibble & (8 >> bit):
+                        value ^= basis[i + bit]
+                table.append(value)
+            self.__tables.append(table)
+
+    def __multiply(self, x):
+        value = 0
+        shift = 124
+        for table in self.__tables:
+            value ^= table[(x >> shift) & 0xf]
+            shift -= 4
+        return value
+
+    def digest(self, data):
+        value = 0
+        for i in range(0, len(data), _BLOCK_SIZE):
+            block = data[i:i + _BLOCK_SIZE]
+            value = self.__multiply(value ^ (_bytes_to_int(block) << (8 * (_BLOCK_SIZE - len(block)))))
+        # Lengths block (no additional authenticated data)
+        return self.__multiply(value ^ (len(data) * 8))
+
+
+class _GCMCipher:
+    """
+    Galois/Counter Mode (GCM), an AEAD mode: the message is encrypted and
+    authenticated at once. The output is nonce + ciphertext + tag.
+    """
+
+    def __init__(self, key):
+        self.__aes = pyaes.AES(_derive_key(key))
+        self.__ghash = _GHash(_bytes_to_int(bytes(bytearray(self.__aes.encrypt([0] * _BLOCK_SIZE)))))
+
+    def __crypt(self, nonce, data):
+        keystream = bytearray()
+        for counter in range(2, (len(data) + _BLOCK_SIZE - 1) // _BLOCK_SIZE + 2):
+            keystream.extend(self.__aes.encrypt(bytearray(nonce + struct.pack(">I", counter & 0xffffffff))))
+        return xor_bytes(data, bytes(keystream[:len(data)]))
+
+    def __tag(self, nonce, enc):
+        mask = _bytes_to_int(bytes(bytearray(self.__aes.encrypt(bytearray(nonce + b"\x00\x00\x00\x01")))))
+        return _int_to_block(self.__ghash.digest(enc) ^ mask)
+
+    def encrypt(self, raw):
+        nonce = _random_iv(_GCM_NONCE_SIZE)
+        enc = self.__crypt(nonce, raw)
+        return nonce + enc + self.__tag(nonce, enc)
+
+    def decrypt(self, enc):
+        enc = to_bytes(enc)
+        if len(enc) < _GCM_NONCE_SIZE + _GCM_TAG_SIZE:
+            raise ValueError("invalid length")
+        nonce, data, tag = enc[:_GCM_NONCE_SIZE], enc[_GCM_NONCE_SIZE:-_GCM_TAG_SIZE], enc[-_GCM_TAG_SIZE:]
+        if not hmac.compare_digest(self.__tag(nonce, data), tag):
+            raise ValueError("authentication failed")
+        return self.__crypt(nonce, data)
+
+
+class _CryptographyCTRCipher:
+    """
+    Counter (CTR) Cipher mode, using the cryptography package
+    """
+
+    def __init__(self, key):
+        self.__cipher = Cipher(algorithms.AES(_derive_key(key)), modes.CTR(_CTR_INITIAL_COUNTER),
+                               backend=default_backend())
+
+    def encrypt(self, raw):
+        encryptor = self.__cipher.encryptor()
+        return encryptor.update(raw) + encryptor.finalize()
+
+    def decrypt(self, enc):
+        return self.encrypt(enc)
+
+
+class _CryptographyCBCCipher:
+    """
+    Cipher Block Chaining (CBC) mode, using the cryptography package
+    """
+
+    def __init__(self, key):
+        self.__key = _derive_key(key)
+
+    def __cipher(self, iv):
+        return Cipher(algorithms.AES(self.__key), modes.CBC(iv), backend=default_backend())
+
+    def encrypt(self, raw):
+        iv = _random_iv()
+        padder = padding.PKCS7(_BLOCK_SIZE * 8).padder()
+        encryptor = self.__cipher(iv).encryptor()
+        return iv + encryptor.update(padder.update(raw) + padder.finalize()) + encryptor.finalize()
+
+    def decrypt(self, enc):
+        if len(enc) <= _BLOCK_SIZE or len(enc) % _BLOCK_SIZE != 0:
+            raise ValueError("invalid length")
+        decryptor = self.__cipher(to_bytes(enc[:_BLOCK_SIZE])).decryptor()
+        unpadder = padding.PKCS7(_BLOCK_SIZE * 8).unpadder()
+        data = decryptor.update(enc[_BLOCK_SIZE:]) + decryptor.finalize()
+        return unpadder.update(data) + unpadder.finalize()
+
+
+class _CryptographyGCMCipher:
+    """
+    Galois/Counter Mode (GCM), using the cryptography package
+    """
+
+    def __init__(self, key):
+        self.__aead = AESGCM(_derive_key(key))
+
+    def encrypt(self, raw):
+        nonce = _random_iv(_GCM_NONCE_SIZE)
+        return nonce + self.__aead.encrypt(nonce, raw, None)
+
+    def decrypt(self, enc):
+        if len(enc) < _GCM_NONCE_SIZE + _GCM_TAG_SIZE:
+            raise ValueError("invalid length")
+        return self.__aead.decrypt(to_bytes(enc[:_GCM_NONCE_SIZE]), enc[_GCM_NONCE_SIZE:], None)
+
+
+# Cipher classes for each mode, per backend
+_BACKENDS = {
+    "pyaes": {
+        CTR_MODE: _CTRCipher,
+        CBC_MODE: _CBCCipher,
+        GCM_MODE: _GCMCipher,
+    },
+}
+
+if Cipher is not None:
+    _BACKENDS["cryptography"] = {
+        CTR_MODE: _CryptographyCTRCipher,
+        CBC_MODE: _CryptographyCBCCipher,
+        GCM_MODE: _CryptographyGCMCipher,
+    }
+    _backend = "cryptography"
+else:
+    _backend = "pyaes"
+
+_ciphers = {}
+_ciphers_lock = threading.Lock()
+
+
+def get_cipher_backend():
+    """
+    Get the name of the cipher backend in use.
+    :rtype: str
+    """
+    return _backend
+
+
+def set_cipher_backend(name):
+    """
+    Set the cipher backend to use. Backend must be either "pyaes" or
+    "cryptography" (if the cryptography package is installed).
+    :param name: Backend name
+    :type name: str
+    """
+    global _backend
+    if name not in _BACKENDS:
+        raise ValueError("Unknown or unavailable backend")
+    _backend = name
+    _clear_ciphers()
+
+
+def _get_cipher(key, mode):
+    """
+    Get the cipher context for the given key and mode. Contexts (derived key,
+    expanded round keys and keystream) are cached.
+    If no valid mode is specified, return the default cipher (CTR).
+    :param key: Encryption key
+    :param mode: Encryption mode
+    :return: cipher
+    """
+    if mode != CBC_MODE and mode != GCM_MODE:
+        mode = CTR_MODE
+    cipher = _ciphers.get((key, mode))
+    if cipher is None:
+        cipher = _BACKENDS[_backend][mode](key)
+        with _ciphers_lock:
+            if len(_ciphers) >= _MAX_CIPHERS:
+                _ciphers.clear()
+            _ciphers[(key, mode)] = cipher
+    return cipher
+
+
+def _clear_ciphers():
+    """
+    Clear the cipher contexts cache.
+    """
+    with _ciphers_lock:
+        _ciphers.clear()
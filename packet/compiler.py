@@ -0,0 +1,331 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Compiled (code-generated) encoders/decoders for InspectedPacket trees.
+
+The shape of a packet (the class of each value in the object tree) is
+inspected once, at first use, and a specialized encode and decode routine
+is generated from it. Each compiled routine checks, while it runs, that the
+object still has the shape it was compiled for. If it does not, the
+generic _Serializer path is used instead and the routine is compiled again
+from the new shape on the next call.
+"""
+
+import keyword
+import re
+import threading
+
+from packet.serializers import _Serializable, _can_be_reduced, _get_attributes, _get_class_slots, \
+    _get_reduced, _is_instance_of_class, _obj_from_reduce
+from packet.utils import InvalidData
+
+# Number of times a codec is compiled again, for a given class and serializer,
+# before giving up and using the generic path only
+_MAX_RECOMPILES = 8
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_MISSING = object()
+
+
+class _ShapeMismatch(Exception):
+    """
+    The object no longer has the shape the codec was compiled for.
+    """
+
+
+class _DataMismatch(Exception):
+    """
+    The data does not have the expected shape. The generic path takes care
+    of validating it and raising the appropriate error.
+    """
+
+
+class _CodeGenerator(object):
+    def __init__(self, serializer):
+        self._serializer = serializer
+        self._lines = []
+        self._namespace = {
+            "_ShapeMismatch": _ShapeMismatch,
+            "_DataMismatch": _DataMismatch,
+            "InvalidData": InvalidData,
+            "_MISSING": _MISSING,
+            "_get_attributes": _get_attributes,
+            "_get_reduced": _get_reduced,
+            "_obj_from_reduce": _obj_from_reduce,
+            "_object_setattr": object.__setattr__,
+            "_setattr": setattr,
+        }
+        self._constants = {}
+        self._counter = 0
+
+    def _new_name(self, prefix):
+        self._counter += 1
+        return "{}{}".format(prefix, self._counter)
+
+    def _constant(self, value):
+        key = id(value)
+        if key not in self._constants:
+            name = self._new_name("_c")
+            self._namespace[name] = value
+            # Keep a reference to value so its id is not reused
+            self._constants[key] = (name, value)
+        return self._constants[key][0]
+
+    def _emit(self, line, indent=1):
+        self._lines.append("    " * indent + line)
+
+    def _kind(self, obj):
+        if self._serializer._is_serializable(obj):
+            return self._serializer._simple_type
+        elif _is_instance_of_class(obj):
+            return self._serializer._class_type
+        elif _can_be_reduced(obj):
+            return self._serializer._reduce_type
+        raise TypeError("Attribute type not supported: '{}'".format(obj.__class__.__name__))
+
+    @staticmethod
+    def _get_attribute_expression(var, attribute):
+        if _IDENTIFIER.match(attribute) and not keyword.iskeyword(attribute):
+            return "{}.{}".format(var, attribute)
+        return "getattr({}, {!r})".format(var, attribute)
+
+    def _emit_guard(self, obj, var, field=None):
+        """
+        Emit the checks which make sure the object referenced by var has
+        the same class and attributes as obj. For attributes declared as
+        fields of a simple type, the value may be of that type (or None, if
+        the field allows it) whatever the class of obj.
+        """
+        if field is not None:
+            classes = frozenset((field.type, type(None)) if field.nullable else (field.type,))
+            self._emit("if {}.__class__ not in {}:".format(var, self._constant(classes)))
+            self._emit("raise _ShapeMismatch", 2)
+            return None
+        cls = obj.__class__
+        self._emit("if {}.__class__ is not {}:".format(var, self._constant(cls)))
+        self._emit("raise _ShapeMismatch", 2)
+        if self._kind(obj) != self._serializer._class_type:
+            return None
+
+        attributes = frozenset(_get_attributes(obj))
+        attributes_name = self._constant(attributes)
+        if isinstance(obj, _Serializable) or _get_class_slots(cls) or not hasattr(obj, "__dict__"):
+            attributes_var = self._new_name("a")
+            self._emit("{} = _get_attributes({})".format(attributes_var, var))
+            self._emit("if {0} is not {1} and {0} != {1}:".format(attributes_var, attributes_name))
+        else:
+            self._emit("if len({0}.__dict__) != {1} or not {2}.issuperset({0}.__dict__):".format(
+                var, len(attributes), attributes_name))
+        self._emit("raise _ShapeMismatch", 2)
+        return sorted(attributes)
+
+    def _generate_encoder(self, obj, var, values_var=None, field=None):
+        """
+        Emit the code that encodes the object referenced by var and return
+        the expression with the encoded value. If values_var is given, the
+        attributes of the object are read from that dictionary instead.
+        """
+        if values_var is None:
+            attributes = self._emit_guard(obj, var, field)
+        else:
+            attributes = sorted(_get_attributes(obj))
+            self._emit("if {}.__class__ is not {}:".format(var, self._constant(obj.__class__)))
+            self._emit("raise _ShapeMismatch", 2)
+            self._emit("if len({0}) != {1} or not {2}.issuperset({0}):".format(
+                values_var, len(attributes), self._constant(frozenset(attributes))))
+            self._emit("raise _ShapeMismatch", 2)
+        kind = self._kind(obj)
+        if kind == self._serializer._simple_type:
+            return "{{{}: {}}}".format(kind, var)
+        elif kind == self._serializer._class_type:
+            items = []
+            for attribute in attributes:
+                attribute_var = self._new_name("v")
+                if values_var is None:
+                    self._emit("{} = {}".format(attribute_var, self._get_attribute_expression(var, attribute)))
+                else:
+                    self._emit("{} = {}[{!r}]".format(attribute_var, values_var, attribute))
+                value = self._generate_encoder(getattr(obj, attribute), attribute_var,
+                                               field=self._serializer._simple_field(obj, attribute))
+                items.append("{!r}: {}".format(attribute, value))
+            return "{{{}: {{{}}}}}".format(kind, ", ".join(items))
+        return "{{{}: _get_reduced({})[1:]}}".format(kind, var)
+
+    def _accepted_types(self, expected):
+        accepted = set()
+        for data_type in self._serializer._allowed_types:
+            try:
+                self._serializer.verify_data_types(expected, data_type)
+            except InvalidData:
+                continue
+            accepted.add(data_type)
+        return frozenset(accepted)
+
+    def _generate_stager(self, obj, var, data_var, field=None):
+        """
+        Emit the code that validates the data referenced by data_var against
+        the object referenced by var (or against the declared type of
+        field), and stages the resulting attribute assignments in _ops.
+        Returns the expression with the new value.
+        """
+        attributes = self._emit_guard(obj, var, field)
+        kind = self._kind(obj)
+        serialized_var = self._new_name("s")
+        self._emit("if {0}.__class__ is not dict or len({0}) != 1:".format(data_var))
+        self._emit("raise _DataMismatch", 2)
+        self._emit("{} = {}.get({}, _MISSING)".format(serialized_var, data_var, kind))
+        self._emit("if {} is _MISSING:".format(serialized_var))
+        self._emit("raise _DataMismatch", 2)
+
+        if field is not None:
+            accepted = self._accepted_types(field.type.__name__)
+            if field.nullable:
+                accepted |= {"NoneType"}
+            self._emit("if {}.__class__.__name__ not in {}:".format(serialized_var, self._constant(accepted)))
+            self._emit("raise _DataMismatch", 2)
+            value_var = self._new_name("x")
+            if field.nullable:
+                self._emit("{0} = None if {1} is None else {2}({1})".format(
+                    value_var, serialized_var, self._constant(field.type)))
+            else:
+                self._emit("{} = {}({})".format(value_var, self._constant(field.type), serialized_var))
+            return value_var
+
+        if kind == self._serializer._simple_type:
+            cls = obj.__class__
+            self._emit("if {}.__class__.__name__ not in {}:".format(
+                serialized_var, self._constant(self._accepted_types(cls.__name__))))
+            self._emit("raise _DataMismatch", 2)
+            if obj is None:
+                return "None"
+            value_var = self._new_name("x")
+            self._emit("{} = {}({})".format(value_var, self._constant(cls), serialized_var))
+            return value_var
+
+        elif kind == self._serializer._class_type:
+            self._emit("if {0}.__class__ is not dict or len({0}) != {1} or not {2}.issuperset({0}):".format(
+                serialized_var, len(attributes), self._constant(frozenset(attributes))))
+            self._emit("raise _DataMismatch", 2)
+            setter = "_object_setattr" if isinstance(obj, _Serializable) else "_setattr"
+            for attribute in attributes:
+                attribute_var = self._new_name("v")
+                attribute_data_var = self._new_name("d")
+                self._emit("{} = {}".format(attribute_var, self._get_attribute_expression(var, attribute)))
+                self._emit("{} = {}[{!r}]".format(attribute_data_var, serialized_var, attribute))
+                value = self._generate_stager(getattr(obj, attribute), attribute_var, attribute_data_var,
+                                              self._serializer._simple_field(obj, attribute))
+                self._emit("_ops.append(({}, {}, {!r}, {}))".format(setter, var, attribute, value))
+            return var
+
+        value_var = self._new_name("x")
+        self._emit("if not isinstance({}, (list, tuple)):".format(serialized_var))
+        self._emit("raise _DataMismatch", 2)
+        self._emit("try:")
+        self._emit("{} = _obj_from_reduce({}, *{})".format(
+            value_var, self._constant(obj.__class__), serialized_var), 2)
+        self._emit("except Exception as e:")
+        self._emit("raise InvalidData(e)", 2)
+        return value_var
+
+    def _build(self, name, arguments, return_expression):
+        self._emit("return {}".format(return_expression))
+        source = "def {}({}):\n{}\n".format(name, arguments, "\n".join(self._lines))
+        exec(compile(source, "<packet codec {}>".format(name), "exec"), self._namespace)
+        self._lines = []
+        return self._namespace[name]
+
+    def encoder(self, obj):
+        return self._build("encode", "obj, values", self._generate_encoder(obj, "obj", "values"))
+
+    def stager(self, obj):
+        return self._build("stage", "obj, data, _ops", self._generate_stager(obj, "obj", "data"))
+
+
+class _CompiledCodec(object):
+    """
+    Specialized encoder/decoder for objects with a given shape.
+    """
+
+    def __init__(self, serializer, obj):
+        generator = _CodeGenerator(serializer)
+        self.encode = generator.encoder(obj)
+        self.stage = generator.stager(obj)
+
+    def decode(self, obj, data):
+        ops = []
+        self.stage(obj, data, ops)
+        for setter, target, attribute, value in ops:
+            setter(target, attribute, value)
+
+
+class _CodecCache(object):
+    def __init__(self):
+        self._codecs = {}
+        self._compilations = {}
+        self._lock = threading.Lock()
+
+    def get(self, serializer, obj):
+        key = (obj.__class__, serializer)
+        codec = self._codecs.get(key, _MISSING)
+        if codec is _MISSING:
+            with self._lock:
+                codec = self._codecs.get(key, _MISSING)
+                if codec is _MISSING:
+                    codec = self._compile(key, serializer, obj)
+        return codec
+
+    def _compile(self, key, serializer, obj):
+        count = self._compilations.get(key, 0)
+        if count >= _MAX_RECOMPILES:
+            codec = None
+        else:
+            self._compilations[key] = count + 1
+            try:
+                codec = _CompiledCodec(serializer, obj)
+            except Exception:
+                # Not compilable (e.g. unsupported types); use the generic path for now
+                return None
+        self._codecs[key] = codec
+        return codec
+
+    def invalidate(self, serializer, obj):
+        self._codecs.pop((obj.__class__, serializer), None)
+
+
+_codecs = _CodecCache()
+
+
+def serialize_object(serializer, obj, values=None):
+    """
+    Serialize obj with serializer, using a compiled codec when possible.
+    If values (a dictionary with the attributes of obj) is given, the
+    attributes are read from it instead of from obj.
+    Same as serializer.serialize_object(obj, values).
+    """
+    codec = _codecs.get(serializer, obj)
+    if codec is not None:
+        if values is None:
+            values = {attribute: getattr(obj, attribute) for attribute in _get_attributes(obj)}
+        try:
+            return codec.encode(obj, values)
+        except _ShapeMismatch:
+            _codecs.invalidate(serializer, obj)
+    return serializer.serialize_object(obj, values)
+
+
+def deserialize_object(serializer, obj, data):
+    """
+    Validate data and deserialize it into obj with serializer, using a
+    compiled codec when possible. Same as
+    serializer.deserialize_object(obj, data).
+    """
+    codec = _codecs.get(serializer, obj)
+    if codec is not None:
+        try:
+            return codec.decode(obj, data)
+        except _ShapeMismatch:
+            _codecs.invalidate(serializer, obj)
+        except _DataMismatch:
+            pass
+    serializer.deserialize_object(obj, data)
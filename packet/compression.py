@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Compression stage used by Packet between serialization and encryption.
+
+Compressed payloads start with a 1 byte stage header, telling whether the
+rest of the payload is the serialized data as is, or deflated with zlib
+(raw deflate, optionally with a preset dictionary). Data smaller than the
+compression threshold, or which does not shrink, is sent as is.
+
+Preset dictionaries require Python 3.3+.
+"""
+
+import zlib
+
+from packet._compat import PY2, to_bytes
+from packet.utils import UnknownPacket
+
+_STORED = b"\x00"
+_DEFLATED = b"\x01"
+
+# Raw deflate (no zlib header and checksum, the payload is small and is
+# authenticated by the cipher if needed) with the largest window
+_WBITS = -15
+# Largest dictionary zlib can use (the window size)
+MAX_DICTIONARY_SIZE = 32 * 1024
+# Maximum size of decompressed data, so a small payload can not expand
+# into an unbounded amount of memory
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+# Size of the substrings compared between samples to train a dictionary
+_SEGMENT_SIZE = 6
+
+
+def compress(data, threshold, level=6, dictionary=None):
+    """
+    Add the stage header to data, compressing it if it is at least
+    threshold bytes long and gets smaller.
+    :param data: Serialized data
+    :type data: bytes or bytearray
+    :param threshold: Minimum size of the data to compress
+    :type threshold: int
+    :param level: zlib compression level (0-9)
+    :type level: int
+    :param dictionary: Preset dictionary
+    :type dictionary: bytes
+    :rtype: bytes
+    """
+    _check_dictionary(dictionary)
+    if len(data) >= threshold:
+        if dictionary:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS, 9, zlib.Z_DEFAULT_STRATEGY, dictionary)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS)
+        # Python 2 zlib only compresses strings
+        compressed = compressor.compress(to_bytes(data) if PY2 else data) + compressor.flush()
+        if len(compressed) < len(data):
+            return _DEFLATED + compressed
+    return _STORED + data
+
+
+def decompress(data, dictionary=None):
+    """
+    Remove the stage header from data, decompressing it if needed.
+    Raises UnknownPacket if data is not valid.
+    :param data: Data created with compress
+    :type data: bytes or bytearray or memoryview
+    :param dictionary: Preset dictionary used to compress the data
+    :type dictionary: bytes
+    :rtype: bytes or memoryview
+    """
+    stage = data[:1]
+    if stage == _STORED:
+        return data[1:]
+    if stage != _DEFLATED:
+        raise UnknownPacket("Unknown compression stage")
+    _check_dictionary(dictionary)
+    if PY2:
+        return _decompress_py2(data)
+    try:
+        if dictionary:
+            decompressor = zlib.decompressobj(_WBITS, dictionary)
+        else:
+            decompressor = zlib.decompressobj(_WBITS)
+        result = decompressor.decompress(memoryview(data)[1:], MAX_DECOMPRESSED_SIZE)
+    except zlib.error as e:
+        raise UnknownPacket(e)
+    if decompressor.unconsumed_tail:
+        raise UnknownPacket("Decompressed data too large")
+    if not decompressor.eof or decompressor.unused_data:
+        raise UnknownPacket("Invalid compressed data length")
+    return result
+
+
+def _check_dictionary(dictionary):
+    if dictionary and PY2:
+        raise ValueError("Compression dictionaries require Python 3.3+")
+
+
+def _decompress_py2(data):
+    """
+    Same as decompress, for Python 2, whose zlib can't decompress buffers
+    and does not tell whether the end of the stream was reached. A
+    sentinel byte is appended to the data, which is left unused only if the
+    stream ends right before it.
+    """
+    data = to_bytes(data)
+    decompressor = zlib.decompressobj(_WBITS)
+    try:
+        result = decompressor.decompress(data[1:] + _STORED, MAX_DECOMPRESSED_SIZE)
+    except zlib.error as e:
+        raise UnknownPacket(e)
+    if decompressor.unconsumed_tail:
+        raise UnknownPacket("Decompressed data too large")
+    if decompressor.unused_data != _STORED:
+        raise UnknownPacket("Invalid compressed data length")
+    return result
+
+
+def train_dictionary(samples, size=MAX_DICTIONARY_SIZE):
+    """
+    Build a preset dictionary from samples of serialized data. The
+    dictionary is made of the fragments shared by several samples (tags,
+    attribute names, common values), with the most common ones at the end,
+    where zlib references them with the shortest distances.
+    :param samples: Serialized data
+    :type samples: list[bytes]
+    :param size: Maximum dictionary size
+    :type size: int
+    :rtype: bytes
+    """
+    _check_dictionary(True)
+    size = min(size, MAX_DICTIONARY_SIZE)
+    samples = [bytes(sample) for sample in samples]
+    n = _SEGMENT_SIZE
+
+    # Number of samples each segment appears in
+    segment_counts = {}
+    for sample in samples:
+        for segment in set(sample[i:i + n] for i in range(len(sample) - n + 1)):
+            segment_counts[segment] = segment_counts.get(segment, 0) + 1
+    minimum = 2 if len(samples) > 1 else 1
+
+    # Fragments (runs of bytes covered by shared segments) and the number
+    # of samples they appear in
+    fragment_counts = {}
+    for sample in samples:
+        covered = bytearray(len(sample))
+        for i in range(len(sample) - n + 1):
+            if segment_counts[sample[i:i + n]] >= minimum:
+                covered[i:i + n] = b"\x01" * n
+        fragments = set()
+        start = None
+        for i, flag in enumerate(covered + b"\x00"):
+            if flag and start is None:
+                start = i
+            elif not flag and start is not None:
+                fragments.add(sample[start:i])
+                start = None
+        for fragment in fragments:
+            fragment_counts[fragment] = fragment_counts.get(fragment, 0) + 1
+
+    fragments = sorted(fragment_counts, key=lambda f: (fragment_counts[f], len(f), f))
+    dictionary = b"".join(fragments)
+    return dictionary[-size:] if size else b""
@@ -1,12 +1,13 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
 
+import re
 from ast import Str, Num, Tuple, List, Set, Dict, Name, UnaryOp, UAdd, \
     USub, BinOp, Add, Sub, Call
 # AST necessary imports
-from ast import parse, Expression
+from ast import parse, Expression, literal_eval
 
-from packet._compat import string_types
+from packet._compat import PY3, string_types
 
 try:
     from ast import Constant
@@ -39,6 +40,211 @@ _SAFE_CALLS = {
     "set": set,
 }
 
+# Tokens of the literals accepted by fast_eval. Numbers and names may have a
+# sign attached (as in repr(-1) or repr(complex(1, -2))). Anything else
+# (comments, operators, triple quoted or raw strings, line continuations,
+# ...) is an error token, and makes fast_eval fall back to safe_eval.
+_TOKEN = re.compile(r"""
+    [ \t]*
+    (?:
+        (?P<number>[-+]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?[jJ]?)
+        | (?P<string>[bBuU]?(?:'[^'\\\n\r]*(?:\\.[^'\\\n\r]*)*'|"[^"\\\n\r]*(?:\\.[^"\\\n\r]*)*"))
+        | (?P<name>[-+]?[A-Za-z_][A-Za-z0-9_]*)
+        | (?P<op>[\[\](){},:])
+        | (?P<error>.)
+    )
+""", re.VERBOSE | re.DOTALL)
+
+# Indexes of the _TOKEN groups
+_NUMBER, _STRING, _NAME, _OP = range(1, 5)
+# Maximum nesting of brackets (the Python parser has a similar limit)
+_MAX_DEPTH = 100
+
+_CLOSING = {"[": "]", "(": ")", "{": "}"}
+# Kinds of brace containers, until a comma or a colon is found
+_UNKNOWN, _SET, _DICT = range(3)
+
+
+class _Unsupported(Exception):
+    """
+    The string is not (or may not be) a literal handled by fast_eval.
+    """
+
+
+def _number(text):
+    sign = text[0]
+    if sign == "-" or sign == "+":
+        # Apply the sign afterwards, as Python does (e.g. -0j is not 0-0j)
+        value = _number(text[1:])
+        if sign == "+":
+            return +value
+        if not PY3 and value.__class__ is complex:
+            # Python 2 parses -2j as a single literal, whose real part is 0
+            return complex(value.real, -value.imag)
+        return -value
+    last = text[-1]
+    if last == "j" or last == "J":
+        return complex(text)
+    if "." in text or "e" in text or "E" in text:
+        return float(text)
+    if text[0] == "0" and text.strip("0"):
+        # Leading zeros are not allowed in (non zero) integer literals
+        raise _Unsupported
+    return int(text)
+
+
+def _string(text):
+    quote = text[-1]
+    start = text.index(quote)
+    content = text[start + 1:-1]
+    if PY3 and "\\" not in content:
+        if start and text[0] in "bB":
+            return content.encode("ascii")
+        return content
+    # Escape sequences (and Python 2 strings) are rare, let Python decode them
+    return literal_eval(text)
+
+
+def _parse_literal(string):
+    """
+    Evaluate the literal in string, in a single pass over its tokens.
+    Raises _Unsupported (or any other exception) if the string is not a
+    literal handled here; such strings must be evaluated by safe_eval.
+    """
+    # Python does not allow leading whitespace, line breaks outside brackets
+    # nor null characters, so leave those strings to safe_eval
+    if string[:1] in (" ", "\t") or "\n" in string or "\0" in string:
+        raise _Unsupported
+
+    stack = []
+    values = []
+    opening = None
+    # Whether a value is expected (instead of a separator) and, for brace
+    # containers, whether they are a dict or a set
+    expect_value = True
+    comma = False
+    kind = _UNKNOWN
+    # Name of the safe call whose "(" is expected next
+    call = None
+
+    for match in _TOKEN.finditer(string):
+        token_type = match.lastindex
+        text = match.group(token_type)
+        if call and text != "(":
+            raise _Unsupported
+
+        if token_type == _OP:
+            if text == ",":
+                if expect_value or opening is None:
+                    raise _Unsupported
+                if opening == "{":
+                    if kind == _UNKNOWN:
+                        kind = _SET
+                    elif kind == _DICT and len(values) % 2:
+                        raise _Unsupported
+                expect_value = True
+                comma = True
+            elif text == ":":
+                if expect_value or opening != "{" or kind == _SET or \
+                        (kind == _UNKNOWN and len(values) != 1) or (kind == _DICT and not len(values) % 2):
+                    raise _Unsupported
+                kind = _DICT
+                expect_value = True
+            elif text in _CLOSING:
+                if not expect_value or len(stack) >= _MAX_DEPTH:
+                    raise _Unsupported
+                # The call (if any) is made when its bracket is closed, so the
+                # enclosing container does not expect it anymore
+                stack.append((values, opening, comma, kind, None))
+                values = []
+                opening = call + text if call else text
+                comma = False
+                kind = _UNKNOWN
+                call = None
+            else:
+                if opening is None or text != _CLOSING[opening[-1]]:
+                    raise _Unsupported
+                if opening == "[":
+                    value = values
+                elif opening == "(":
+                    if comma or not values:
+                        value = tuple(values)
+                    else:
+                        value = values[0]
+                elif opening == "{":
+                    if kind == _DICT:
+                        if len(values) % 2:
+                            raise _Unsupported
+                        value = dict(zip(values[::2], values[1::2]))
+                    else:
+                        value = set(values) if values else {}
+                else:
+                    # Closing bracket of a call, e.g. "set("
+                    value = _SAFE_CALLS[opening[:-1]](*values)
+                values, opening, comma, kind, call = stack.pop()
+                values.append(value)
+                expect_value = False
+            continue
+
+        signed = text[0] == "-" or text[0] == "+"
+        if token_type == _NUMBER:
+            if text.isdigit() and (text[0] != "0" or len(text) == 1):
+                value = int(text)
+            else:
+                value = _number(text)
+        elif token_type == _STRING:
+            if PY3 and text[0] in "'\"" and "\\" not in text:
+                value = text[1:-1]
+            else:
+                value = _string(text)
+        elif token_type == _NAME:
+            name = text[1:] if signed else text
+            if name in _SAFE_NAMES:
+                value = _SAFE_NAMES[name]
+                if signed:
+                    if not isinstance(value, _NUM_TYPES):
+                        raise _Unsupported
+                    value = -value if text[0] == "-" else +value
+            elif name in _SAFE_CALLS and not signed and expect_value:
+                call = name
+                continue
+            else:
+                raise _Unsupported
+        else:
+            raise _Unsupported
+
+        if expect_value:
+            values.append(value)
+            expect_value = False
+        elif signed:
+            # A signed number right after a value is an addition or subtraction
+            left = values[-1]
+            if not isinstance(left, _NUM_TYPES) or not isinstance(value, _NUM_TYPES):
+                raise _Unsupported
+            values[-1] = left + value
+        else:
+            raise _Unsupported
+
+    if stack or call or expect_value or len(values) != 1:
+        raise _Unsupported
+    return values[0]
+
+
+def fast_eval(string):
+    """
+    Same as safe_eval(string), but the common literals (as returned by
+    repr) are evaluated by a dedicated parser, without building the AST.
+    Any string the parser does not handle is evaluated by safe_eval.
+
+    :type string: str
+    :param string: expression string
+    :return: evaluated
+    """
+    try:
+        return _parse_literal(string)
+    except Exception:
+        return safe_eval(string)
+
 
 def safe_eval(node_or_string):
     """
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Declarative packet fields.
+
+Packet classes may declare their attributes as typed fields, instead of
+setting them in __init__:
+
+    class Position(Packet):
+        x = Field(float, 0.0)
+        y = Field(float, 0.0)
+        tags = Field(list, factory=list)
+
+Such classes store their fields in __slots__ (so instances have no
+__dict__) and share a pool of locks instead of having one each, so they
+take much less memory. The fields, in declaration order, are known from the
+class, so packets are serialized without looking up their attributes.
+Values set or loaded are checked against the field types.
+
+As packets may share a lock, code running with the lock held (property
+setters, __setattr__ overrides) must not set attributes of, or dump or load,
+another packet declared with fields.
+"""
+
+import itertools
+import keyword
+import re
+from operator import attrgetter
+
+from packet._compat import integer_types, string_types
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_MUTABLE_TYPES = (list, dict, set, bytearray)
+_CONTAINER_TYPES = (list, tuple, set, frozenset)
+
+# Fields are sorted by creation order, as class namespaces are not ordered
+# in Python 2
+_counter = itertools.count()
+
+
+class Field(object):
+    """
+    Declaration of a packet field.
+    """
+
+    def __init__(self, type=None, default=None, factory=None):
+        """
+        :param type: Type of the field values, or None for any type
+        :type type: type
+        :param default: Default value. Mutable defaults (list, dict, ...)
+        are not allowed, use factory instead.
+        :param factory: Callable which returns the default value of every
+        new packet
+        """
+        if isinstance(default, _MUTABLE_TYPES):
+            raise ValueError("Mutable default values are not allowed, use factory instead")
+        if factory is not None and default is not None:
+            raise ValueError("Either default or factory may be given")
+        self.type = type
+        self.default = default
+        self.factory = factory
+        # None is a valid value if it is the default value
+        self.nullable = default is None and factory is None
+        self.name = None
+        self._order = next(_counter)
+
+    def __repr__(self):
+        return "Field({!r}, type={}, default={!r})".format(
+            self.name, getattr(self.type, "__name__", None), self.default)
+
+    def initial(self):
+        """
+        Return the initial value of the field for a new packet.
+        """
+        return self.default if self.factory is None else self.factory()
+
+    def validate(self, value):
+        """
+        Return value, converted to the field type if it is an equivalent
+        value (e.g. an int for a float field, or a list for a tuple field,
+        as not all serializers keep those types). None is valid if it is
+        the default value.
+        Raises TypeError if value is not valid.
+        """
+        cls = self.type
+        if cls is None or value.__class__ is cls or isinstance(value, cls):
+            return value
+        if value is None and self.nullable:
+            return value
+        if cls is float and isinstance(value, integer_types) and not isinstance(value, bool):
+            return float(value)
+        if cls in _CONTAINER_TYPES and isinstance(value, _CONTAINER_TYPES):
+            return cls(value)
+        if issubclass(cls, string_types) and isinstance(value, string_types):
+            return value
+        raise TypeError("Field '{}' must be of type '{}', not '{}'".format(
+            self.name, cls.__name__, value.__class__.__name__))
+
+
+def _fields_snapshot(names):
+    """
+    Return a function which copies the given attributes of an object to a
+    dictionary. The function is generated, so building the dictionary is
+    almost as fast as copying the __dict__ of an object. The dictionary is
+    in field order only where dicts keep their insertion order (3.7+).
+    """
+    if not all(_IDENTIFIER.match(name) and not keyword.iskeyword(name) for name in names):
+        getter = attrgetter(*names) if len(names) > 1 else lambda obj: (getattr(obj, names[0]),)
+        return lambda obj: dict(zip(names, getter(obj)))
+    source = "def snapshot(obj):\n    return {{{}}}\n".format(
+        ", ".join("{!r}: obj.{}".format(name, name) for name in names))
+    namespace = {}
+    exec(compile(source, "<packet fields>", "exec"), namespace)
+    return namespace["snapshot"]
+
+
+def _declare_fields(bases, namespace):
+    """
+    Collect the fields declared in a class namespace and inherited from its
+    bases. The declarations are replaced by the class attributes describing
+    the fields and by __slots__ for the new fields.
+    :return: namespace
+    :rtype: dict
+    """
+    own = sorted((value for value in namespace.values() if isinstance(value, Field)), key=lambda f: f._order)
+    inherited = []
+    for base in bases:
+        for field in getattr(base, "_packet_field_defs", None) or ():
+            if all(field.name != f.name for f in inherited):
+                inherited.append(field)
+    if not own and not inherited:
+        return namespace
+    if own and "__slots__" in namespace:
+        raise TypeError("Packets with fields can't declare __slots__")
+    # Only fields are serialized, so the attributes of a base class which
+    # keeps them in a __dict__ would be silently lost
+    if any("__slots__" not in vars(cls) for base in bases for cls in base.__mro__ if cls is not object):
+        raise TypeError("Packets with fields can't inherit from classes without __slots__")
+
+    namespace = dict(namespace)
+    slots = []
+    fields = list(inherited)
+    for field in own:
+        name = next(name for name, value in namespace.items() if value is field)
+        del namespace[name]
+        field.name = name
+        for i, f in enumerate(fields):
+            if f.name == name:
+                # Redeclared field, its slot is inherited
+                fields[i] = field
+                break
+        else:
+            fields.append(field)
+            slots.append(name)
+
+    names = tuple(field.name for field in fields)
+    if "__slots__" not in namespace:
+        namespace["__slots__"] = tuple(slots)
+    namespace["_packet_field_defs"] = tuple(fields)
+    namespace["_packet_fields"] = names
+    namespace["_packet_field_set"] = frozenset(names)
+    namespace["_packet_field_map"] = {field.name: field for field in fields}
+    namespace["_packet_fields_snapshot"] = staticmethod(_fields_snapshot(names))
+    return namespace
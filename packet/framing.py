@@ -0,0 +1,382 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import struct
+from collections import deque, namedtuple
+
+from packet._compat import PY2, decode_text, release_view, to_bytes
+from packet.utils import InvalidData
+
+# Frame header: body length, flags and tag length (network byte order).
+# It is followed by the tag, the correlation ID (if FLAG_CORRELATION_ID is
+# set) and the body.
+_HEADER = struct.Struct("!IBB")
+_CORRELATION_ID = struct.Struct("!Q")
+
+FRAME_HEADER_SIZE = _HEADER.size
+MAX_TAG_SIZE = 255
+MAX_CORRELATION_ID = 2 ** 64 - 1
+DEFAULT_MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Flag of the frames carrying a correlation ID. The other flags are free
+# for applications to use.
+FLAG_CORRELATION_ID = 0x80
+
+
+class Frame(namedtuple("Frame", ["tag", "flags", "body", "correlation_id"])):
+    """
+    A complete frame, as read from a stream.
+    tag is None if the frame was sent without a tag, and correlation_id is
+    None if it was sent without a correlation ID.
+    """
+    __slots__ = ()
+
+    def __new__(cls, tag, flags, body, correlation_id=None):
+        return super(Frame, cls).__new__(cls, tag, flags, body, correlation_id)
+
+
+def pack_frame(body, tag=None, flags=0, correlation_id=None):
+    """
+    Build a frame with the given body, optional tag, flags and correlation
+    ID.
+    :param body: Frame body
+    :type body: bytes
+    :param tag: Frame tag
+    :type tag: str
+    :param flags: Frame flags (0-255)
+    :type flags: int
+    :param correlation_id: Correlation ID (0 to 2 ** 64 - 1), which
+    matches requests and responses
+    :type correlation_id: int
+    :return: frame
+    :rtype: bytes
+    """
+    return _pack_header(len(body), tag, flags, correlation_id) + body
+
+
+def _decode_tag(data):
+    """
+    Decode the tag of a frame.
+    Raises InvalidData if the tag is not valid UTF-8.
+    :rtype: str
+    """
+    try:
+        return decode_text(data)
+    except UnicodeDecodeError as e:
+        raise InvalidData("Invalid frame tag: {}".format(e))
+
+
+def _pack_header(length, tag=None, flags=0, correlation_id=None):
+    """
+    Build the header (including the tag and correlation ID) of a frame with
+    a body of the given length.
+    :rtype: bytes
+    """
+    tag = b"" if tag is None else tag.encode("utf-8")
+    if len(tag) > MAX_TAG_SIZE:
+        raise ValueError("Tag is too long")
+    if correlation_id is None:
+        if flags & FLAG_CORRELATION_ID:
+            raise ValueError("Correlation ID flag set without a correlation ID")
+        return _HEADER.pack(length, flags, len(tag)) + tag
+    if not 0 <= correlation_id <= MAX_CORRELATION_ID:
+        raise ValueError("Invalid correlation ID")
+    return _HEADER.pack(length, flags | FLAG_CORRELATION_ID, len(tag)) + tag + _CORRELATION_ID.pack(correlation_id)
+
+
+def _correlation_id_size(flags):
+    """
+    Size of the correlation ID of a frame with the given flags.
+    :rtype: int
+    """
+    return _CORRELATION_ID.size if flags & FLAG_CORRELATION_ID else 0
+
+
+def send_all(conn, data):
+    """
+    Send all data to a connection conn, calling conn.send(data) as many
+    times as needed.
+    :param conn: Socket connection
+    :param data: Data to send
+    :type data: bytes
+    :return: Bytes sent
+    :rtype: int
+    """
+    view = memoryview(data)
+    total = len(view)
+    sent = 0
+    while sent < total:
+        sent += conn.send(view[sent:])
+    return sent
+
+
+def send_frame(conn, body, tag=None, flags=0, correlation_id=None):
+    """
+    Send a frame with the given body, optional tag, flags and correlation
+    ID to a connection conn. If conn supports sendmsg (as sockets do on POSIX),
+    the header and the body are sent as separate buffers, so the body is
+    not copied. Otherwise, the frame is sent with send_all.
+    :param conn: Socket connection
+    :param body: Frame body
+    :type body: bytes or bytearray or memoryview
+    :param tag: Frame tag
+    :type tag: str
+    :param flags: Frame flags (0-255)
+    :type flags: int
+    :param correlation_id: Correlation ID
+    :type correlation_id: int
+    :return: Bytes sent
+    :rtype: int
+    """
+    header = _pack_header(len(body), tag, flags, correlation_id)
+    sendmsg = getattr(conn, "sendmsg", None)
+    if sendmsg is None:
+        # Python 2 bytes can't be concatenated with a memoryview
+        return send_all(conn, header + (to_bytes(body) if PY2 else body))
+
+    # Empty buffers are left out, as they would never be dropped
+    buffers = [view for view in (memoryview(header), memoryview(body)) if len(view)]
+    total = sum(len(view) for view in buffers)
+    while buffers:
+        sent = sendmsg(buffers)
+        # Drop the buffers (or the part of them) which were sent
+        while sent and sent >= len(buffers[0]):
+            sent -= len(buffers.pop(0))
+        if sent:
+            buffers[0] = buffers[0][sent:]
+    return total
+
+
+class BufferPool(object):
+    """
+    Pool of reusable receive buffers (bytearrays of buffer_size bytes).
+    Released buffers are kept, up to max_buffers, and handed out again
+    instead of allocating new ones. Buffers taken from a pool must not be
+    resized, as memoryviews of them may still exist.
+    """
+
+    def __init__(self, buffer_size=65536, max_buffers=64):
+        """
+        :param buffer_size: Size of the pooled buffers
+        :type buffer_size: int
+        :param max_buffers: Maximum number of idle buffers kept
+        :type max_buffers: int
+        """
+        self.buffer_size = buffer_size
+        self._max_buffers = max_buffers
+        self._buffers = []
+
+    def acquire(self, size=0):
+        """
+        Return a buffer of at least size bytes, reusing a pooled buffer
+        if size is not larger than buffer_size.
+        :type size: int
+        :rtype: bytearray
+        """
+        if size <= self.buffer_size:
+            try:
+                return self._buffers.pop()
+            except IndexError:
+                size = self.buffer_size
+        return bytearray(size)
+
+    def release(self, buffer):
+        """
+        Return a buffer to the pool. Buffers of a size other than
+        buffer_size are dropped.
+        :type buffer: bytearray
+        """
+        if len(buffer) == self.buffer_size and len(self._buffers) < self._max_buffers:
+            self._buffers.append(buffer)
+
+
+default_pool = BufferPool()
+
+
+class FrameReader(object):
+    """
+    Stateful frame reader. Gathers bytes over several reads and returns
+    whole frames.
+
+    Data may be pushed with feed(data) or, if a connection is given,
+    pulled with receive() (or by iterating the reader).
+
+    Data is gathered in a buffer taken from a BufferPool. Connections are
+    read with recv_into (if supported) straight into that buffer, and
+    receive() returns frames whose body is a memoryview of it, so no data
+    is copied. Such a body is only valid until the next call to receive();
+    use bytes(frame.body) to keep it.
+    """
+
+    def __init__(self, conn=None, buffer_size=4096, max_frame_size=DEFAULT_MAX_FRAME_SIZE, pool=None):
+        """
+        :param conn: Socket connection
+        :param buffer_size: Minimum number of bytes requested per read
+        :type buffer_size: int
+        :param max_frame_size: Maximum frame size
+        :type max_frame_size: int
+        :param pool: Pool where buffers are taken from (defaults to
+        default_pool)
+        :type pool: BufferPool
+        """
+        self._conn = conn
+        self._buffer_size = buffer_size
+        self._max_frame_size = max_frame_size
+        self._pool = default_pool if pool is None else pool
+        self._buffer = None
+        self._view = None
+        # Unparsed data is buffer[_start:_end]
+        self._start = self._end = 0
+        # Number of bytes needed to complete the next frame
+        self._missing = 0
+        self._frames = deque()
+        self._closed = False
+
+    @property
+    def closed(self):
+        """
+        Whether the connection has been closed by the peer.
+        :rtype: bool
+        """
+        return self._closed
+
+    def feed(self, data):
+        """
+        Push data into the reader. The frames are copied out of the
+        reader buffer, so (unlike with receive) they stay valid, and the
+        buffer is returned to the pool once no partial frame is left in it.
+        Raises InvalidData if a frame is larger than max_frame_size, or its
+        tag is not valid (the frame is skipped).
+        :param data: Received data
+        :type data: bytes
+        :return: Number of complete frames available
+        :rtype: int
+        """
+        self._reserve(len(data))
+        end = self._end + len(data)
+        self._view[self._end:end] = data
+        self._end = end
+        frame = self._parse(True)
+        while frame is not None:
+            self._frames.append(frame)
+            frame = self._parse(True)
+        if self._start == self._end:
+            # Nothing left to parse, so the buffer is not kept while idle
+            self._release()
+        return len(self._frames)
+
+    def next_frame(self):
+        """
+        Pop the next complete frame, if any.
+        :return: frame or None
+        :rtype: Frame
+        """
+        if self._frames:
+            return self._frames.popleft()
+        return None
+
+    def receive(self):
+        """
+        Read from the connection until a complete frame is available.
+        Returns None if the connection was closed before a whole frame
+        was received.
+        The body of the returned frame may be a memoryview which is only
+        valid until the next call to receive().
+        :return: frame or None
+        :rtype: Frame
+        """
+        while True:
+            if self._frames:
+                return self._frames.popleft()
+            frame = self._parse(False)
+            if frame is not None:
+                return frame
+            if self._conn is None or self._closed:
+                return None
+            if not self._read():
+                self._closed = True
+                self._release()
+                return None
+
+    def __iter__(self):
+        while True:
+            frame = self.receive()
+            if frame is None:
+                return
+            yield frame
+
+    def _read(self):
+        self._reserve(max(self._buffer_size, self._missing))
+        recv_into = getattr(self._conn, "recv_into", None)
+        if recv_into is not None:
+            size = recv_into(self._view[self._end:])
+        else:
+            data = self._conn.recv(self._buffer_size)
+            size = len(data)
+            self._view[self._end:self._end + size] = data
+        self._end += size
+        return size
+
+    def _reserve(self, size):
+        """
+        Make room for size more bytes after the unparsed data.
+        """
+        buffer = self._buffer
+        if buffer is not None and self._end + size <= len(buffer):
+            return
+        pending = self._end - self._start
+        if buffer is not None and pending + size <= len(buffer) and \
+                (pending or len(buffer) == self._pool.buffer_size):
+            # Move the unparsed data to the start of the buffer
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # Either the buffer is too small, or it was grown for a large
+            # frame and is no longer needed; take one from the pool
+            new = self._pool.acquire(pending + size)
+            if pending:
+                new[:pending] = self._view[self._start:self._end]
+            self._release()
+            self._buffer, self._view = new, memoryview(new)
+        self._start, self._end = 0, pending
+
+    def _release(self):
+        if self._buffer is not None:
+            release_view(self._view)
+            self._pool.release(self._buffer)
+            self._buffer = self._view = None
+            self._start = self._end = 0
+
+    def _parse(self, copy):
+        """
+        Parse the next complete frame from the buffer, if any. The body is
+        a copy if copy is True, otherwise a memoryview of the buffer.
+        :rtype: Frame
+        """
+        start = self._start
+        available = self._end - start
+        if available < FRAME_HEADER_SIZE:
+            self._missing = FRAME_HEADER_SIZE - available
+            return None
+        length, flags, tag_length = _HEADER.unpack_from(self._buffer, start)
+        if length > self._max_frame_size:
+            raise InvalidData("Frame too large ({} bytes)".format(length))
+        tag_end = start + FRAME_HEADER_SIZE + tag_length
+        body_start = tag_end + _correlation_id_size(flags)
+        end = body_start + length
+        if end > self._end:
+            self._missing = end - self._end
+            return None
+
+        view = self._view
+        correlation_id = _CORRELATION_ID.unpack_from(self._buffer, tag_end)[0] if body_start != tag_end else None
+        body = view[body_start:end]
+        if copy:
+            body = body.tobytes()
+        if end == self._end:
+            self._start = self._end = 0
+        else:
+            self._start = end
+        self._missing = 0
+        # The frame is skipped if its tag is not valid
+        tag = _decode_tag(view[start + FRAME_HEADER_SIZE:tag_end]) if tag_length else None
+        return Frame(tag, flags, body, correlation_id)
@@ -0,0 +1,409 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Append-only packet logs, to record packet traffic and replay it.
+
+A log file starts with a magic string, followed by records. Each record is
+a timestamp (seconds since the epoch, as a double) followed by a frame (see
+packet.framing), so it keeps the packet tag, flags and correlation ID:
+
+    timestamp (8) | body length (4) | flags (1) | tag length (1) | tag |
+    correlation ID (8, if flagged) | body
+
+A sidecar index file (the log path with ".idx" appended) holds the offset
+and timestamp of every record, 16 bytes each, so records can be looked up
+by position or by time without reading the log. Readers memory-map both
+files, so logs larger than the available memory can be read and replayed.
+
+If the index is missing records (e.g. the writer was interrupted), readers
+find them by scanning the end of the log, and writers append them to the
+index when the log is opened again.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from packet._compat import PY3, release_view
+from packet.framing import Frame, _CORRELATION_ID, _correlation_id_size, _decode_tag, _pack_header
+from packet.utils import InvalidData
+
+_MAGIC = b"PKTLOG1\n"
+# Record header: timestamp, body length, flags and tag length
+_RECORD = struct.Struct("!dIBB")
+_TIMESTAMP = struct.Struct("!d")
+# Index entry: record offset and timestamp
+_INDEX = struct.Struct("!Qd")
+
+INDEX_SUFFIX = ".idx"
+
+
+class LogRecord(namedtuple("LogRecord", ["timestamp", "frame"])):
+    """
+    A record of a packet log. The body of frame is a memoryview of the
+    memory-mapped log, valid while the reader is open.
+    """
+    __slots__ = ()
+
+
+def _scan_records(data, offset, end):
+    """
+    Iterate over the (offset, timestamp) of the complete records in
+    data[offset:end].
+    """
+    while end - offset >= _RECORD.size:
+        timestamp, length, flags, tag_length = _RECORD.unpack_from(data, offset)
+        record_end = offset + _RECORD.size + tag_length + _correlation_id_size(flags) + length
+        if record_end > end:
+            return
+        yield offset, timestamp
+        offset = record_end
+
+
+def _record_end(data, offset):
+    _, length, flags, tag_length = _RECORD.unpack_from(data, offset)
+    return offset + _RECORD.size + tag_length + _correlation_id_size(flags) + length
+
+
+def _map_file(fp):
+    size = os.fstat(fp.fileno()).st_size
+    if size == 0:
+        return None
+    return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PacketLogWriter(object):
+    """
+    Writer of an append-only packet log. Records are appended to the end
+    of the log, even if it already exists. It is safe to use the same
+    writer from several threads.
+
+        with PacketLogWriter("traffic.log") as log:
+            log.append(packet1)
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Log file path. The index is written to path + ".idx".
+        :type path: str
+        """
+        self._lock = threading.Lock()
+        self._log = open(path, "a+b")
+        self._index = open(path + INDEX_SUFFIX, "a+b")
+        self._last_timestamp = float("-inf")
+        try:
+            self._offset, self._count = self._recover()
+        except Exception:
+            self.close()
+            raise
+
+    def _recover(self):
+        """
+        Check the log, make sure the index has an entry for every complete
+        record (removing any incomplete record at the end of the log) and
+        return the end offset of the log and the number of records.
+        """
+        log = _map_file(self._log)
+        if log is None:
+            self._log.write(_MAGIC)
+            self._log.flush()
+            self._index.truncate(0)
+            return len(_MAGIC), 0
+        try:
+            if log[:len(_MAGIC)] != _MAGIC:
+                raise InvalidData("Not a packet log")
+            size = len(log)
+
+            # Keep the index entries of complete records only
+            index_size = os.fstat(self._index.fileno()).st_size
+            count = index_size // _INDEX.size
+            while count:
+                self._index.seek((count - 1) * _INDEX.size)
+                offset, timestamp = _INDEX.unpack(self._index.read(_INDEX.size))
+                if offset + _RECORD.size <= size and _record_end(log, offset) <= size:
+                    self._last_timestamp = timestamp
+                    offset = _record_end(log, offset)
+                    break
+                count -= 1
+            else:
+                offset = len(_MAGIC)
+            self._index.truncate(count * _INDEX.size)
+
+            # Index the records written after the last indexed one
+            self._index.seek(0, os.SEEK_END)
+            for offset, timestamp in _scan_records(log, offset, size):
+                self._index.write(_INDEX.pack(offset, timestamp))
+                self._last_timestamp = timestamp
+                offset = _record_end(log, offset)
+                count += 1
+            self._index.flush()
+        finally:
+            log.close()
+
+        # Drop an incomplete record, if any
+        self._log.truncate(offset)
+        return offset, count
+
+    def __len__(self):
+        return self._count
+
+    def append(self, packet, timestamp=None):
+        """
+        Append a packet to the log, as sent by send_to(conn, framed=True).
+        Raises NotSerializable if the packet is not serializable.
+        :param packet: Packet to record
+        :type packet: packet.Packet
+        :param timestamp: Record timestamp (defaults to the current time)
+        :type timestamp: float
+        :return: Index of the record
+        :rtype: int
+        """
+        # noinspection PyProtectedMember
+        return self.append_frame(packet._dump_payload(), packet.__tag__, timestamp=timestamp)
+
+    def append_frame(self, body, tag=None, flags=0, timestamp=None, correlation_id=None):
+        """
+        Append a frame to the log.
+        Timestamps must not decrease, so records can be looked up by time.
+        If timestamp is not given, the current time is used (or the last
+        timestamp, if the clock went backwards). Raises ValueError if
+        timestamp is lower than the last timestamp.
+        :param body: Frame body
+        :type body: bytes or bytearray or memoryview
+        :param tag: Frame tag
+        :type tag: str
+        :param flags: Frame flags (0-255)
+        :type flags: int
+        :param timestamp: Record timestamp (defaults to the current time)
+        :type timestamp: float
+        :param correlation_id: Frame correlation ID
+        :type correlation_id: int
+        :return: Index of the record
+        :rtype: int
+        """
+        header = _pack_header(len(body), tag, flags, correlation_id)
+        with self._lock:
+            if timestamp is None:
+                timestamp = max(time.time(), self._last_timestamp)
+            elif timestamp < self._last_timestamp:
+                raise ValueError("Timestamps must not decrease")
+            offset = self._offset
+            self._log.write(_TIMESTAMP.pack(timestamp))
+            self._log.write(header)
+            self._log.write(body)
+            self._index.write(_INDEX.pack(offset, timestamp))
+            self._offset = offset + _TIMESTAMP.size + len(header) + len(body)
+            self._last_timestamp = timestamp
+            self._count += 1
+            return self._count - 1
+
+    def flush(self, sync=False):
+        """
+        Flush the written records, so they are seen by new readers.
+        :param sync: Also ask the OS to write them to disk (fsync)
+        :type sync: bool
+        """
+        with self._lock:
+            # The log is flushed first, so the index never references
+            # records which are not in the log
+            for fp in (self._log, self._index):
+                fp.flush()
+                if sync:
+                    os.fsync(fp.fileno())
+
+    def close(self):
+        """
+        Flush the written records and close the log.
+        """
+        for fp in (self._log, self._index):
+            if not fp.closed:
+                fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class PacketLogReader(object):
+    """
+    Reader of a packet log. The log and its index are memory-mapped, so
+    records are read on demand. Records are accessed by index (reader[i],
+    with negative indexes and slices supported) or by time (records and
+    find), and packets can be replayed with replay.
+    The reader sees the records which were in the log when it was opened.
+
+        with PacketLogReader("traffic.log") as log:
+            for p in log.replay(ExamplePacket()):
+                ...
+    """
+
+    def __init__(self, path):
+        """
+        Raises InvalidData if the file is not a packet log.
+        :param path: Log file path
+        :type path: str
+        """
+        self._log = self._index = None
+        self._view = None
+        with open(path, "rb") as fp:
+            self._log = _map_file(fp)
+        if self._log is None or self._log[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise InvalidData("Not a packet log")
+        # Python 2 mmaps have no memoryviews, so records are copied there
+        self._view = memoryview(self._log) if PY3 else self._log
+        size = len(self._log)
+
+        try:
+            with open(path + INDEX_SUFFIX, "rb") as fp:
+                self._index = _map_file(fp)
+        except IOError:
+            self._index = None
+        count = len(self._index) // _INDEX.size if self._index is not None else 0
+
+        # Ignore the index entries of records which are not (completely)
+        # in the log, and scan the log for records which are not indexed
+        offset = len(_MAGIC)
+        while count:
+            last = _INDEX.unpack_from(self._index, (count - 1) * _INDEX.size)[0]
+            if last + _RECORD.size <= size and _record_end(self._log, last) <= size:
+                offset = _record_end(self._log, last)
+                break
+            count -= 1
+        self._indexed = count
+        self._unindexed = list(_scan_records(self._log, offset, size))
+
+    def _index_entry(self, index):
+        if index < self._indexed:
+            return _INDEX.unpack_from(self._index, index * _INDEX.size)
+        return self._unindexed[index - self._indexed]
+
+    def __len__(self):
+        return self._indexed + len(self._unindexed)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Record index out of range")
+        return self._read(*self._index_entry(index))
+
+    def __iter__(self):
+        return self.records()
+
+    def _read(self, offset, timestamp):
+        _, length, flags, tag_length = _RECORD.unpack_from(self._log, offset)
+        start = offset + _RECORD.size
+        tag_end = start + tag_length
+        body_start = tag_end + _correlation_id_size(flags)
+        tag = _decode_tag(self._view[start:tag_end]) if tag_length else None
+        correlation_id = _CORRELATION_ID.unpack_from(self._log, tag_end)[0] if body_start != tag_end else None
+        return LogRecord(timestamp, Frame(tag, flags, self._view[body_start:body_start + length], correlation_id))
+
+    def timestamp(self, index):
+        """
+        Timestamp of a record, without reading the record.
+        :type index: int
+        :rtype: float
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Record index out of range")
+        return self._index_entry(index)[1]
+
+    def find(self, timestamp):
+        """
+        Index of the first record with a timestamp greater than or equal to
+        timestamp (len(self) if there is none).
+        :type timestamp: float
+        :rtype: int
+        """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._index_entry(middle)[1] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def records(self, start=None, end=None):
+        """
+        Iterate over the records with start <= timestamp < end.
+        :param start: Start time (defaults to the first record)
+        :type start: float
+        :param end: End time (defaults to after the last record)
+        :type end: float
+        :rtype: collections.Iterator[LogRecord]
+        """
+        index = 0 if start is None else self.find(start)
+        stop = len(self) if end is None else self.find(end)
+        while index < stop:
+            yield self._read(*self._index_entry(index))
+            index += 1
+
+    def replay(self, target, start=None, end=None, speed=None):
+        """
+        Load the recorded packets with start <= timestamp < end into
+        target, in order, yielding the loaded packets.
+        If target is a Packet, only the records with its tag are loaded
+        into it. If it is a PacketRouter, every record is dispatched to
+        the packet registered for its tag.
+        If speed is given, packets are yielded with the recorded timing,
+        sped up by that factor (1 for real time).
+        Raises the same as Packet.loads or PacketRouter.dispatch.
+        :param target: Packet or PacketRouter
+        :param start: Start time
+        :type start: float
+        :param end: End time
+        :type end: float
+        :param speed: Replay speed, or None to replay as fast as possible
+        :type speed: float
+        :rtype: collections.Iterator[packet.Packet]
+        """
+        dispatch = getattr(target, "dispatch", None)
+        tag = None if dispatch is not None else target.__tag__
+        first = started = None
+        for record in self.records(start, end):
+            if speed is not None:
+                if first is None:
+                    first, started = record.timestamp, time.time()
+                delay = (record.timestamp - first) / speed - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            if dispatch is not None:
+                yield dispatch(record.frame)
+            elif record.frame.tag == tag:
+                target.loads(record.frame.body)
+                yield target
+
+    def close(self):
+        """
+        Close the log. The mapping is kept open (until garbage collected)
+        while records read from it are still referenced.
+        """
+        if self._view is not None:
+            release_view(self._view)
+            self._view = None
+        for mapping in (self._log, self._index):
+            if mapping is not None:
+                try:
+                    mapping.close()
+                except BufferError:
+                    pass
+        self._log = self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Instrumentation of packet dumps and loads.
+
+A metrics hook is a callable hook(tag, phase, seconds, size), which is
+called after every dumps (also send_to, dumps_into, ...) and loads of a
+packet, once for each phase:
+
+    dumps: "lock", "snapshot", "generate", "serialize", "compress", "encrypt"
+           and "dumps" (the whole operation)
+    loads: "decrypt", "decompress", "parse", "lock", "load" (validating and
+           updating the attributes) and "loads" (the whole operation)
+
+"lock" is the time spent waiting for the packet lock. size is the size in
+bytes of the output of the phase ("serialize", "compress", "encrypt",
+"dumps") or of its input ("decrypt", "decompress", "parse", "loads"), and 0
+for the other phases. "compress" and "decompress" are only reported when
+compression is enabled. Hooks are not called for operations which fail.
+
+Hooks are set globally or per packet class. When no hook is set, the only
+cost is an attribute lookup per operation.
+
+    aggregator = MetricsAggregator()
+    set_metrics_hook(aggregator)
+    ...
+    print(aggregator.report())
+"""
+
+import threading
+import timeit
+
+timer = timeit.default_timer
+
+# Latency histogram buckets: bucket i counts the latencies below 2 ** i
+# microseconds (and not in a previous bucket)
+_BUCKETS = 32
+
+
+def set_metrics_hook(hook, cls=None):
+    """
+    Set the metrics hook of a packet class (and its subclasses), or the
+    global hook if cls is None.
+    A hook set for a class takes precedence over the global hook. Setting
+    None for a class removes its hook, so the hook of its parent classes
+    (or the global one) is used again. Setting None globally disables the
+    global hook.
+    :param hook: Callable hook(tag, phase, seconds, size), or None
+    :param cls: Packet class
+    :type cls: type
+    """
+    if cls is None:
+        from packet.basepacket import Packet
+        cls = Packet
+        if hook is None:
+            cls._packet_metrics_hook = None
+            return
+    if hook is not None:
+        cls._packet_metrics_hook = staticmethod(hook)
+    elif "_packet_metrics_hook" in cls.__dict__:
+        del cls._packet_metrics_hook
+
+
+def get_metrics_hook(cls=None):
+    """
+    Get the metrics hook used by a packet class, or the global hook if cls
+    is None.
+    :param cls: Packet class
+    :type cls: type
+    :return: hook or None
+    """
+    if cls is None:
+        from packet.basepacket import Packet
+        cls = Packet
+    return cls._packet_metrics_hook
+
+
+class _PhaseStats(object):
+    __slots__ = ("count", "total", "size", "max", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.size = 0
+        self.max = 0.0
+        self.histogram = [0] * _BUCKETS
+
+    def add(self, seconds, size):
+        self.count += 1
+        self.total += seconds
+        self.size += size
+        if seconds > self.max:
+            self.max = seconds
+        self.histogram[min(int(seconds * 1e6).bit_length(), _BUCKETS - 1)] += 1
+
+    def percentile(self, p):
+        """
+        Upper bound (in seconds) of the histogram bucket with the p-th
+        percentile.
+        """
+        target = self.count * p / 100.0
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "bytes": self.size,
+            "histogram": list(self.histogram),
+        }
+
+
+class MetricsAggregator(object):
+    """
+    In-process metrics hook which keeps, for every packet tag and phase, the
+    number of calls, total time and bytes, and a latency histogram
+    (power-of-two microsecond buckets). It is safe to use from several
+    threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __call__(self, tag, phase, seconds, size):
+        key = (tag, phase)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _PhaseStats()
+            stats.add(seconds, size)
+
+    def reset(self):
+        """
+        Discard all the collected metrics.
+        """
+        with self._lock:
+            self._stats = {}
+
+    def snapshot(self):
+        """
+        Return the collected metrics as {tag: {phase: stats}}, where stats is
+        a dictionary with count, total, mean, p50, p99 and max (seconds),
+        bytes and histogram (counts of latencies below 1, 2, 4, ... us).
+        Percentiles are the upper bound of their histogram bucket.
+        :rtype: dict
+        """
+        with self._lock:
+            items = [(key, stats.to_dict()) for key, stats in self._stats.items()]
+        result = {}
+        for (tag, phase), stats in items:
+            result.setdefault(tag, {})[phase] = stats
+        return result
+
+    def report(self, limit=None):
+        """
+        Return a text table of the collected metrics, the phases with the
+        largest total time first.
+        :param limit: Maximum number of rows
+        :type limit: int
+        :rtype: str
+        """
+        rows = [(stats["total"], tag, phase, stats)
+                for tag, phases in self.snapshot().items() for phase, stats in phases.items()]
+        rows.sort(key=lambda row: (-row[0], row[1], row[2]))
+        lines = ["{:<24} {:<10} {:>9} {:>11} {:>10} {:>10} {:>10} {:>12}".format(
+            "tag", "phase", "count", "total ms", "mean us", "p99 us", "max us", "bytes")]
+        for _, tag, phase, stats in rows[:limit]:
+            lines.append("{:<24} {:<10} {:>9} {:>11.3f} {:>10.1f} {:>10.1f} {:>10.1f} {:>12}".format(
+                tag, phase, stats["count"], stats["total"] * 1e3, stats["mean"] * 1e6, stats["p99"] * 1e6,
+                stats["max"] * 1e6, stats["bytes"]))
+        return "\n".join(lines)
@@ -0,0 +1,286 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Parallel encoding and decoding of packets (Python 3.7+).
+
+Serialization and, with the pyaes backend, encryption are pure Python, so a
+single process encodes or decodes packets on one core at most. A
+ParallelCodec runs the serialize, compress and encrypt steps of dumps, or
+the decrypt, decompress and parse steps of loads, in a pool of processes:
+
+    codec = ParallelCodec([ChatMessage, Status])
+    payloads = codec.dumps_many(messages)
+    ...
+    for p in codec.dispatch(FrameReader(conn), router):
+        ...
+
+The settings of the registered packets (serializer, encryption key and mode,
+compression and cipher backend) are sent once to every worker when it
+starts, so they are the ones in use when the codec is created. Results are
+returned in the same order as their input, and packets are only read
+(snapshots) and updated in the calling process.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from packet.basepacket import Packet, SafePacket
+from packet.ciphers import get_cipher_backend, set_cipher_backend
+from packet.framing import Frame
+from packet.serializers import ast_serializer, binary_serializer, json_serializer
+from packet.utils import InvalidData, UnknownEncryption, UnknownPacket
+
+_SERIALIZERS = {"json": json_serializer, "ast": ast_serializer, "binary": binary_serializer}
+
+# Codec settings of each tag, in the worker processes
+_worker_codecs = {}
+
+
+def _serializer_name(serializer):
+    for name, value in _SERIALIZERS.items():
+        if value is serializer:
+            return name
+    raise ValueError("Unknown serializer")
+
+
+def _codec_settings(packet):
+    """
+    Settings used to encode and decode the data of a packet.
+    :rtype: tuple
+    """
+    if isinstance(packet, SafePacket):
+        encryption = (packet.encryption_key, packet.encryption_mode)
+    else:
+        encryption = None
+    return (_serializer_name(packet._packet_serializer), encryption, packet.compression_threshold,
+            packet.compression_level, packet.compression_dict)
+
+
+def _codec_class(settings):
+    """
+    Create a packet class with the given codec settings, whose class methods
+    (_encode_payload and _decode_payload) are used by the workers.
+    """
+    _, encryption, threshold, level, dictionary = settings
+
+    class _CodecPacket(Packet if encryption is None else SafePacket):
+        compression_threshold = threshold
+        compression_level = level
+        compression_dict = dictionary
+
+    if encryption is not None:
+        _CodecPacket.encryption_key, _CodecPacket.encryption_mode = encryption
+    return _CodecPacket
+
+
+def _init_worker(backend, settings):
+    set_cipher_backend(backend)
+    for tag, tag_settings in settings.items():
+        _worker_codecs[tag] = (_SERIALIZERS[tag_settings[0]], _codec_class(tag_settings))
+
+
+def _get_worker_codec(tag):
+    codec = _worker_codecs.get(tag)
+    if codec is None:
+        raise UnknownPacket("No packet registered for tag '{}'".format(tag))
+    return codec
+
+
+def _encode_chunk(chunk):
+    """
+    Serialize, compress and encrypt a list of (tag, serializer, data).
+    :return: (payload, error) for each item
+    :rtype: list[tuple]
+    """
+    results = []
+    for tag, serializer, data in chunk:
+        try:
+            default_serializer, cls = _get_worker_codec(tag)
+            serializer = _SERIALIZERS[serializer] if serializer else default_serializer
+            results.append((bytes(cls._encode_payload(serializer._dump_buffer({tag: data}))), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+
+def _decode_chunk(chunk):
+    """
+    Decrypt, decompress and parse a list of (tag, serializer, payload).
+    :return: (data, error) for each item
+    :rtype: list[tuple]
+    """
+    results = []
+    for tag, serializer, payload in chunk:
+        try:
+            default_serializer, cls = _get_worker_codec(tag)
+            serializer = _SERIALIZERS[serializer] if serializer else default_serializer
+            data = cls._decode_payload(payload)
+            try:
+                data = serializer.loads(data)
+            except Exception as e:
+                raise UnknownPacket(e)
+            results.append((data, None))
+        except (UnknownPacket, InvalidData, UnknownEncryption) as e:
+            results.append((None, e))
+    return results
+
+
+class ParallelCodec(object):
+    """
+    Encoder and decoder of packet data which runs serialization, compression
+    and encryption in a pool of processes.
+    Raises the same exceptions as dumps and loads, when the result of the
+    failed item is reached.
+    """
+
+    def __init__(self, packets, workers=None, chunk_size=16, max_pending=None):
+        """
+        :param packets: Packet subclasses or instances whose data is encoded
+        and decoded, indexed by their tag (for classes, the tag of a new
+        instance). Their settings are copied to the workers.
+        :type packets: list
+        :param workers: Number of worker processes (defaults to the number
+        of processors)
+        :type workers: int
+        :param chunk_size: Number of packets sent to a worker at once
+        :type chunk_size: int
+        :param max_pending: Maximum number of chunks being processed at a
+        time (defaults to twice the number of workers)
+        :type max_pending: int
+        """
+        if chunk_size < 1:
+            raise ValueError("Invalid chunk size")
+        settings = {}
+        for packet in packets:
+            if isinstance(packet, type):
+                if not issubclass(packet, Packet):
+                    raise TypeError("Expected Packet subclass or instance")
+                packet = packet()
+            elif not isinstance(packet, Packet):
+                raise TypeError("Expected Packet subclass or instance")
+            settings[packet.__tag__] = _codec_settings(packet)
+
+        workers = workers or os.cpu_count() or 1
+        self._tags = frozenset(settings)
+        self._chunk_size = chunk_size
+        self._max_pending = max_pending or 2 * workers
+        self._executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                             initargs=(get_cipher_backend(), settings))
+
+    def __contains__(self, tag):
+        return tag in self._tags
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the worker processes, once the pending work is done.
+        """
+        self._executor.shutdown()
+
+    def _map(self, function, items):
+        """
+        Process items in chunks in the workers, with at most max_pending
+        chunks at a time, and yield the results in order.
+        """
+        pending = deque()
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == self._chunk_size:
+                pending.append(self._executor.submit(function, chunk))
+                chunk = []
+                while len(pending) >= self._max_pending:
+                    for result in self._results(pending.popleft()):
+                        yield result
+        if chunk:
+            pending.append(self._executor.submit(function, chunk))
+        while pending:
+            for result in self._results(pending.popleft()):
+                yield result
+
+    @staticmethod
+    def _results(future):
+        for result, error in future.result():
+            if error is not None:
+                raise error
+            yield result
+
+    def encode(self, packets):
+        """
+        Generator which yields the payload of each packet (the same as
+        packet.dumps()), in order. Packet snapshots are taken in the calling
+        process, as packets are consumed.
+        :param packets: Iterable of packets
+        :rtype: collections.Iterator[bytes]
+        """
+        def items():
+            for packet in packets:
+                with packet._packet_lock:
+                    values = packet._snapshot()
+                yield packet.__tag__, _serializer_name(packet._packet_serializer), packet._generate_dict(values)
+
+        return self._map(_encode_chunk, items())
+
+    def dumps_many(self, packets):
+        """
+        Dump every packet, in parallel.
+        :param packets: Packets to dump
+        :type packets: list[Packet]
+        :return: Payloads, in the same order as packets
+        :rtype: list[bytes]
+        """
+        return list(self.encode(packets))
+
+    def decode(self, items):
+        """
+        Generator which decrypts, decompresses and parses the payloads of
+        the given items, and yields the deserialized data (a dictionary with
+        the tag as key) of each of them, in order.
+        :param items: Iterable of (tag, payload) or frames (see FrameReader)
+        :rtype: collections.Iterator[dict]
+        """
+        def chunk_items():
+            for item in items:
+                tag, payload = (item.tag, item.body) if isinstance(item, Frame) else item
+                # Frame bodies may be views of a reused buffer
+                yield tag, None, bytes(payload)
+
+        return self._map(_decode_chunk, chunk_items())
+
+    def loads_many(self, packets, payloads):
+        """
+        Load each payload into the packet at the same position, decoding
+        them in parallel. Packets are updated in order, so if a payload is
+        invalid, the previous packets are still updated.
+        Raises UnknownPacket or InvalidData if the data is not deserializable.
+        :param packets: Packets to update
+        :type packets: list[Packet]
+        :param payloads: Payloads, as returned by dumps
+        :type payloads: list[bytes]
+        """
+        if len(packets) != len(payloads):
+            raise ValueError("Expected {} payloads but got {}".format(len(packets), len(payloads)))
+        items = ((packet.__tag__, _serializer_name(packet._packet_serializer), bytes(payload))
+                 for packet, payload in zip(packets, payloads))
+        for packet, data in zip(packets, self._map(_decode_chunk, items)):
+            packet._load_dict(data)
+
+    def dispatch(self, items, router):
+        """
+        Generator which decodes items in parallel and dispatches them in
+        order with a PacketRouter, yielding the loaded packets.
+        Raises the same as PacketRouter.dispatch.
+        :param items: Iterable of (tag, payload) or frames, such as a
+        FrameReader
+        :param router: Router with the packets to load
+        :type router: packet.PacketRouter
+        """
+        for data in self.decode(items):
+            yield router._dispatch_object(data)
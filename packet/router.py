@@ -0,0 +1,176 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Routing of incoming data to packets by tag.
+
+A PacketRouter holds a registry of packets indexed by their tag, so data of
+many packet types can be received on the same connection. Frames (see
+packet.framing) carry the packet tag in their header, so they are routed
+without looking at their body. Untagged data is parsed once and routed by
+the tag found in it.
+"""
+
+import threading
+
+from packet.basepacket import Packet
+from packet.serializers import json_serializer
+from packet.utils import UnknownPacket
+
+
+class _Route(object):
+    __slots__ = ("packet", "factory", "handler")
+
+    def __init__(self, packet, factory, handler):
+        self.packet = packet
+        self.factory = factory
+        self.handler = handler
+
+    def target(self):
+        return self.packet if self.factory is None else self.factory()
+
+
+class PacketRouter(object):
+    """
+    Registry of packets indexed by tag, which loads incoming data into the
+    packet registered for its tag.
+
+        router = PacketRouter()
+        router.register(ChatMessage, on_chat_message)
+        router.register(status)
+        for p in router.receive_from(FrameReader(conn)):
+            ...
+    """
+
+    def __init__(self, serializer=json_serializer, packet_class=Packet):
+        """
+        :param serializer: Serializer used to parse untagged data
+        :type serializer: packet.serializers._Serializer
+        :param packet_class: Class whose encryption (e.g. a SafePacket
+        subclass) and compression settings are used to decode untagged
+        data
+        :type packet_class: type
+        """
+        self._serializer = serializer
+        self._packet_class = packet_class
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def register(self, packet, handler=None, tag=None):
+        """
+        Register a packet for its tag.
+        If packet is a Packet subclass, a new instance is created for every
+        message received. If it is a Packet instance, that same instance is
+        updated with every message received.
+        If handler is given, it is called with the loaded packet.
+        Raises ValueError if another packet is registered for the same tag.
+        :param packet: Packet subclass or instance
+        :param handler: Callable which gets the loaded packet
+        :param tag: Tag to register the packet for. Defaults to the packet
+        tag (for classes, the tag of a new instance).
+        :type tag: str
+        """
+        if isinstance(packet, type):
+            if not issubclass(packet, Packet):
+                raise TypeError("Expected Packet subclass or instance")
+            route = _Route(None, packet, handler)
+        elif isinstance(packet, Packet):
+            route = _Route(packet, None, handler)
+        else:
+            raise TypeError("Expected Packet subclass or instance")
+        if tag is None:
+            tag = route.target().__tag__
+
+        with self._lock:
+            if tag in self._routes:
+                raise ValueError("A packet is already registered for tag '{}'".format(tag))
+            routes = dict(self._routes)
+            routes[tag] = route
+            self._routes = routes
+
+    def unregister(self, tag):
+        """
+        Remove the packet registered for tag.
+        Raises KeyError if no packet is registered for tag.
+        :type tag: str
+        """
+        with self._lock:
+            routes = dict(self._routes)
+            del routes[tag]
+            self._routes = routes
+
+    def __contains__(self, tag):
+        return tag in self._routes
+
+    def dispatch(self, frame):
+        """
+        Load a frame into the packet registered for its tag, and call its
+        handler. Untagged frames are routed as in dispatch_data.
+        Raises UnknownPacket if no packet is registered for the tag, or
+        UnknownPacket or InvalidData if the data is not deserializable.
+        :param frame: Frame, as read by a FrameReader
+        :type frame: packet.Frame
+        :return: loaded packet
+        :rtype: Packet
+        """
+        if frame.tag is None:
+            return self.dispatch_data(frame.body)
+
+        route = self._routes.get(frame.tag)
+        if route is None:
+            raise UnknownPacket("No packet registered for tag '{}'".format(frame.tag))
+        packet = route.target()
+        packet.loads(frame.body)
+        return self._handle(route, packet)
+
+    def dispatch_data(self, data):
+        """
+        Load untagged data (as sent with send_to(conn)) into the packet
+        registered for the tag found in it, and call its handler. The data
+        is parsed only once.
+        Raises UnknownPacket if no packet is registered for the tag, or
+        UnknownPacket or InvalidData if the data is not deserializable.
+        :type data: bytes
+        :return: loaded packet
+        :rtype: Packet
+        """
+        data = self._packet_class._decode_payload(data)
+        try:
+            data = self._serializer.loads(data)
+        except Exception as e:
+            raise UnknownPacket(e)
+        return self._dispatch_object(data)
+
+    def _dispatch_object(self, data):
+        """
+        Load deserialized data, a dictionary with a single tag as key, into
+        the packet registered for its tag, and call its handler.
+        :type data: dict
+        :rtype: Packet
+        """
+        if not isinstance(data, dict) or len(data) != 1:
+            raise UnknownPacket("Expected dictionary data with a single tag")
+
+        tag = next(iter(data))
+        route = self._routes.get(tag)
+        if route is None:
+            raise UnknownPacket("No packet registered for tag '{}'".format(tag))
+        packet = route.target()
+        packet._load_dict(data)
+        return self._handle(route, packet)
+
+    def receive_from(self, reader):
+        """
+        Generator which dispatches every frame read from a FrameReader and
+        yields the loaded packets, until the connection is closed.
+        Raises the same as dispatch.
+        :type reader: packet.FrameReader
+        """
+        for frame in reader:
+            yield self.dispatch(frame)
+
+    @staticmethod
+    def _handle(route, packet):
+        if route.handler is not None:
+            route.handler(packet)
+        return packet
@@ -2,10 +2,12 @@
 # -*- coding: UTF-8 -*-
 
 import json
+import struct
+from json.encoder import encode_basestring_ascii
 import types
 
-from packet._compat import string_types, get_items
-from packet.evaluate import safe_eval
+from packet._compat import PY2, integer_types, string_types, text_type, decode_text, get_items
+from packet.evaluate import fast_eval
 from packet.utils import NotSerializable, InvalidData
 
 
@@ -29,7 +31,7 @@ def _can_be_reduced(obj):
     """
     try:
         reduced = obj.__reduce__()
-    except AttributeError:
+    except (AttributeError, TypeError):
         return False
     return (isinstance(reduced, tuple) and 2 <= len(reduced) <= 5 and
             reduced[0] == obj.__class__)
@@ -96,26 +98,90 @@ def _obj_from_reduce(cls, args, state=None, list_items=None, dict_items=None):
 
 
 class _Serializable(object):
-    __slots__ = ["_packet_lock", "_packet_initialised", "_packet_serializer"]
+    __slots__ = ["_packet_lock", "_packet_initialised", "_packet_serializer", "_packet_attributes",
+                 "_packet_dirty", "_packet_baseline", "_packet_snapshot"]
 
+    # Attributes of classes declared with fields (see packet.fields)
+    _packet_field_set = None
 
-def _get_attributes(obj):
+
+_SERIALIZABLE_SLOTS = frozenset(_Serializable.__slots__)
+
+# Python 2 integers may be loaded as int or long, depending on their value
+_INTEGER_TYPE_NAMES = frozenset(("int", "long"))
+
+# Slots declared along the MRO of each class, excluding _Serializable slots
+_class_slots = {}
+
+
+def _get_class_slots(cls):
     """
-    Get all the attributes of a given object as a set.
+    Get all the slots declared along the MRO of a given class, excluding
+    the _Serializable ones. The result is computed once per class.
+    :param cls: class to check slots
+    :return: slots
+    :rtype: tuple
+    """
+    try:
+        return _class_slots[cls]
+    except KeyError:
+        slots = []
+        for c in getattr(cls, "__mro__", ()):
+            for slot in getattr(c, "__slots__", ()):
+                if slot not in _SERIALIZABLE_SLOTS and slot not in slots:
+                    slots.append(slot)
+        slots = _class_slots[cls] = tuple(slots)
+        return slots
+
+
+def _same_type(expected, data_type):
+    return expected == data_type or (expected in _INTEGER_TYPE_NAMES and data_type in _INTEGER_TYPE_NAMES)
+
+
+def _find_attributes(obj):
+    """
+    Find all the attributes of a given object.
     :param obj: object to check attributes
     :return: attributes
     :rtype: set
     """
-    attributes = {slot for cls in (getattr(obj.__class__, "__mro__", ()))
-                  for slot in getattr(cls, "__slots__", ()) if hasattr(obj, slot)}
-    attributes.update(getattr(obj, "__dict__", {}))
+    attributes = {slot for slot in _get_class_slots(obj.__class__) if hasattr(obj, slot)}
+    attributes.update(getattr(obj, "__dict__", ()))
     if isinstance(obj, _Serializable):
-        for a in _Serializable.__slots__:
-            if a in attributes:
-                attributes.remove(a)
+        attributes.difference_update(_SERIALIZABLE_SLOTS)
     return attributes
 
 
+def _get_attributes(obj):
+    """
+    Get all the attributes of a given object as a set.
+    For _Serializable objects, the attributes are cached in the instance
+    until _invalidate_attributes is called. The attributes of classes
+    declared with fields are the fields.
+    :param obj: object to check attributes
+    :return: attributes
+    :rtype: set or frozenset
+    """
+    if isinstance(obj, _Serializable):
+        attributes = getattr(obj, "_packet_attributes", None)
+        if attributes is None:
+            attributes = obj._packet_field_set
+            if attributes is None:
+                attributes = frozenset(_find_attributes(obj))
+            object.__setattr__(obj, "_packet_attributes", attributes)
+        return attributes
+    return _find_attributes(obj)
+
+
+def _invalidate_attributes(obj):
+    """
+    Invalidate the cached attributes of a _Serializable object. Must be
+    called whenever the attributes layout of the object changes.
+    :param obj: _Serializable object
+    """
+    object.__setattr__(obj, "_packet_attributes", None)
+
+
 class _Serializer(object):
     def __init__(self, allowed_types):
         self._allowed_types = allowed_types
@@ -129,10 +195,32 @@ class _Serializer(object):
     def loads(self, data):
         raise NotImplementedError("abstract methods must be implemented")
 
+    def _dump_buffer(self, data):
+        """
+        Same as dumps, but may return a bytearray to avoid copying the
+        serialized data into a new bytes object.
+        :rtype: bytes or bytearray
+        """
+        return self.dumps(data)
+
+    def _dump_append(self, data, out):
+        """
+        Same as dumps, but appends the serialized data to a bytearray.
+        :type out: bytearray
+        """
+        out += self._dump_buffer(data)
+
     def verify_data_types(self, expected, data_type):
         raise NotImplementedError("abstract methods must be implemented")
 
-    def serialize_object(self, obj):
+    def serialize_object(self, obj, values=None):
+        """
+        Serialize obj. If values (a dictionary with the attributes of obj) is
+        given, the attributes are read from it instead of from obj.
+        """
+        if values is not None:
+            return {self._class_type: {attribute: self.serialize_object(value)
+                                       for attribute, value in get_items(values)}}
         if self._is_serializable(obj):
             return {self._simple_type: obj}
         elif _is_instance_of_class(obj):
@@ -143,108 +231,517 @@ class _Serializer(object):
 
         raise NotSerializable("Attribute type not supported: '{}'".format(obj.__class__.__name__))
 
-    def deserialize_object(self, obj, data):
-        self._validate_data(obj, data)
-        return self._deserialize_object(obj, data)
+    def deserialize_object(self, obj, data, partial=False):
+        """
+        Validate data against obj and deserialize it into obj.
+        Data is validated and the new values are built in a single pass, but
+        nothing is assigned until the whole data is valid.
+        If partial is True, class data may contain only some of the
+        attributes (as generated by diff_serialized).
+        """
+        ops = []
+        value = self._stage_object(obj, data, partial, ops)
+        for setter, target, attribute, new_value in ops:
+            setter(target, attribute, new_value)
+        return value
+
+    def diff_serialized(self, old, new):
+        """
+        Compare two serialized objects (as returned by serialize_object) and
+        return the part of new which differs from old, or None if they are
+        equal. For class data, only the attributes which changed are kept.
+        """
+        if (isinstance(old, dict) and isinstance(new, dict) and
+                self._class_type in old and self._class_type in new):
+            old_attributes, new_attributes = old[self._class_type], new[self._class_type]
+            if isinstance(old_attributes, dict) and set(old_attributes) == set(new_attributes):
+                changes = {}
+                for attribute, value in get_items(new_attributes):
+                    change = self.diff_serialized(old_attributes[attribute], value)
+                    if change is not None:
+                        changes[attribute] = change
+                return {self._class_type: changes} if changes else None
+        return None if old == new else new
 
     def _is_serializable(self, obj):
         return obj.__class__.__name__ in self._allowed_types
 
-    def _validate_data(self, obj, data):
+    def _simple_field(self, obj, attribute):
+        """
+        Return the field declaration of an attribute of obj (see
+        packet.fields) if its type is a simple type, otherwise None. Values
+        of such fields are validated against the declared type instead of
+        the type of the current value.
+        :rtype: packet.fields.Field
+        """
+        fields = getattr(obj, "_packet_field_map", None)
+        field = fields.get(attribute) if fields else None
+        if field is None or field.type is None or field.type.__name__ not in self._allowed_types:
+            return None
+        return field
+
+    def _stage_object(self, obj, data, partial, ops, field=None):
+        """
+        Validate data against obj (or against the declared type of field,
+        see _simple_field) and return the deserialized value. The
+        assignments to the attributes of obj (and of its children) are
+        appended to ops instead of being done.
+        """
         if not isinstance(data, dict):
             raise InvalidData("Expected dictionary for data")
         if len(data) != 1:
             raise InvalidData("Malformed dictionary")
         for s_type, serialized in get_items(data):
             if s_type == self._simple_type:
+                if field is not None:
+                    if serialized is None and field.nullable:
+                        return None
+                    self.verify_data_types(field.type.__name__, serialized.__class__.__name__)
+                    return field.type(serialized)
                 self.verify_data_types(obj.__class__.__name__, serialized.__class__.__name__)
+                return None if obj is None else obj.__class__(serialized)
             elif s_type == self._class_type:
                 if not _is_instance_of_class(obj):
                     raise InvalidData("Expected instance of class")
                 if not isinstance(serialized, dict):
                     raise InvalidData("Expected dictionary for class")
                 attributes = _get_attributes(obj)
-                if attributes != set(serialized):
+                if (not attributes.issuperset(serialized)) if partial else attributes != set(serialized):
                     raise InvalidData("Attributes do not match")
-                for attribute in attributes:
-                    self._validate_data(getattr(obj, attribute), serialized[attribute])
+                _setattr = object.__setattr__ if isinstance(obj, _Serializable) else setattr
+                for attribute in serialized:
+                    value = self._stage_object(getattr(obj, attribute), serialized[attribute], partial, ops,
+                                               self._simple_field(obj, attribute))
+                    ops.append((_setattr, obj, attribute, value))
+                return obj
             elif s_type == self._reduce_type:
                 if not _can_be_reduced(obj):
                     raise InvalidData("Object can not be reduced")
                 if not isinstance(serialized, (list, tuple)):
                     raise InvalidData("Expected list/tuple for attribute")
                 try:
-                    _obj_from_reduce(obj.__class__, *serialized)
+                    return _obj_from_reduce(obj.__class__, *serialized)
                 except Exception as e:
                     raise InvalidData(e)
             else:
                 raise InvalidData("Unknown serialization type: '{}'".format(s_type))
 
-    def _deserialize_object(self, obj, data):
-        for s_type, serialized in get_items(data):
-            if s_type == self._simple_type:
-                return None if obj is None else obj.__class__(serialized)
-            elif s_type == self._class_type:
-                _setattr = object.__setattr__ if isinstance(obj, _Serializable) else setattr
-                for attribute in _get_attributes(obj):
-                    _setattr(obj, attribute, self._deserialize_object(getattr(obj, attribute), serialized[attribute]))
-                return obj
-            else:
-                return _obj_from_reduce(obj.__class__, *serialized)
-
 
 class _AstSerializer(_Serializer):
+    """
+    Serializer which dumps data as Python literals (as repr does) and loads
+    them with a safe literal parser.
+    Data is written by walking it once, so only literals safe_eval accepts
+    are generated, without parsing them back.
+    """
+
+    def __init__(self, allowed_types):
+        super(_AstSerializer, self).__init__(allowed_types)
+        # Types whose repr is always a valid literal
+        self._leaf_types = frozenset((type(None), bool, float, complex, text_type, bytes) + integer_types)
+        self._emitters = {
+            list: self._list_literal,
+            tuple: self._tuple_literal,
+            set: self._set_literal,
+            dict: self._dict_literal,
+        }
+
     def dumps(self, data):
         try:
-            data = repr(data)
-            safe_eval(data)
-        except ValueError as e:
+            data = self._literal(data)
+        except RuntimeError as e:
+            # Circular references or too deep nesting (RecursionError)
             raise NotSerializable(e)
         return data.encode()
 
+    def _literal(self, obj):
+        cls = obj.__class__
+        if cls in self._leaf_types:
+            return repr(obj)
+        emitter = self._emitters.get(cls)
+        if emitter is None:
+            return self._other_literal(obj)
+        return emitter(obj)
+
+    def _only_leaves(self, items):
+        leaf_types = self._leaf_types
+        for item in items:
+            if item.__class__ not in leaf_types:
+                return False
+        return True
+
+    def _list_literal(self, obj):
+        if self._only_leaves(obj):
+            return repr(obj)
+        return "[" + ", ".join([self._literal(item) for item in obj]) + "]"
+
+    def _tuple_literal(self, obj):
+        if self._only_leaves(obj):
+            return repr(obj)
+        if len(obj) == 1:
+            return "(" + self._literal(obj[0]) + ",)"
+        return "(" + ", ".join([self._literal(item) for item in obj]) + ")"
+
+    def _set_literal(self, obj):
+        if self._only_leaves(obj):
+            return repr(obj)
+        return "{" + ", ".join([self._literal(item) for item in obj]) + "}"
+
+    def _dict_literal(self, obj):
+        if self._only_leaves(obj) and self._only_leaves(obj.values()):
+            return repr(obj)
+        return "{" + ", ".join([self._literal(k) + ": " + self._literal(v) for k, v in get_items(obj)]) + "}"
+
+    @staticmethod
+    def _other_literal(obj):
+        """
+        Literal of an object of any other type (e.g. a subclass of an
+        allowed type), which is only valid if its repr is a safe literal.
+        """
+        literal = repr(obj)
+        try:
+            fast_eval(literal)
+        except (ValueError, SyntaxError):
+            raise NotSerializable("Type not supported: '{}'".format(obj.__class__.__name__))
+        return literal
+
     def loads(self, data):
-        if isinstance(data, bytes):
-            data = data.decode()
-        return safe_eval(data)
+        return fast_eval(decode_text(data))
 
     def verify_data_types(self, expected, data_type):
-        if expected not in self._allowed_types or expected != data_type:
+        if expected not in self._allowed_types or not _same_type(expected, data_type):
             raise InvalidData("AST types not matching. Got '{}' but expected '{}'".format(data_type, expected))
 
 
+# Containers with more items than this are checked by _JsonSerializer with
+# a single (C level) type set comparison
+_BULK_CHECK_SIZE = 16
+
+
 class _JsonSerializer(_Serializer):
+    """
+    Serializer which dumps data as JSON. Only string keys are allowed in
+    dicts, at any depth.
+    """
+
+    def __init__(self, allowed_types):
+        super(_JsonSerializer, self).__init__(allowed_types)
+        self._encoder = json.JSONEncoder()
+        # Types which are encoded as JSON strings, numbers, booleans and null
+        self._leaf_types = frozenset((text_type, str, float, bool, type(None)) + integer_types)
+        self._key_types = frozenset((text_type, str))
+
     def dumps(self, data):
-        try:
-            self._check_dict_keys(data)
-            data = json.dumps(data)
-        except TypeError as e:
-            raise NotSerializable(e)
-        return data.encode()
+        self._check(data)
+        return self._encode(data).encode()
+
+    def iterencode(self, data):
+        """
+        Encode data as JSON, yielding the output in chunks (one for each
+        item of data, if data is a dict, list or tuple).
+        Raises NotSerializable if data can not be encoded (e.g. if a dict,
+        at any depth, has a key which is not a string).
+        :param data: data to encode
+        :return: generator of str chunks
+        """
+        self._check(data)
+        if isinstance(data, dict):
+            yield "{"
+            for i, (k, v) in enumerate(get_items(data)):
+                yield (", " if i else "") + encode_basestring_ascii(k) + ": " + self._encode(v)
+            yield "}"
+        elif isinstance(data, (list, tuple)):
+            yield "["
+            for i, v in enumerate(data):
+                yield (", " if i else "") + self._encode(v)
+            yield "]"
+        else:
+            yield self._encode(data)
 
     def loads(self, data):
-        if isinstance(data, bytes):
-            data = data.decode()
-        return json.loads(data)
+        return json.loads(decode_text(data))
 
     def verify_data_types(self, expected, data_type):
         if (expected not in self._allowed_types or data_type not in self._allowed_types or
                 self._allowed_types[expected] != self._allowed_types[data_type]):
             raise InvalidData("JSON types not matching. Got '{}' but expected '{}'".format(data_type, expected))
 
-    def _check_dict_keys(self, obj):
-        """
-        Check if all obj keys are strings, so it can be json serialized.
-        If one of the keys is not string, raise TypeError.
+    def _encode(self, obj):
+        try:
+            return self._encoder.encode(obj)
+        except (TypeError, ValueError) as e:
+            raise NotSerializable(e)
 
-        :param obj: dict, Dict to verify
-        :return: None
+    def _check(self, obj):
+        """
+        Check that all the keys of the dicts in obj are strings, at any
+        depth, so it can be json serialized.
+        Only dicts, lists and tuples are visited (the types of the items of
+        big containers are checked at once). Everything else is left to the
+        json encoder.
+        Raises NotSerializable if one of the keys is not a string.
+        :param obj: Object to verify
         """
+        try:
+            self._check_container(obj)
+        except RuntimeError:
+            # RecursionError
+            raise NotSerializable("Circular reference detected or data nested too deeply")
+
+    def _check_container(self, obj):
+        key_types = self._key_types
+        leaf_types = self._leaf_types
+        if isinstance(obj, dict):
+            if len(obj) <= _BULK_CHECK_SIZE or not key_types.issuperset(map(type, obj)):
+                for k in obj:
+                    if k.__class__ not in key_types and not isinstance(k, string_types):
+                        raise NotSerializable("Only string keys are allowed in Packet dicts")
+            obj = obj.values()
+        elif not isinstance(obj, (list, tuple)):
+            return
+        if len(obj) > _BULK_CHECK_SIZE and leaf_types.issuperset(map(type, obj)):
+            return
+        for v in obj:
+            if v.__class__ not in leaf_types:
+                self._check_container(v)
+
+
+_FLOAT = struct.Struct("<d")
+_SINGLE = struct.Struct("<f")
+_COMPLEX = struct.Struct("<dd")
+
+
+class _BinarySerializer(_Serializer):
+    """
+    Compact tagged binary encoding. Each value is written as a one byte tag
+    followed by its payload:
+        N, T, F - None, True, False
+        i - int (zigzag varint)
+        f - float (IEEE 754 double)
+        g - float which can be represented as an IEEE 754 single
+        c - complex (two IEEE 754 doubles)
+        s - str/unicode (varint length + UTF-8)
+        b - bytes (varint length + raw bytes)
+        l, t, S - list, tuple, set (varint count + items)
+        d - dict (varint count + key/value pairs)
+    """
+
+    def __init__(self, allowed_types):
+        super(_BinarySerializer, self).__init__(allowed_types)
+        self._encoders = {
+            type(None): self._encode_none,
+            bool: self._encode_bool,
+            float: self._encode_float,
+            complex: self._encode_complex,
+            text_type: self._encode_text,
+            bytes: self._encode_bytes,
+            list: self._encode_list,
+            tuple: self._encode_tuple,
+            set: self._encode_set,
+            dict: self._encode_dict,
+        }
+        for t in integer_types:
+            self._encoders[t] = self._encode_int
+        self._decoders = {
+            ord(b"N"): self._decode_none,
+            ord(b"T"): self._decode_true,
+            ord(b"F"): self._decode_false,
+            ord(b"i"): self._decode_int,
+            ord(b"f"): self._decode_float,
+            ord(b"g"): self._decode_single,
+            ord(b"c"): self._decode_complex,
+            ord(b"s"): self._decode_text,
+            ord(b"b"): self._decode_bytes,
+            ord(b"l"): self._decode_list,
+            ord(b"t"): self._decode_tuple,
+            ord(b"S"): self._decode_set,
+            ord(b"d"): self._decode_dict,
+        }
+
+    def dumps(self, data):
+        return bytes(self._dump_buffer(data))
 
+    def _dump_buffer(self, data):
+        out = bytearray()
+        self._encode(data, out)
+        return out
+
+    def _dump_append(self, data, out):
+        # Encoded straight into out, without an intermediate buffer
+        self._encode(data, out)
+
+    def loads(self, data):
+        if PY2:
+            data = bytearray(data)
+        value, position = self._decode(data, 0)
+        if position != len(data):
+            raise ValueError("Unexpected data after position {}".format(position))
+        return value
+
+    def verify_data_types(self, expected, data_type):
+        if expected not in self._allowed_types or not _same_type(expected, data_type):
+            raise InvalidData("Binary types not matching. Got '{}' but expected '{}'".format(data_type, expected))
+
+    def _encode(self, obj, out):
+        encoder = self._encoders.get(obj.__class__)
+        if encoder is None:
+            for cls, encoder in get_items(self._encoders):
+                if cls is not type(None) and isinstance(obj, cls):
+                    break
+            else:
+                raise NotSerializable("Type not supported: '{}'".format(obj.__class__.__name__))
+        encoder(obj, out)
+
+    @staticmethod
+    def _write_varint(value, out):
+        while value > 0x7f:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    @staticmethod
+    def _encode_none(_, out):
+        out.append(ord(b"N"))
+
+    @staticmethod
+    def _encode_bool(obj, out):
+        out.append(ord(b"T") if obj else ord(b"F"))
+
+    def _encode_int(self, obj, out):
+        out.append(ord(b"i"))
+        self._write_varint(obj << 1 if obj >= 0 else (-obj << 1) - 1, out)
+
+    @staticmethod
+    def _encode_float(obj, out):
+        try:
+            single = _SINGLE.pack(obj)
+        except OverflowError:
+            single = None
+        if single is not None and _SINGLE.unpack(single)[0] == obj:
+            out.append(ord(b"g"))
+            out += single
+        else:
+            out.append(ord(b"f"))
+            out += _FLOAT.pack(obj)
+
+    @staticmethod
+    def _encode_complex(obj, out):
+        out.append(ord(b"c"))
+        out += _COMPLEX.pack(obj.real, obj.imag)
+
+    def _encode_text(self, obj, out):
+        self._encode_bytes(obj.encode("utf-8"), out, b"s")
+
+    def _encode_bytes(self, obj, out, tag=b"b"):
+        out.append(ord(tag))
+        self._write_varint(len(obj), out)
+        out += obj
+
+    def _encode_items(self, obj, out, tag):
+        out.append(ord(tag))
+        self._write_varint(len(obj), out)
+        for item in obj:
+            self._encode(item, out)
+
+    def _encode_list(self, obj, out):
+        self._encode_items(obj, out, b"l")
+
+    def _encode_tuple(self, obj, out):
+        self._encode_items(obj, out, b"t")
+
+    def _encode_set(self, obj, out):
+        self._encode_items(obj, out, b"S")
+
+    def _encode_dict(self, obj, out):
+        out.append(ord(b"d"))
+        self._write_varint(len(obj), out)
         for k, v in get_items(obj):
-            if not isinstance(k, string_types):
-                raise TypeError("Only string keys are allowed in Packet dicts")
-            if isinstance(v, dict):
-                self._check_dict_keys(v)
+            self._encode(k, out)
+            self._encode(v, out)
+
+    def _decode(self, data, position):
+        try:
+            decoder = self._decoders[data[position]]
+        except KeyError:
+            raise ValueError("Unknown type at position {}".format(position))
+        return decoder(data, position + 1)
+
+    @staticmethod
+    def _read_varint(data, position):
+        value = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, position
+            shift += 7
+
+    @staticmethod
+    def _decode_none(_, position):
+        return None, position
+
+    @staticmethod
+    def _decode_true(_, position):
+        return True, position
+
+    @staticmethod
+    def _decode_false(_, position):
+        return False, position
+
+    def _decode_int(self, data, position):
+        value, position = self._read_varint(data, position)
+        return (value >> 1) ^ -(value & 1), position
+
+    @staticmethod
+    def _decode_float(data, position):
+        return _FLOAT.unpack_from(data, position)[0], position + _FLOAT.size
+
+    @staticmethod
+    def _decode_single(data, position):
+        return _SINGLE.unpack_from(data, position)[0], position + _SINGLE.size
+
+    @staticmethod
+    def _decode_complex(data, position):
+        return complex(*_COMPLEX.unpack_from(data, position)), position + _COMPLEX.size
+
+    def _decode_bytes(self, data, position):
+        size, position = self._read_varint(data, position)
+        end = position + size
+        if end > len(data):
+            raise ValueError("Truncated data at position {}".format(position))
+        return bytes(data[position:end]), end
+
+    def _decode_text(self, data, position):
+        value, position = self._decode_bytes(data, position)
+        return value.decode("utf-8"), position
+
+    def _decode_items(self, data, position):
+        size, position = self._read_varint(data, position)
+        items = []
+        for _ in range(size):
+            item, position = self._decode(data, position)
+            items.append(item)
+        return items, position
+
+    def _decode_list(self, data, position):
+        return self._decode_items(data, position)
+
+    def _decode_tuple(self, data, position):
+        items, position = self._decode_items(data, position)
+        return tuple(items), position
+
+    def _decode_set(self, data, position):
+        items, position = self._decode_items(data, position)
+        return set(items), position
+
+    def _decode_dict(self, data, position):
+        size, position = self._read_varint(data, position)
+        value = {}
+        for _ in range(size):
+            k, position = self._decode(data, position)
+            value[k], position = self._decode(data, position)
+        return value, position
 
 
 ast_serializer = _AstSerializer([
@@ -269,3 +766,16 @@ json_serializer = _JsonSerializer({
     "bool": "boolean",
     "NoneType": "null",  # NoneType can't be updated. Avoid using it
 })
+
+binary_serializer = _BinarySerializer([
+    "dict",
+    "list", "tuple",
+    "set",
+    "str", "unicode",
+    "bytes",
+    "int", "long",
+    "float",
+    "complex",
+    "bool",
+    "NoneType",  # NoneType can't be updated. Avoid using it
+])
@@ -0,0 +1,715 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+Packet server and client built on selectors (Python 3.4+).
+
+A single thread runs an event loop over non-blocking sockets: it accepts
+connections, reads whatever data is available into a FrameReader per
+connection and writes the buffered output of every connection as the
+socket accepts it. Complete frames are loaded into packets and passed to
+their handlers by a fixed number of worker threads, so slow handlers never
+block the event loop. Idle connections hold no buffers, so a single process
+can keep tens of thousands of them (as far as the limit of open files
+allows).
+
+    server = PacketServer(("0.0.0.0", 8000), workers=4)
+    server.register(ChatMessage, on_chat_message)  # handler(connection, packet)
+    server.serve_forever()
+
+    client = PacketClient(("localhost", 8000))
+    client.register(ChatMessage, on_chat_message)
+    client.connect()
+    client.send(message)
+
+Frames of a connection are handled in the order they were received, one at
+a time. Once max_queue frames are waiting for a worker, connections stop
+being read until the workers catch up.
+"""
+
+import errno
+import logging
+import selectors
+import socket
+import threading
+from collections import deque
+from queue import Queue
+
+from packet.framing import DEFAULT_MAX_FRAME_SIZE, FrameReader, _pack_header
+from packet.router import PacketRouter
+from packet.utils import InvalidData, UnknownEncryption, UnknownPacket
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of frames of a connection handled by a worker before it
+# moves on to other connections
+_MAX_BATCH = 16
+
+_IGNORED_ERRORS = (BlockingIOError, InterruptedError)
+
+
+class Connection(object):
+    """
+    Connection of a PacketServer or PacketClient. Packets may be sent from
+    any thread; the data is buffered and written by the event loop.
+    """
+
+    __slots__ = ("address", "_endpoint", "_sock", "_reader", "_lock", "_output", "_writing", "_closing",
+                 "_closed", "_paused", "_events", "_inbox", "_scheduled", "_correlation_id", "bytes_received",
+                 "bytes_sent", "frames_received", "frames_sent")
+
+    def __init__(self, endpoint, sock, address):
+        self.address = address
+        self._endpoint = endpoint
+        self._sock = sock
+        self._reader = FrameReader(max_frame_size=endpoint.max_frame_size)
+        self._lock = threading.Lock()
+        self._output = bytearray()
+        self._writing = False
+        self._closing = False
+        self._closed = False
+        self._paused = False
+        self._events = 0
+        # Frames waiting to be handled, and whether a worker is in charge of them
+        self._inbox = deque()
+        self._scheduled = False
+        self._correlation_id = None
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.frames_received = 0
+        self.frames_sent = 0
+
+    def __repr__(self):
+        return "<Connection {}>".format(self.address)
+
+    @property
+    def closed(self):
+        """
+        Whether the connection is closed or being closed.
+        :rtype: bool
+        """
+        return self._closing or self._closed
+
+    @property
+    def pending_output(self):
+        """
+        Number of bytes buffered but not sent yet.
+        :rtype: int
+        """
+        return len(self._output)
+
+    @property
+    def correlation_id(self):
+        """
+        Correlation ID of the frame being handled, in its handler, or None
+        if the frame has no correlation ID.
+        :rtype: int
+        """
+        return self._correlation_id
+
+    def send(self, packet, correlation_id=None):
+        """
+        Send packet as a frame (see Packet.send_to). The data is buffered
+        and sent by the event loop. If the connection is closed, the packet
+        is dropped.
+        :param packet: Packet to send
+        :type packet: packet.Packet
+        :param correlation_id: Correlation ID of the frame
+        :type correlation_id: int
+        :return: Bytes queued, or 0 if the connection is closed
+        :rtype: int
+        """
+        return self.send_frame(packet._dump_payload(), packet.__tag__, correlation_id=correlation_id)
+
+    def reply(self, packet):
+        """
+        Send packet as the response to the frame being handled, with the
+        same correlation ID. Must be called from its handler; to respond
+        later, send the packet with the correlation_id of the request.
+        :param packet: Packet to send
+        :type packet: packet.Packet
+        :return: Bytes queued, or 0 if the connection is closed
+        :rtype: int
+        """
+        return self.send(packet, self._correlation_id)
+
+    def send_frame(self, body, tag=None, flags=0, correlation_id=None):
+        """
+        Send a frame with the given body, optional tag, flags and
+        correlation ID.
+        :param body: Frame body
+        :type body: bytes or bytearray or memoryview
+        :param tag: Frame tag
+        :type tag: str
+        :param flags: Frame flags (0-255)
+        :type flags: int
+        :param correlation_id: Correlation ID
+        :type correlation_id: int
+        :return: Bytes queued, or 0 if the connection is closed
+        :rtype: int
+        """
+        header = _pack_header(len(body), tag, flags, correlation_id)
+        with self._lock:
+            if self._closing or self._closed:
+                return 0
+            self._output += header
+            self._output += body
+            self.frames_sent += 1
+            start = not self._writing
+            self._writing = True
+        if start:
+            self._endpoint._call_soon(self._flush)
+        return len(header) + len(body)
+
+    def close(self):
+        """
+        Close the connection once the buffered data is sent. Frames already
+        received are still handled.
+        """
+        with self._lock:
+            if self._closing or self._closed:
+                return
+            self._closing = True
+            writing = self._writing
+        if not writing:
+            self._endpoint._call_soon(self._close)
+
+    # The methods below run in the event loop
+
+    def _update_events(self):
+        events = (0 if self._paused else selectors.EVENT_READ) | (selectors.EVENT_WRITE if self._writing else 0)
+        if events == self._events or self._closed:
+            return
+        selector = self._endpoint._selector
+        if not events:
+            selector.unregister(self._sock)
+        elif not self._events:
+            selector.register(self._sock, events, self._on_event)
+        else:
+            selector.modify(self._sock, events, self._on_event)
+        self._events = events
+
+    def _on_event(self, events):
+        try:
+            if events & selectors.EVENT_READ:
+                self._read()
+            if events & selectors.EVENT_WRITE and not self._closed:
+                self._flush()
+        except Exception:
+            # Only this connection is affected
+            logger.exception("Error on connection from %s", self.address)
+            self._endpoint._count("errors")
+            self._close()
+
+    def _read(self):
+        endpoint = self._endpoint
+        try:
+            size = self._sock.recv_into(endpoint._read_buffer)
+        except _IGNORED_ERRORS:
+            return
+        except OSError:
+            self._close()
+            return
+        if not size:
+            self._close()
+            return
+        self.bytes_received += size
+        try:
+            self._reader.feed(endpoint._read_view[:size])
+        except InvalidData:
+            endpoint._count("errors")
+            self._close()
+            return
+        frames = []
+        frame = self._reader.next_frame()
+        while frame is not None:
+            frames.append(frame)
+            frame = self._reader.next_frame()
+        if frames:
+            self.frames_received += len(frames)
+            endpoint._enqueue(self, frames)
+
+    def _flush(self):
+        if self._closed:
+            return
+        with self._lock:
+            try:
+                sent = self._sock.send(self._output) if self._output else 0
+            except _IGNORED_ERRORS:
+                sent = 0
+            except OSError:
+                self._output.clear()
+                self._writing = False
+                sent = None
+            else:
+                del self._output[:sent]
+                self.bytes_sent += sent
+                self._writing = bool(self._output)
+            closing = self._closing and not self._writing
+        if sent is None or closing:
+            self._close()
+        else:
+            self._update_events()
+
+    def _pause(self):
+        self._paused = True
+        self._update_events()
+
+    def _resume(self):
+        self._paused = False
+        self._update_events()
+
+    def _close(self):
+        if self._closed:
+            return
+        with self._lock:
+            self._closing = True
+            self._closed = True
+            self._writing = False
+            self._output = bytearray()
+        if self._events:
+            self._endpoint._selector.unregister(self._sock)
+            self._events = 0
+        self._sock.close()
+        self._reader._release()
+        self._endpoint._remove(self)
+
+
+class _PacketEndpoint(object):
+    """
+    Event loop, connections and workers shared by PacketServer and
+    PacketClient.
+    """
+
+    def __init__(self, workers=4, max_queue=1024, max_frame_size=DEFAULT_MAX_FRAME_SIZE, buffer_size=65536,
+                 on_connect=None, on_disconnect=None):
+        if workers < 1 or max_queue < 1:
+            raise ValueError("workers and max_queue must be positive")
+        self.max_frame_size = max_frame_size
+        self.router = PacketRouter()
+        self._handlers = {}
+        self._on_connect = on_connect
+        self._on_disconnect = on_disconnect
+        self._workers = workers
+        self._max_queue = max_queue
+
+        self._selector = None
+        self._read_buffer = bytearray(buffer_size)
+        self._read_view = memoryview(self._read_buffer)
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._commands = deque()
+        self._waker = None
+        self._wake_socket = None
+        self._loop_thread = None
+        self._worker_threads = []
+        self._ready = Queue()
+        self._running = False
+        self._stopping = False
+
+        # Frames waiting to be handled, and connections not read because
+        # of that
+        self._queued = 0
+        self._paused = set()
+        self._resuming = False
+        self._counters = {"accepted": 0, "closed": 0, "frames_handled": 0, "errors": 0, "handler_errors": 0,
+                          "max_queued": 0, "pauses": 0}
+
+    def register(self, packet, handler=None, tag=None):
+        """
+        Register a packet for its tag (see PacketRouter.register). handler
+        is called with the connection and the loaded packet, in a worker
+        thread.
+        :param packet: Packet subclass or instance
+        :param handler: Callable handler(connection, packet)
+        :param tag: Tag to register the packet for
+        :type tag: str
+        """
+        self.router.register(packet, tag=tag)
+        if tag is None:
+            tag = (packet() if isinstance(packet, type) else packet).__tag__
+        self._handlers[tag] = handler
+
+    @property
+    def connections(self):
+        """
+        Open connections.
+        :rtype: list[Connection]
+        """
+        with self._lock:
+            return list(self._connections)
+
+    def stats(self):
+        """
+        Return the connection and queue metrics: number of open connections
+        ("connections"), connections accepted and closed, frames waiting to
+        be handled ("queued", the largest value being "max_queued") and
+        handled, connections not being read because the queue is full
+        ("paused", and how many times this happened, "pauses"), bytes and
+        frames received and sent by the open connections, errors loading
+        frames ("errors") and exceptions raised by handlers.
+        :rtype: dict
+        """
+        with self._lock:
+            connections = list(self._connections)
+            stats = dict(self._counters, connections=len(connections), queued=self._queued,
+                         paused=len(self._paused), max_queue=self._max_queue, workers=self._workers)
+        for name in ("bytes_received", "bytes_sent", "frames_received", "frames_sent"):
+            stats[name] = sum(getattr(connection, name) for connection in connections)
+        stats["pending_output"] = sum(connection.pending_output for connection in connections)
+        return stats
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def _start(self):
+        self._selector = selectors.DefaultSelector()
+        self._wake_socket, self._waker = socket.socketpair()
+        self._wake_socket.setblocking(False)
+        self._waker.setblocking(False)
+        self._selector.register(self._wake_socket, selectors.EVENT_READ, self._on_wake)
+        self._running = True
+        for _ in range(self._workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._worker_threads.append(worker)
+
+    def _start_loop(self):
+        self._loop_thread = threading.Thread(target=self._run)
+        self._loop_thread.daemon = True
+        self._loop_thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping:
+                for key, events in self._selector.select():
+                    try:
+                        key.data(events)
+                    except Exception:
+                        logger.exception("Error in the event loop")
+                self._run_commands()
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        """
+        Stop the event loop and the workers, and close all connections.
+        Frames not handled yet are dropped. Returns once everything is
+        stopped, unless called from a handler.
+        """
+        if not self._running or self._stopping:
+            return
+        self._stopping = True
+        self._wake()
+        current = threading.current_thread()
+        if self._loop_thread is not None and self._loop_thread is not current:
+            self._loop_thread.join()
+        for worker in self._worker_threads:
+            if worker is not current:
+                worker.join()
+
+    def _shutdown(self):
+        for connection in list(self._connections):
+            connection._close()
+        self._close_sockets()
+        for _ in self._worker_threads:
+            self._ready.put(None)
+        self._selector.close()
+        self._wake_socket.close()
+        self._waker.close()
+        self._running = False
+
+    def _close_sockets(self):
+        pass
+
+    def _call_soon(self, function):
+        """
+        Run function in the event loop.
+        """
+        self._commands.append(function)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._waker.send(b"\0")
+        except (OSError, AttributeError):
+            # The wake up socket is full (the loop wakes up anyway) or closed
+            pass
+
+    def _on_wake(self, events):
+        try:
+            while self._wake_socket.recv(4096):
+                pass
+        except _IGNORED_ERRORS:
+            pass
+
+    def _run_commands(self):
+        commands = self._commands
+        while commands:
+            try:
+                commands.popleft()()
+            except Exception:
+                logger.exception("Error in the event loop")
+
+    def _add(self, sock, address):
+        sock.setblocking(False)
+        connection = Connection(self, sock, address)
+        with self._lock:
+            self._connections.add(connection)
+        connection._update_events()
+        if self._on_connect is not None:
+            self._on_connect(connection)
+        return connection
+
+    def _remove(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+            self._paused.discard(connection)
+            self._counters["closed"] += 1
+        if self._on_disconnect is not None:
+            self._on_disconnect(connection)
+
+    def _enqueue(self, connection, frames):
+        with self._lock:
+            self._queued += len(frames)
+            if self._queued > self._counters["max_queued"]:
+                self._counters["max_queued"] = self._queued
+            pause = self._queued >= self._max_queue
+            if pause:
+                self._paused.add(connection)
+                self._counters["pauses"] += 1
+            connection._inbox.extend(frames)
+            schedule = not connection._scheduled
+            connection._scheduled = True
+        if schedule:
+            self._ready.put(connection)
+        if pause:
+            connection._pause()
+
+    def _resume(self):
+        with self._lock:
+            paused = [connection for connection in self._paused if not connection._closed]
+            self._paused.clear()
+            self._resuming = False
+        for connection in paused:
+            connection._resume()
+
+    def _work(self):
+        while True:
+            connection = self._ready.get()
+            if connection is None:
+                return
+            for _ in range(_MAX_BATCH):
+                with self._lock:
+                    if not connection._inbox or self._stopping:
+                        connection._scheduled = False
+                        break
+                    frame = connection._inbox.popleft()
+                try:
+                    self._handle(connection, frame)
+                except Exception:
+                    # The worker keeps handling this and other connections
+                    self._count("errors")
+                    logger.exception("Error handling a frame from %s", connection.address)
+                with self._lock:
+                    self._queued -= 1
+                    self._counters["frames_handled"] += 1
+                    resume = self._paused and not self._resuming and self._queued < self._max_queue
+                    if resume:
+                        self._resuming = True
+                if resume:
+                    self._call_soon(self._resume)
+            else:
+                # Let other connections be handled before the rest
+                self._ready.put(connection)
+
+    def _handle(self, connection, frame):
+        try:
+            packet = self.router.dispatch(frame)
+        except (UnknownPacket, InvalidData, UnknownEncryption):
+            self._count("errors")
+            return
+        handler = self._handlers.get(packet.__tag__ if frame.tag is None else frame.tag)
+        if handler is None:
+            return
+        # Frames of a connection are handled one at a time
+        connection._correlation_id = frame.correlation_id
+        try:
+            handler(connection, packet)
+        except Exception:
+            self._count("handler_errors")
+            logger.exception("Error handling %s from %s", packet.__tag__, connection.address)
+        finally:
+            connection._correlation_id = None
+
+
+class PacketServer(_PacketEndpoint):
+    """
+    Server which receives packets from many connections and passes them to
+    the handlers of their tags.
+    """
+
+    def __init__(self, address, workers=4, max_queue=1024, max_frame_size=DEFAULT_MAX_FRAME_SIZE,
+                 backlog=1024, buffer_size=65536, on_connect=None, on_disconnect=None,
+                 family=socket.AF_INET):
+        """
+        :param address: Address to listen on
+        :type address: tuple
+        :param workers: Number of worker threads which handle packets
+        :type workers: int
+        :param max_queue: Number of frames waiting to be handled above which
+        connections are not read
+        :type max_queue: int
+        :param max_frame_size: Maximum frame size; connections sending
+        larger frames are closed
+        :type max_frame_size: int
+        :param backlog: Listen backlog
+        :type backlog: int
+        :param buffer_size: Maximum number of bytes read at once
+        :type buffer_size: int
+        :param on_connect: Callable called with every new connection, in
+        the event loop
+        :param on_disconnect: Callable called with every closed connection,
+        in the event loop
+        :param family: Socket family
+        :type family: int
+        """
+        super(PacketServer, self).__init__(workers, max_queue, max_frame_size, buffer_size, on_connect,
+                                           on_disconnect)
+        self._listener = socket.socket(family, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(address)
+        self._listener.listen(backlog)
+        self._listener.setblocking(False)
+        self._accepting = False
+
+    @property
+    def address(self):
+        """
+        Address the server listens on.
+        :rtype: tuple
+        """
+        return self._listener.getsockname()
+
+    def start(self):
+        """
+        Start serving in a background thread.
+        """
+        self._start_serving()
+        self._start_loop()
+
+    def serve_forever(self):
+        """
+        Serve in the current thread, until stop is called.
+        """
+        self._start_serving()
+        self._loop_thread = threading.current_thread()
+        self._run()
+
+    def _start_serving(self):
+        if self._running:
+            raise RuntimeError("Server already started")
+        self._start()
+        self._selector.register(self._listener, selectors.EVENT_READ, self._accept)
+        self._accepting = True
+
+    def _accept(self, events):
+        # Accept all the pending connections
+        while True:
+            try:
+                sock, address = self._listener.accept()
+            except _IGNORED_ERRORS:
+                return
+            except OSError as e:
+                if e.errno in (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM):
+                    # Out of resources: stop accepting until a connection is closed
+                    logger.warning("Can't accept connections: %s", e)
+                    self._selector.unregister(self._listener)
+                    self._accepting = False
+                return
+            if sock.family != socket.AF_UNIX:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._count("accepted")
+            self._add(sock, address)
+
+    def _remove(self, connection):
+        super(PacketServer, self)._remove(connection)
+        if not self._accepting and not self._stopping:
+            self._accepting = True
+            self._selector.register(self._listener, selectors.EVENT_READ, self._accept)
+
+    def _close_sockets(self):
+        self._listener.close()
+
+
+class PacketClient(_PacketEndpoint):
+    """
+    Client connection to a PacketServer. Received packets are passed to the
+    handlers of their tags.
+    """
+
+    def __init__(self, address, workers=1, max_queue=1024, max_frame_size=DEFAULT_MAX_FRAME_SIZE,
+                 buffer_size=65536, on_disconnect=None):
+        """
+        :param address: Address of the server
+        :type address: tuple
+        :param workers: Number of worker threads which handle packets
+        :type workers: int
+        :param max_queue: Number of frames waiting to be handled above which
+        the connection is not read
+        :type max_queue: int
+        :param max_frame_size: Maximum frame size
+        :type max_frame_size: int
+        :param buffer_size: Maximum number of bytes read at once
+        :type buffer_size: int
+        :param on_disconnect: Callable called with the connection once it
+        is closed, in the event loop
+        """
+        super(PacketClient, self).__init__(workers, max_queue, max_frame_size, buffer_size, None, on_disconnect)
+        self._address = address
+        self.connection = None
+
+    def connect(self, timeout=None):
+        """
+        Connect to the server and start the event loop in a background
+        thread.
+        :param timeout: Connection timeout, in seconds
+        :type timeout: float
+        :return: Connection
+        :rtype: Connection
+        """
+        if self._running:
+            raise RuntimeError("Client already connected")
+        sock = socket.create_connection(self._address, timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._start()
+        self.connection = self._add(sock, sock.getpeername())
+        self._start_loop()
+        return self.connection
+
+    def send(self, packet):
+        """
+        Send a packet to the server (see Connection.send).
+        :param packet: Packet to send
+        :type packet: packet.Packet
+        :return: Bytes queued
+        :rtype: int
+        """
+        return self.connection.send(packet)
+
+    def close(self):
+        """
+        Send the buffered data, close the connection and stop the client.
+        Frames not handled yet are dropped.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            if self._loop_thread is not threading.current_thread():
+                self._loop_thread.join()
+
+    def _remove(self, connection):
+        super(PacketClient, self)._remove(connection)
+        # The client stops with its connection
+        self._stopping = True
@@ -3,6 +3,7 @@
 
 CTR_MODE = 1  # Counter Mode
 CBC_MODE = 2  # Cipher Block Chaining Mode
+GCM_MODE = 3  # Galois/Counter Mode (authenticated encryption)
 
 
 class UnknownPacket(Exception):
@@ -19,3 +20,7 @@ class UnknownEncryption(Exception):
 
 class NotSerializable(Exception):
     pass
+
+
+class ChannelClosed(Exception):
+    pass
@@ -20,6 +20,7 @@ setup(
     author_email=__email__,
     packages=["packet"],
     install_requires=["pyaes"],
+    extras_require={"fast": ["cryptography"]},
     tests_require=["pytest"],
     python_requires=">=2.7",
 )
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import sys
+
+import pytest
+
+import packet
+from tests import utils
+
+asyncio = pytest.importorskip("asyncio")
+futures = pytest.importorskip("concurrent.futures")
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python 3.5+")
+
+
+class DummyWriter:
+    def __init__(self, reader):
+        self.reader = reader
+
+    def write(self, data):
+        self.reader.feed_data(data)
+
+    @staticmethod
+    def drain():
+        return asyncio.sleep(0)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_send_async_and_receive_async():
+    for executor in (None, futures.ThreadPoolExecutor(2)):
+        reader = asyncio.StreamReader()
+        writer = DummyWriter(reader)
+
+        packet1 = utils.JSONTestPacket()
+        packet2 = utils.JSONTestPacket()
+        utils.modify_json_test_packet(packet1)
+
+        sent = run(packet1.send_async(writer, executor))
+        assert sent == len(packet.pack_frame(packet1.dumps(), packet1.__tag__))
+        assert run(packet2.receive_async(reader, executor))
+        utils.check_json_test_packets(packet1, packet2)
+
+        reader.feed_eof()
+        assert not run(packet2.receive_async(reader, executor))
+
+
+def test_iter_packets():
+    from packet.aio import iter_packets
+
+    reader = asyncio.StreamReader()
+    packets = [utils.ASTTestPacket() for _ in range(3)]
+    for i, p in enumerate(packets):
+        utils.modify_ast_test_packet(p)
+        p.int = i
+        reader.feed_data(packet.pack_frame(p.dumps(), p.__tag__))
+    reader.feed_eof()
+
+    iterator = iter_packets(reader, utils.ASTTestPacket).__aiter__()
+    for p in packets:
+        utils.check_ast_test_packet(p, run(iterator.__anext__()))
+    with pytest.raises(StopAsyncIteration):
+        run(iterator.__anext__())
+
+
+def test_read_frame():
+    from packet.aio import read_frame
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(packet.pack_frame(b"body", "tag", correlation_id=7) + packet.pack_frame(b"other"))
+    reader.feed_data(packet.pack_frame(b"malformed", "tag").replace(b"tag", b"\xff\xfe\xfd"))
+    reader.feed_eof()
+    assert run(read_frame(reader)) == packet.Frame("tag", packet.FLAG_CORRELATION_ID, b"body", 7)
+    assert run(read_frame(reader)) == packet.Frame(None, 0, b"other")
+    with pytest.raises(packet.InvalidData):
+        run(read_frame(reader))
+    assert run(read_frame(reader)) is None
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
@@ -1,6 +1,7 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
 
+import json
 import math
 import sys
 import threading
@@ -8,6 +9,11 @@ import threading
 import pytest
 
 import packet
+# noinspection PyProtectedMember
+from packet import serializers
+from packet import evaluate
+from packet._compat import PY2
+from packet.evaluate import fast_eval
 from tests import utils
 
 
@@ -34,6 +40,54 @@ def test_packet_safe_eval():
     assert packet.safe_eval(repr(complex("inf-infj"))) == complex("inf-infj")
 
 
+def _evaluate(function, string):
+    try:
+        return True, function(string)
+    except Exception as e:
+        return False, e.__class__
+
+
+def _same_value(a, b):
+    if a.__class__ is not b.__class__:
+        return False
+    if isinstance(a, float):
+        return (math.isnan(a) and math.isnan(b)) or (a == b and math.copysign(1, a) == math.copysign(1, b))
+    if isinstance(a, complex):
+        return _same_value(a.real, b.real) and _same_value(a.imag, b.imag)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_same_value(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return set(a) == set(b) and all(_same_value(a[k], b[k]) for k in a)
+    return a == b
+
+
+def test_fast_eval():
+    # fast_eval must give the same result (or error) as safe_eval
+    values = [0, -1, 10 ** 30, 1.5, -0.0, 1e-05, 1e300, float("inf"), float("-inf"), float("nan"), 2j, -2j,
+              complex(1, -2), complex(-0.0, 0.0), complex("inf+nanj"), "", "text", "'\"\\\né", b"", b"\x00\xff",
+              True, False, None, (), (1,), [], {}, set(), {1, 2}, {"k": [1, (2, 3), {"n": None}]}]
+    strings = [repr(value) for value in values] + [repr(values), repr(tuple(values[:10]))]
+    strings += ["1+2", "1 - 2j", "--1", "-True", "set([1, 2])", "set()", "set(1, 2)", "(1)", "(1,)", "[1,]", "{1: 2,}",
+                "00", "012", "012.5", "0x10", "1_000", "10L", "r'x'", "'''x'''", "'a' 'b'", "b'é'", " 1",
+                "1\n+2", "[1,\n2]", "1 # comment", "'a' + 'b'", "1 * 2", "x", "set", "{[1]: 2}", "{1: 2 3: 4}",
+                "[" * 300 + "]" * 300, "", "1, 2", "'\x00'", "..."]
+    for string in strings:
+        fast, safe = _evaluate(fast_eval, string), _evaluate(packet.safe_eval, string)
+        assert fast[0] == safe[0], string
+        assert _same_value(fast[1], safe[1]) if fast[0] else fast[1] is safe[1], string
+
+
+def test_fast_eval_sets(monkeypatch):
+    # Sets are evaluated without falling back to safe_eval
+    def safe_eval(string):
+        raise AssertionError("Fell back to safe_eval for {}".format(string))
+
+    monkeypatch.setattr(evaluate, "safe_eval", safe_eval)
+    assert fast_eval("set()") == set()
+    assert fast_eval("set([1, 2])") == {1, 2}
+    assert fast_eval("[set(), {'a': set((1, 'b'))}]") == [set(), {"a": {1, "b"}}]
+
+
 def test_ast_packet():
     packet1 = utils.ASTTestPacket()
     packet2 = utils.ASTTestPacket()
@@ -46,6 +100,34 @@ def test_ast_packet():
     utils.check_ast_test_packet(packet1, packet2)
 
 
+def test_ast_serializer():
+    for value in (0, -1.5, float("nan"), complex(-0.0, 1), "'\"", b"\x00", None, True, (), (1,), ([1],), [], {}, set(),
+                  {1, (2, 3)}, {"a": {(1, 2): [3, {4: None}]}}):
+        # Same literal as repr, which in Python 2 is set([...]) for sets
+        literal = packet.ast_serializer.dumps(value).decode("utf-8")
+        assert _same_value(packet.safe_eval(literal), packet.safe_eval(repr(value)))
+        assert PY2 or literal == repr(value)
+
+    circular = []
+    circular.append(circular)
+    for value in ([object()], circular):
+        with pytest.raises(packet.NotSerializable):
+            packet.ast_serializer.dumps(value)
+
+
+def test_json_serializer():
+    value = {"a": [1, {"b": (2.5, None)}], "c": list(range(100)), "d": {str(i): i for i in range(100)}}
+    assert packet.json_serializer.dumps(value) == json.dumps(value).encode()
+    assert "".join(packet.json_serializer.iterencode(value)).encode() == json.dumps(value).encode()
+
+    circular = []
+    circular.append([circular])
+    # Non string keys are not allowed at any depth
+    for value in ({1: 2}, [{"a": [{(1,): 2}]}], {"a": {str(i): {i: i} for i in range(100)}}, [object()], circular):
+        with pytest.raises(packet.NotSerializable):
+            packet.json_serializer.dumps(value)
+
+
 def test_json_packet():
     packet1 = utils.JSONTestPacket()
     packet2 = utils.JSONTestPacket()
@@ -58,6 +140,195 @@ def test_json_packet():
     utils.check_json_test_packets(packet1, packet2)
 
 
+def test_binary_packet():
+    packet1 = utils.BinaryTestPacket()
+    packet2 = utils.BinaryTestPacket()
+
+    # Modify values
+    utils.modify_ast_test_packet(packet1)
+    packet1.dict = {1: [-1, 2 ** 70, -2 ** 70], (1.5, None): {b"a", u"\xe9"}, "c": complex("1+infj")}
+
+    packet2.loads(packet1.dumps())
+
+    utils.check_ast_test_packet(packet1, packet2)
+
+
+def test_binary_serializer():
+    for value in (0, 1, -1, 127, 128, -129, 2 ** 64, float("inf"), -0.0, 0.1, 1e300, u"", u"\u20ac", b"\x00\xff",
+                  [], (), set(), {}, [[(1,)]], {"a": {"b": None}}, True, False, None):
+        assert packet.binary_serializer.loads(packet.binary_serializer.dumps(value)) == value
+
+    with pytest.raises(packet.NotSerializable):
+        packet.binary_serializer.dumps([object()])
+    for data in (b"", b"x", b"i", b"s\x05abc", b"NN"):
+        with pytest.raises((ValueError, IndexError)):
+            packet.binary_serializer.loads(data)
+
+
+def test_dumps_into(monkeypatch):
+    packet1 = utils.BinaryTestPacket()
+    utils.modify_ast_test_packet(packet1)
+    data = packet1.dumps()
+
+    buffer = bytearray(b"head")
+    assert packet1.dumps_into(buffer, 4) == len(data)
+    assert buffer == b"head" + data
+
+    view = memoryview(bytearray(len(data) + 2))
+    assert packet1.dumps_into(view, 2) == len(data)
+    assert view[2:].tobytes() == data
+    packet2 = utils.BinaryTestPacket()
+    packet2.loads(view[2:].tobytes())
+    utils.check_ast_test_packet(packet1, packet2)
+
+    with pytest.raises(ValueError):
+        packet1.dumps_into(view, 3)
+    with pytest.raises(ValueError):
+        packet1.dumps_into(bytearray(), 1)
+
+    # Appending to a bytearray serializes straight into it
+    def dump_buffer(data):
+        raise AssertionError("Serialized into an intermediate buffer")
+
+    monkeypatch.setattr(packet.binary_serializer, "_dump_buffer", dump_buffer)
+    buffer = bytearray(b"head")
+    assert packet1.dumps_into(buffer, 4) == len(data)
+    assert buffer == b"head" + data
+    packet1.list = [object()]
+    with pytest.raises(packet.NotSerializable):
+        packet1.dumps_into(buffer, len(buffer))
+    assert buffer == b"head" + data
+    monkeypatch.undo()
+
+    json_packet = utils.JSONTestPacket()
+    buffer = bytearray(b"head")
+    assert json_packet.dumps_into(buffer, 4) == len(json_packet.dumps())
+    assert buffer == b"head" + json_packet.dumps()
+
+
+class CompressedTestPacket(utils.JSONTestPacket):
+    compression_threshold = 64
+
+
+def test_compression():
+    packet1 = CompressedTestPacket()
+    packet2 = CompressedTestPacket()
+    utils.modify_json_test_packet(packet1)
+    packet1.str = "repetitive " * 50
+
+    data = packet1.dumps()
+    # noinspection PyProtectedMember
+    assert len(data) < len(packet.json_serializer.dumps({"CompressedTestPacket": packet1._snapshot()}))
+    packet2.loads(data)
+    utils.check_json_test_packets(packet1, packet2)
+
+    # Small packets are not compressed, but still have the stage header
+    packet1.str = ""
+    packet1.list = []
+    packet1.dict = {}
+    packet1.tuple = ()
+    packet2.loads(packet1.dumps())
+    utils.check_json_test_packets(packet1, packet2)
+
+    for invalid in (b"\x02" + packet1.dumps()[1:], packet1.dumps()[:-1]):
+        with pytest.raises(packet.UnknownPacket):
+            packet2.loads(invalid)
+
+
+@pytest.mark.skipif(PY2, reason="Compression dictionaries require Python 3.3+")
+def test_compression_dictionary():
+    packet1 = CompressedTestPacket()
+    packet2 = CompressedTestPacket()
+    utils.modify_json_test_packet(packet1)
+    packet1.str = ""
+    packet1.list = []
+    packet1.dict = {}
+    packet1.tuple = ()
+
+    samples = []
+    for i in range(20):
+        sample = CompressedTestPacket()
+        sample.int = i
+        samples.append(sample)
+    size = len(packet1.dumps())
+    try:
+        dictionary = CompressedTestPacket.train_compression(samples, 1024)
+        assert 0 < len(dictionary) <= 1024 and CompressedTestPacket.compression_dict is dictionary
+        assert len(packet1.dumps()) < size / 2
+        packet2.loads(packet1.dumps())
+        utils.check_json_test_packets(packet1, packet2)
+        data = packet1.dumps()
+    finally:
+        CompressedTestPacket.compression_dict = None
+
+    # Data compressed with a dictionary can not be loaded without it
+    with pytest.raises(packet.UnknownPacket):
+        packet2.loads(data)
+
+
+def test_dumps_many_and_loads_many():
+    packets1 = [utils.JSONTestPacket(), utils.ASTTestPacket(), utils.JSONTestPacket()]
+    packets2 = [utils.JSONTestPacket(), utils.ASTTestPacket(), utils.JSONTestPacket()]
+    for i, p in enumerate(packets1):
+        utils.modify_json_test_packet(p)
+        p.int = i
+
+    data = packet.Packet.dumps_many(packets1, packet.ast_serializer)
+    packet.Packet.loads_many(packets2, data, packet.ast_serializer)
+    for p1, p2 in zip(packets1, packets2):
+        utils.check_json_test_packets(p1, p2)
+
+    packets3 = [utils.JSONTestPacket(), utils.JSONTestPacket()]
+    packet.Packet.loads_many(packets3, packet.Packet.dumps_many(packets1[::2]))
+    assert [p.int for p in packets3] == [0, 2]
+
+    with pytest.raises(packet.InvalidData):
+        packet.Packet.loads_many(packets2[:2], data, packet.ast_serializer)
+    with pytest.raises(packet.InvalidData):
+        packet.Packet.loads_many(packets2[1:] + packets2[:1], data, packet.ast_serializer)
+    with pytest.raises(packet.UnknownPacket):
+        packet.Packet.loads_many(packets3, packets3[0].dumps())
+
+
+def test_delta():
+    packet1 = utils.JSONTestPacket()
+    packet2 = utils.JSONTestPacket()
+    with pytest.raises(ValueError):
+        packet1.dumps_delta()
+
+    packet1.enable_delta()
+    utils.modify_json_test_packet(packet1)
+    packet2.loads_delta(packet1.dumps_delta())
+    utils.check_json_test_packets(packet1, packet2)
+
+    packet1.int = 5
+    packet1.protected = 6
+    packet1.list.append(4)
+    packet1.mark_dirty("list")
+    delta = packet1.dumps_delta()
+    assert packet.json_serializer.loads(delta) == {"JSONTestPacket": {"int": 5, "_protected": 6, "list": [1, 2, 3, 4]}}
+    packet2.loads_delta(delta)
+    utils.check_json_test_packets(packet1, packet2)
+
+    assert packet.json_serializer.loads(packet1.dumps_delta()) == {"JSONTestPacket": {}}
+
+    # Changes are kept for the next delta if a delta can't be serialized
+    packet1.int = 7
+    packet1.dict = {"object": object()}
+    with pytest.raises(packet.NotSerializable):
+        packet1.dumps_delta()
+    packet1.dict = {}
+    delta = packet1.dumps_delta()
+    assert packet.json_serializer.loads(delta) == {"JSONTestPacket": {"int": 7, "dict": {}}}
+    packet2.loads_delta(delta)
+    utils.check_json_test_packets(packet1, packet2)
+
+    with pytest.raises(AttributeError):
+        packet1.mark_dirty("unknown")
+    with pytest.raises(packet.InvalidData):
+        packet2.loads_delta(packet.json_serializer.dumps({"JSONTestPacket": {"unknown": 1}}))
+
+
 def test_undefined_attribute():
     packet1 = utils.JSONTestPacket()
     with pytest.raises(AttributeError):
@@ -94,6 +365,37 @@ def test_send_to_and_receive_from():
     utils.check_json_test_packets(packet1, packet2)
 
 
+def test_attributes_cache():
+    packet1 = utils.ASTTestPacket()
+    # noinspection PyProtectedMember
+    attributes = serializers._get_attributes(packet1)
+    assert attributes == {"dict", "list", "tuple", "str", "unicode", "int", "long", "float", "bool", "none",
+                          "_protected", "_JSONTestPacket__private", "set", "bytes", "complex"}
+    utils.modify_ast_test_packet(packet1)
+    # noinspection PyProtectedMember
+    assert serializers._get_attributes(packet1) is attributes
+
+
+def test_snapshot():
+    packet1 = utils.JSONTestPacket()
+    # noinspection PyProtectedMember
+    snapshot = packet1._snapshot()
+    assert snapshot == {attribute: getattr(packet1, attribute) for attribute in serializers._get_attributes(packet1)}
+    packet1.dumps()
+    # noinspection PyProtectedMember
+    assert packet1._snapshot() is snapshot
+
+    packet1.int = 7
+    # noinspection PyProtectedMember
+    assert packet1._snapshot()["int"] == 7
+    assert snapshot["int"] != 7
+
+    packet2 = utils.JSONTestPacket()
+    packet2.loads(packet1.dumps())
+    # noinspection PyProtectedMember
+    assert packet2._snapshot()["int"] == 7
+
+
 def test_delattr():
     packet1 = utils.JSONTestPacket()
     with pytest.raises(AttributeError):
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import socket
+import sys
+import threading
+
+import pytest
+
+import packet
+from tests.test_router import OtherTestPacket
+
+channel = pytest.importorskip("packet.channel")
+server = pytest.importorskip("packet.server")
+
+
+class DeferredTestPacket(packet.Packet):
+    def __init__(self):
+        self.value = 0
+
+
+@pytest.fixture
+def packet_server():
+    requests = []
+
+    def on_other(connection, p):
+        p.value *= 2
+        connection.reply(p)
+        connection.send(p)  # Not a response
+
+    def on_deferred(connection, p):
+        # Reply to every 3 requests, in the reverse order
+        requests.append((connection.correlation_id, p))
+        if len(requests) == 3:
+            while requests:
+                correlation_id, request = requests.pop()
+                connection.send(request, correlation_id=correlation_id)
+
+    packet_server = server.PacketServer(("127.0.0.1", 0), workers=2)
+    packet_server.register(OtherTestPacket, on_other)
+    packet_server.register(DeferredTestPacket, on_deferred)
+    packet_server.start()
+    yield packet_server
+    packet_server.stop()
+
+
+def test_multiplexed_channel(packet_server):
+    received = []
+    notified = threading.Event()
+
+    def on_notification(p):
+        received.append(p)
+        if len(received) == 3:
+            notified.set()
+
+    router = packet.PacketRouter()
+    router.register(OtherTestPacket, on_notification)
+    with channel.MultiplexedChannel(socket.create_connection(packet_server.address), router) as multiplexed:
+        request = OtherTestPacket()
+        request.value = 21
+        assert multiplexed.call(request, OtherTestPacket, timeout=5).value == 42
+
+        # Responses arriving in any order complete their own request
+        futures = []
+        for i in range(3):
+            deferred = DeferredTestPacket()
+            deferred.value = i
+            futures.append(multiplexed.request(deferred, DeferredTestPacket))
+        assert [future.result(5).value for future in futures] == [0, 1, 2]
+
+        frame = multiplexed.call(request, timeout=5)
+        assert frame.tag == "OtherTestPacket" and frame.correlation_id is not None
+        with pytest.raises(packet.InvalidData):
+            multiplexed.call(request, DeferredTestPacket, timeout=5)
+
+        # Requests without a response fail when the channel is closed
+        pending = multiplexed.request(DeferredTestPacket(), DeferredTestPacket)
+        assert multiplexed.pending == 1
+
+        # Every request was also answered with a notification
+        assert notified.wait(5)
+    with pytest.raises(packet.ChannelClosed):
+        pending.result(5)
+    with pytest.raises(packet.ChannelClosed):
+        multiplexed.request(request)
+    assert len(received) == 3 and all(p.value == 42 for p in received)
+
+
+class BrokenTestPacket(OtherTestPacket):
+    def __init__(self):
+        raise ValueError("broken")
+
+
+def test_multiplexed_channel_unexpected_errors(packet_server):
+    def on_notification(p):
+        raise RuntimeError("broken handler")
+
+    router = packet.PacketRouter()
+    router.register(OtherTestPacket, on_notification)
+    with channel.MultiplexedChannel(socket.create_connection(packet_server.address), router) as multiplexed:
+        request = OtherTestPacket()
+        request.value = 21
+        # The error loading the response is raised by its future
+        with pytest.raises(ValueError):
+            multiplexed.call(request, BrokenTestPacket, timeout=5)
+        # Neither that error nor those of the handler stop the channel
+        assert multiplexed.call(request, OtherTestPacket, timeout=5).value == 42
+        assert not multiplexed.closed
+
+
+def test_channel_pool(packet_server):
+    errors = []
+
+    def call(pool, start):
+        try:
+            request = OtherTestPacket()
+            for value in range(start, start + 50):
+                request.value = value
+                assert pool.call(request, OtherTestPacket, timeout=5).value == value * 2
+        except Exception as e:
+            errors.append(e)
+
+    with channel.ChannelPool(packet_server.address, size=2, max_pending=1) as pool:
+        threads = [threading.Thread(target=call, args=(pool, i * 100)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert 1 <= len(pool.channels) <= 2
+    assert not pool.channels
+    with pytest.raises(packet.ChannelClosed):
+        pool.call(OtherTestPacket())
+
+
+def test_channel_pool_slow_connect(packet_server):
+    results = []
+    connecting = threading.Event()
+    connected = threading.Event()
+
+    def call(pool):
+        request = OtherTestPacket()
+        request.value = 21
+        results.append(pool.call(request, OtherTestPacket, timeout=5).value)
+
+    with channel.ChannelPool(packet_server.address, size=1) as pool:
+        connect = pool._connect
+
+        def slow_connect():
+            connecting.set()
+            connected.wait(5)
+            return connect()
+
+        pool._connect = slow_connect
+        threads = [threading.Thread(target=call, args=(pool,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        assert connecting.wait(5)
+        # The pool is not locked while a channel is being opened
+        assert pool.channels == []
+        connected.set()
+        for thread in threads:
+            thread.join()
+        assert results == [42, 42] and len(pool.channels) == 1
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import json
+import sys
+import threading
+
+import pytest
+
+import packet
+from packet import Field
+
+
+class FieldsTestPacket(packet.Packet):
+    integer = Field(int, 1)
+    float = Field(float, 0.5)
+    list = Field(list, factory=list)
+    tuple = Field(tuple, (1, 2))
+    str = Field(str)
+
+
+class ChildFieldsTestPacket(FieldsTestPacket):
+    extra = Field(int, 0)
+    float = Field(float, 1.5)
+
+
+class PlainTestPacket(packet.Packet):
+    def __init__(self):
+        self.plain = 1
+
+
+class InspectedFieldsTestPacket(packet.InspectedPacket):
+    integer = Field(int, 0)
+    set = Field(set, factory=set)
+    optional = Field(int)
+
+
+def test_fields():
+    packet1 = FieldsTestPacket()
+    packet2 = FieldsTestPacket()
+    assert not hasattr(packet1, "__dict__")
+    assert (packet1.integer, packet1.float, packet1.list, packet1.tuple, packet1.str) == (1, 0.5, [], (1, 2), None)
+    assert packet1.list is not packet2.list
+
+    packet1.integer = 2
+    packet1.float = 3  # Converted to float
+    packet1.list.append("a")
+    packet1.tuple = (3,)
+    packet1.str = "str"
+    assert packet1.float == 3.0 and isinstance(packet1.float, float)
+
+    data = packet1.dumps()
+    assert json.loads(data.decode()) == {
+        "FieldsTestPacket": {"integer": 2, "float": 3.0, "list": ["a"], "tuple": [3], "str": "str"}}
+    if sys.version_info >= (3, 7):
+        # Fields are serialized in declaration order where dicts are ordered
+        assert data == b'{"FieldsTestPacket": {"integer": 2, "float": 3.0, "list": ["a"], "tuple": [3], "str": "str"}}'
+    packet2.loads(data)
+    assert (packet2.integer, packet2.float, packet2.list, packet2.tuple, packet2.str) == (2, 3.0, ["a"], (3,), "str")
+
+    with pytest.raises(TypeError):
+        packet1.integer = "1"
+    with pytest.raises(TypeError):
+        packet1.float = None
+    with pytest.raises(AttributeError):
+        packet1.other = 1
+    packet1.str = None
+
+
+def test_fields_invalid_data():
+    packet1 = FieldsTestPacket()
+    packet1.str = "str"
+    for data in (b'{"FieldsTestPacket": {"integer": "2", "float": 3.0, "list": [], "tuple": [], "str": null}}',
+                 b'{"FieldsTestPacket": {"integer": 2, "float": 3.0, "list": [], "str": null}}',
+                 b'{"FieldsTestPacket": {"integer": 2}}'):
+        with pytest.raises(packet.InvalidData):
+            packet1.loads(data)
+        # Invalid data leaves the packet unchanged
+        assert packet1.integer == 1 and packet1.str == "str"
+
+    packet1.enable_delta()
+    packet2 = FieldsTestPacket()
+    packet2.loads_delta(packet1.dumps_delta())
+    with pytest.raises(packet.InvalidData):
+        packet2.loads_delta(b'{"FieldsTestPacket": {"tuple": 1}}')
+    assert packet2.str == "str"
+
+
+def test_fields_inheritance():
+    packet1 = ChildFieldsTestPacket()
+    assert ChildFieldsTestPacket.__slots__ == ("extra",)
+    assert packet1._packet_fields == ("integer", "float", "list", "tuple", "str", "extra")
+    assert packet1.float == 1.5
+    packet1.extra = 3
+    packet2 = ChildFieldsTestPacket()
+    packet2.set_binary_serializer()
+    packet1.set_binary_serializer()
+    packet2.loads(packet1.dumps())
+    assert packet2.extra == 3
+
+    with pytest.raises(ValueError):
+        Field(list, [])
+    with pytest.raises(TypeError):
+        type("SlotsTestPacket", (packet.Packet,), {"__slots__": ("a",), "b": Field(int)})
+    # The attributes of packets without fields would not be serialized
+    with pytest.raises(TypeError):
+        type("MixedTestPacket", (PlainTestPacket,), {"b": Field(int)})
+
+
+def test_inspected_fields():
+    packet1 = InspectedFieldsTestPacket()
+    packet1.set_ast_serializer()
+    packet1.integer = 5
+    packet1.set.add(3)
+    packet2 = InspectedFieldsTestPacket()
+    packet2.set_ast_serializer()
+    packet2.loads(packet1.dumps())
+    assert packet2.integer == 5 and packet2.set == {3}
+
+    # Values are validated against the field types, not the current values
+    for serializer in (packet.ast_serializer, packet.binary_serializer):
+        packet1.set_serializer(serializer)
+        packet2.set_serializer(serializer)
+        for value in (7, None, 8):
+            packet1.optional = value
+            packet2.loads(packet1.dumps())
+            assert packet2.optional == value
+        data = packet1.dumps()
+        packet2._packet_serializer.deserialize_object(packet2, serializer.loads(data)["InspectedFieldsTestPacket"])
+        assert packet2.optional == 8
+
+    packet1.set_ast_serializer()
+    packet2.set_ast_serializer()
+    with pytest.raises(packet.InvalidData):
+        packet2.loads(packet1.dumps().replace(b"8", b"'8'"))
+    assert packet2.optional == 8
+
+
+def test_fields_threads():
+    # Packets share locks, which must not block each other
+    packets = [FieldsTestPacket() for _ in range(100)]
+    errors = []
+
+    def modify(value):
+        try:
+            for p in packets:
+                p.integer = value
+                FieldsTestPacket().loads(p.dumps())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=modify, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
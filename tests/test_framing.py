@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import struct
+import sys
+
+import pytest
+
+import packet
+from tests import utils
+
+
+class StreamConnection:
+    """
+    Dummy stream connection which delivers at most chunk_size bytes per recv
+    and accepts at most chunk_size bytes per send.
+    """
+
+    def __init__(self, chunk_size=7):
+        self.chunk_size = chunk_size
+        self.data = b""
+
+    def send(self, data):
+        # bytes() of a memoryview is its repr in Python 2
+        data = bytes(bytearray(data[:self.chunk_size]))
+        self.data += data
+        return len(data)
+
+    def recv(self, buffer_size):
+        size = min(buffer_size, self.chunk_size)
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+class ScatterConnection(StreamConnection):
+    """
+    Dummy stream connection which also supports scatter-gather sends,
+    accepting at most chunk_size bytes per sendmsg.
+    """
+
+    def __init__(self, chunk_size=7):
+        StreamConnection.__init__(self, chunk_size)
+        self.buffer_counts = []
+
+    def sendmsg(self, buffers):
+        self.buffer_counts.append(len(buffers))
+        data = b"".join(bytes(bytearray(buffer)) for buffer in buffers)
+        return self.send(data)
+
+
+class RecvIntoConnection(StreamConnection):
+    """
+    Dummy stream connection which also supports recv_into.
+    """
+
+    def recv_into(self, buffer, nbytes=0):
+        data = self.recv(nbytes or len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def test_pack_frame():
+    frame = packet.pack_frame(b"body", "tag", 3)
+    reader = packet.FrameReader()
+    assert reader.feed(frame) == 1
+    assert reader.next_frame() == packet.Frame("tag", 3, b"body")
+    assert reader.next_frame() is None
+
+    reader.feed(packet.pack_frame(b""))
+    assert reader.next_frame() == packet.Frame(None, 0, b"")
+
+
+def test_correlation_id():
+    frame = packet.pack_frame(b"body", "tag", 3, correlation_id=2 ** 64 - 1)
+    reader = packet.FrameReader()
+    reader.feed(frame[:-3])
+    assert reader.next_frame() is None
+    reader.feed(frame[-3:] + packet.pack_frame(b"", correlation_id=0))
+    assert reader.next_frame() == packet.Frame("tag", 3 | packet.FLAG_CORRELATION_ID, b"body", 2 ** 64 - 1)
+    assert reader.next_frame() == packet.Frame(None, packet.FLAG_CORRELATION_ID, b"", 0)
+
+    connection = RecvIntoConnection()
+    packet.send_frame(connection, b"body", "tag", correlation_id=5)
+    assert packet.FrameReader(connection).receive() == packet.Frame("tag", packet.FLAG_CORRELATION_ID, b"body", 5)
+
+    with pytest.raises(ValueError):
+        packet.pack_frame(b"body", correlation_id=2 ** 64)
+    with pytest.raises(ValueError):
+        packet.pack_frame(b"body", flags=packet.FLAG_CORRELATION_ID)
+
+
+def test_partial_frames():
+    data = packet.pack_frame(b"first", "a") + packet.pack_frame(b"second", "b")
+    first_size = len(packet.pack_frame(b"first", "a"))
+    reader = packet.FrameReader()
+    for i in range(len(data) - 1):
+        assert reader.feed(data[i:i + 1]) == (1 if i >= first_size - 1 else 0)
+    assert reader.feed(data[-1:]) == 2
+    assert reader.next_frame().body == b"first"
+    assert reader.next_frame().body == b"second"
+
+
+def test_frame_too_large():
+    reader = packet.FrameReader(max_frame_size=4)
+    with pytest.raises(packet.InvalidData):
+        reader.feed(packet.pack_frame(b"12345"))
+
+
+def test_malformed_tag():
+    malformed = struct.pack("!IBB", 4, 0, 2) + b"\xff\xfe" + b"body"
+    reader = packet.FrameReader()
+    with pytest.raises(packet.InvalidData):
+        reader.feed(malformed)
+    # The malformed frame is skipped
+    assert reader.feed(packet.pack_frame(b"next", "tag")) == 1
+    assert reader.next_frame() == packet.Frame("tag", 0, b"next")
+
+    connection = StreamConnection()
+    reader = packet.FrameReader(connection)
+    connection.data = malformed
+    utils.JSONTestPacket().send_to(connection, framed=True)
+    received = utils.JSONTestPacket()
+    assert not received.receive_from(reader)
+    assert received.receive_from(reader)
+
+
+def test_framed_send_to_and_receive_from():
+    connection = StreamConnection()
+    reader = packet.FrameReader(connection)
+
+    packets = [utils.JSONTestPacket() for _ in range(3)]
+    for p in packets:
+        utils.modify_json_test_packet(p)
+        p.str = "a longer string which spans several reads " * 20
+        assert p.send_to(connection, framed=True) == len(packet.pack_frame(p.dumps(), p.__tag__))
+
+    for p in packets:
+        received = utils.JSONTestPacket()
+        assert received.receive_from(reader)
+        utils.check_json_test_packets(p, received)
+
+    assert not utils.JSONTestPacket().receive_from(reader)
+    assert reader.closed
+
+
+def test_send_frame():
+    body = bytearray(b"a body which spans several sends")
+    for connection in (StreamConnection(), ScatterConnection()):
+        assert packet.send_frame(connection, body, "tag", 2) == len(packet.pack_frame(bytes(body), "tag", 2))
+        assert packet.send_frame(connection, memoryview(body)[:6]) == len(packet.pack_frame(b"a body"))
+        reader = packet.FrameReader(connection)
+        assert reader.receive() == packet.Frame("tag", 2, bytes(body))
+        assert reader.receive() == packet.Frame(None, 0, b"a body")
+
+    # Header and body are sent as separate buffers until the header is sent
+    assert connection.buffer_counts[0] == 2 and connection.buffer_counts[-1] == 1
+
+    # Frames with an empty body are sent as the header alone
+    connection = ScatterConnection()
+    assert packet.send_frame(connection, b"", "tag") == len(packet.pack_frame(b"", "tag"))
+    assert packet.FrameReader(connection).receive() == packet.Frame("tag", 0, b"")
+    assert connection.buffer_counts[0] == 1
+
+
+def test_pooled_receive():
+    pool = packet.BufferPool(buffer_size=64, max_buffers=1)
+    connection = RecvIntoConnection(chunk_size=50)
+    reader = packet.FrameReader(connection, buffer_size=16, pool=pool)
+
+    bodies = [b"small", b"large" * 40, b"", b"after"]
+    for body in bodies:
+        packet.send_frame(connection, body, "tag")
+    for body in bodies:
+        frame = reader.receive()
+        assert isinstance(frame.body, memoryview) and frame == packet.Frame("tag", 0, body)
+
+    # The buffer grown for the large frame is dropped, the small one is reused
+    assert reader.receive() is None and reader.closed
+    buffer = pool.acquire()
+    assert len(buffer) == 64 and pool.acquire() is not buffer
+
+    connection = RecvIntoConnection(chunk_size=4096)
+    received = utils.JSONTestPacket()
+    sender = utils.JSONTestPacket()
+    utils.modify_json_test_packet(sender)
+    sender.send_to(connection)
+    assert received.receive_from(connection, buffer_size=4096)
+    utils.check_json_test_packets(sender, received)
+    assert not received.receive_from(connection)
+
+
+def test_framed_receive_from_wrong_tag():
+    connection = StreamConnection()
+    reader = packet.FrameReader(connection)
+
+    utils.JSONTestPacket().send_to(connection, framed=True)
+    assert not utils.ASTTestPacket().receive_from(reader)
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
@@ -7,6 +7,7 @@ import sys
 import pytest
 
 import packet
+from packet import compiler, serializers
 from tests import utils
 
 
@@ -44,6 +45,130 @@ def test_inspected_packet():
     check_inspected_ast_test_packets(packet1, packet2)
 
 
+def test_binary_inspected_packet():
+    packet1 = ASTTestInspectedPacket()
+    packet2 = ASTTestInspectedPacket()
+    for p in (packet1, packet2):
+        p.set_binary_serializer()
+
+    # Modify values
+    modify_inspected_ast_test_packets(packet1)
+
+    packet2.loads(packet1.dumps())
+
+    check_inspected_ast_test_packets(packet1, packet2)
+
+    # Python 2 longs are loaded as int if they are small enough
+    packet.binary_serializer.verify_data_types("long", "int")
+    packet.binary_serializer.verify_data_types("int", "long")
+
+    packet1.int = 1.5
+    with pytest.raises(packet.InvalidData):
+        packet2.loads(packet1.dumps())
+
+
+def test_compiled_codec():
+    packet1 = ASTTestInspectedPacket()
+    modify_inspected_ast_test_packets(packet1)
+
+    # noinspection PyProtectedMember
+    generic = packet1._packet_serializer.serialize_object(packet1)
+    # noinspection PyProtectedMember
+    assert compiler.serialize_object(packet1._packet_serializer, packet1) == generic
+
+
+def test_compiled_codec_shape_change():
+    packet1 = ASTTestInspectedPacket()
+    packet2 = ASTTestInspectedPacket()
+    packet2.loads(packet1.dumps())
+
+    # Change the shape of packet1 (and then of packet2), so the compiled codec no longer applies
+    packet1.inner = datetime.datetime(2001, 1, 1)
+    with pytest.raises(packet.InvalidData):
+        packet2.loads(packet1.dumps())
+    assert isinstance(packet2.inner, utils.ASTTestPacket)
+
+    packet2.inner = datetime.datetime(2000, 1, 1)
+    packet2.loads(packet1.dumps())
+    assert packet2.inner == packet1.inner
+
+
+def test_invalid_data_is_not_applied():
+    packet1 = ASTTestInspectedPacket()
+    packet2 = ASTTestInspectedPacket()
+    modify_inspected_ast_test_packets(packet1)
+    packet1.inner.complex = "not complex"
+
+    with pytest.raises(packet.InvalidData):
+        packet2.loads(packet1.dumps())
+    assert packet2.str == ""
+    assert packet2.datetime == datetime.datetime(2000, 1, 1)
+
+
+def test_generic_deserializer(monkeypatch):
+    packet1 = ASTTestInspectedPacket()
+    packet2 = ASTTestInspectedPacket()
+    modify_inspected_ast_test_packets(packet1)
+    # noinspection PyProtectedMember
+    serializer = packet1._packet_serializer
+    data = serializer.serialize_object(packet1)
+
+    calls = []
+    # noinspection PyProtectedMember
+    original = serializers._obj_from_reduce
+
+    def obj_from_reduce(*args):
+        calls.append(args)
+        return original(*args)
+
+    # Each reduced object is built only once
+    monkeypatch.setattr(serializers, "_obj_from_reduce", obj_from_reduce)
+    serializer.deserialize_object(packet2, data)
+    check_inspected_ast_test_packets(packet1, packet2)
+    assert len(calls) == 1
+
+    # Nothing is assigned if any of the data is invalid
+    packet3 = ASTTestInspectedPacket()
+    data[2]["inner"][2]["complex"] = {1: "not complex"}
+    with pytest.raises(packet.InvalidData):
+        serializer.deserialize_object(packet3, data)
+    assert packet3.str == ""
+    assert packet3.datetime == datetime.datetime(2000, 1, 1)
+
+
+def test_inspected_delta():
+    packet1 = ASTTestInspectedPacket()
+    packet2 = ASTTestInspectedPacket()
+    packet1.enable_delta()
+    packet2.loads_delta(packet1.dumps_delta())
+
+    # Nested changes are detected without marking them
+    packet1.inner.int = 10
+    packet1.inner.set.add(1)
+    packet1.float = 2.5
+    delta = packet1.dumps_delta()
+    assert packet.ast_serializer.loads(delta) == {"ASTTestInspectedPacket": {2: {
+        "float": {1: 2.5}, "inner": {2: {"int": {1: 10}, "set": {1: {1}}}}}}}
+    packet2.loads_delta(delta)
+    check_inspected_ast_test_packets(packet1, packet2)
+
+    assert packet.ast_serializer.loads(packet1.dumps_delta()) == {"ASTTestInspectedPacket": {2: {}}}
+
+    # Changes are kept for the next delta if a delta can't be serialized
+    packet1.inner.int = 11
+    packet1.float = lambda: 0
+    with pytest.raises(packet.NotSerializable):
+        packet1.dumps_delta()
+    packet1.float = 3.5
+    assert packet.ast_serializer.loads(packet1.dumps_delta()) == {"ASTTestInspectedPacket": {2: {
+        "float": {1: 3.5}, "inner": {2: {"int": {1: 11}}}}}}
+
+    packet1.inner.int = "invalid"
+    with pytest.raises(packet.InvalidData):
+        packet2.loads_delta(packet1.dumps_delta())
+    assert packet2.inner.int == 10
+
+
 class ASTTestInspectedSafePacket(ASTTestInspectedPacket, packet.InspectedSafePacket):
     pass
 
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import os
+import sys
+
+import pytest
+
+import packet
+from tests import utils
+from tests.test_router import OtherTestPacket
+
+
+def _write_log(path, count=10):
+    packets = []
+    with packet.PacketLogWriter(path) as log:
+        for i in range(count):
+            p = utils.JSONTestPacket() if i % 2 == 0 else OtherTestPacket()
+            if i % 2 == 0:
+                utils.modify_json_test_packet(p)
+                p.int = i
+            else:
+                p.value = i
+            assert log.append(p, timestamp=100.0 + i) == i
+            packets.append(p)
+    return packets
+
+
+def test_log_read(tmpdir):
+    path = str(tmpdir.join("traffic.log"))
+    packets = _write_log(path)
+
+    with packet.PacketLogReader(path) as log:
+        assert len(log) == 10
+        record = log[2]
+        assert record.timestamp == 102.0 and record.frame.tag == "JSONTestPacket"
+        assert bytes(record.frame.body) == packets[2].dumps()
+        assert log[-1].frame.tag == "OtherTestPacket" and log.timestamp(-1) == 109.0
+        assert [r.timestamp for r in log[1:4]] == [101.0, 102.0, 103.0]
+        with pytest.raises(IndexError):
+            log[10]
+
+        assert log.find(103.5) == 4 and log.find(0) == 0 and log.find(200) == 10
+        assert [r.timestamp for r in log.records(103.5, 106.0)] == [104.0, 105.0]
+        assert len(list(log)) == 10
+
+
+def test_log_replay(tmpdir):
+    path = str(tmpdir.join("traffic.log"))
+    packets = _write_log(path)
+
+    with packet.PacketLogReader(path) as log:
+        target = utils.JSONTestPacket()
+        assert [p.int for p in log.replay(target, start=101.0)] == [2, 4, 6, 8]
+        utils.check_json_test_packets(packets[8], target)
+
+        received = []
+        router = packet.PacketRouter()
+        router.register(utils.JSONTestPacket)
+        router.register(OtherTestPacket, received.append)
+        assert len(list(log.replay(router, end=105.0))) == 5
+        assert [p.value for p in received] == [1, 3]
+
+        assert len(list(log.replay(router, 108.0, speed=1000))) == 2
+
+
+def test_log_recovery(tmpdir):
+    path = str(tmpdir.join("traffic.log"))
+    _write_log(path, 5)
+
+    # Index entries missing and an incomplete record at the end
+    with open(path + packet.log.INDEX_SUFFIX, "r+b") as fp:
+        fp.truncate(2 * 16)
+    with open(path, "ab") as fp:
+        # Header of a record with a 256 bytes body, but only 7 bytes of it
+        fp.write(b"\x40" * 8 + b"\x00\x00\x01\x00\x00\x00" + b"partial")
+    with packet.PacketLogReader(path) as log:
+        assert [r.timestamp for r in log] == [100.0, 101.0, 102.0, 103.0, 104.0]
+
+    with packet.PacketLogWriter(path) as log:
+        assert len(log) == 5
+        with pytest.raises(ValueError):
+            log.append(OtherTestPacket(), timestamp=1.0)
+        assert log.append_frame(b"body", "tag") == 5
+    assert os.path.getsize(path + packet.log.INDEX_SUFFIX) == 6 * 16
+
+    with packet.PacketLogReader(path) as log:
+        assert len(log) == 6 and log[5].frame == packet.Frame("tag", 0, b"body")
+        assert log.timestamp(5) >= 104.0
+
+
+def test_log_invalid_file(tmpdir):
+    path = tmpdir.join("not.log")
+    path.write_binary(b"not a packet log")
+    with pytest.raises(packet.InvalidData):
+        packet.PacketLogReader(str(path))
+    with pytest.raises(packet.InvalidData):
+        packet.PacketLogWriter(str(path))
+
+
+def test_log_correlation_id(tmpdir):
+    path = str(tmpdir.join("traffic.log"))
+    with packet.PacketLogWriter(path) as log:
+        log.append_frame(b"request", "tag", correlation_id=1)
+        log.append_frame(b"body", "tag")
+    with packet.PacketLogWriter(path) as log:
+        assert log.append_frame(b"response", correlation_id=1) == 2
+
+    with packet.PacketLogReader(path) as log:
+        assert [r.frame.correlation_id for r in log] == [1, None, 1]
+        assert bytes(log[2].frame.body) == b"response"
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
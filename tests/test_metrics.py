@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import sys
+
+import pytest
+
+import packet
+from packet import metrics
+from tests import utils
+
+
+class CompressedTestPacket(utils.JSONTestPacket):
+    compression_threshold = 0
+
+
+def test_metrics_hook():
+    events = []
+    packet1 = utils.JSONTestPacket()
+    packet2 = utils.JSONTestPacket()
+    utils.modify_json_test_packet(packet1)
+
+    packet.set_metrics_hook(lambda *event: events.append(event))
+    try:
+        data = packet1.dumps()
+        packet2.loads(data)
+    finally:
+        packet.set_metrics_hook(None)
+    utils.check_json_test_packets(packet1, packet2)
+
+    assert [e[1] for e in events] == ["lock", "snapshot", "generate", "serialize", "encrypt", "dumps",
+                                      "decrypt", "parse", "lock", "load", "loads"]
+    assert all(e[0] == "JSONTestPacket" and e[2] >= 0 for e in events)
+    sizes = {e[1]: e[3] for e in events}
+    assert sizes["dumps"] == sizes["loads"] == sizes["parse"] == len(data)
+
+    # Hooks are not called when disabled
+    packet1.dumps()
+    assert len(events) == 11
+
+
+def test_class_metrics_hook():
+    aggregator = packet.MetricsAggregator()
+    packet.set_metrics_hook(aggregator, CompressedTestPacket)
+    try:
+        assert packet.get_metrics_hook(CompressedTestPacket) is aggregator
+        assert packet.get_metrics_hook() is None
+        packet1 = CompressedTestPacket()
+        for _ in range(3):
+            packet1.loads(packet1.dumps())
+        utils.JSONTestPacket().dumps()
+    finally:
+        packet.set_metrics_hook(None, CompressedTestPacket)
+    assert packet.get_metrics_hook(CompressedTestPacket) is None
+
+    snapshot = aggregator.snapshot()
+    assert list(snapshot) == ["CompressedTestPacket"]
+    phases = snapshot["CompressedTestPacket"]
+    assert {"compress", "decompress", "dumps", "loads"}.issubset(phases)
+    assert phases["dumps"]["count"] == 3 and sum(phases["dumps"]["histogram"]) == 3
+    assert phases["dumps"]["p50"] <= phases["dumps"]["max"]
+    assert "CompressedTestPacket" in aggregator.report(limit=3)
+    assert len(aggregator.report(limit=3).splitlines()) == 4
+
+    aggregator.reset()
+    assert aggregator.snapshot() == {}
+
+
+def test_aggregator_percentiles():
+    aggregator = metrics.MetricsAggregator()
+    for seconds in [0.000001] * 98 + [0.001, 0.5]:
+        aggregator("tag", "phase", seconds, 1)
+    stats = aggregator.snapshot()["tag"]["phase"]
+    assert stats["count"] == 100 and stats["bytes"] == 100
+    assert stats["p50"] == 0.000002 and 0.001 <= stats["p99"] <= 0.002 and stats["max"] == 0.5
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
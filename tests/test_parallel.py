@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import sys
+
+import pytest
+
+import packet
+from tests import utils
+from tests.test_framing import StreamConnection
+from tests.test_inspectedpacket import ASTTestInspectedPacket
+from tests.test_router import OtherTestPacket
+from tests.test_safepacket import ASTTestSafePacket, CompressedSafePacket
+
+parallel = pytest.importorskip("packet.parallel")
+
+
+def test_parallel_codec():
+    packet.set_packet_encryption_key("key")
+    packet.set_packet_encryption_mode(packet.CBC_MODE)
+    classes = [ASTTestSafePacket, CompressedSafePacket, ASTTestInspectedPacket, utils.BinaryTestPacket]
+    with parallel.ParallelCodec(classes, workers=2, chunk_size=3, max_pending=2) as codec:
+        assert "ASTTestSafePacket" in codec and "OtherTestPacket" not in codec
+
+        packets1 = [cls() for cls in classes for _ in range(5)]
+        packets2 = [p.__class__() for p in packets1]
+        for p in packets1:
+            utils.modify_ast_test_packet(p)
+
+        payloads = codec.dumps_many(packets1)
+        assert len(payloads) == len(packets1)
+        for p, payload in zip(packets2, payloads):
+            p.loads(payload)
+        for p1, p2 in zip(packets1, packets2):
+            utils.check_ast_test_packet(p1, p2)
+
+        packets3 = [p.__class__() for p in packets1]
+        codec.loads_many(packets3, [p.dumps() for p in packets1])
+        for p1, p3 in zip(packets1, packets3):
+            utils.check_ast_test_packet(p1, p3)
+
+        # Results are returned in order, and errors raised at their position
+        items = [(p.__tag__, payload) for p, payload in zip(packets1, payloads)]
+        items.insert(7, ("ASTTestSafePacket", b"invalid data"))
+        decoded = codec.decode(items)
+        for _ in range(7):
+            next(decoded)
+        with pytest.raises(packet.UnknownEncryption):
+            next(decoded)
+
+
+def test_parallel_dispatch():
+    instance = utils.JSONTestPacket()
+    router = packet.PacketRouter()
+    router.register(instance)
+    router.register(OtherTestPacket)
+
+    packet1 = utils.JSONTestPacket()
+    utils.modify_json_test_packet(packet1)
+    others = [OtherTestPacket() for _ in range(10)]
+    connection = StreamConnection()
+    for i, other in enumerate(others):
+        other.value = i
+        other.send_to(connection, framed=True)
+    packet1.send_to(connection, framed=True)
+
+    with parallel.ParallelCodec([utils.JSONTestPacket, OtherTestPacket], workers=2, chunk_size=4) as codec:
+        packets = list(codec.dispatch(packet.FrameReader(connection), router))
+        assert [p.value for p in packets[:-1]] == list(range(10))
+        assert packets[-1] is instance
+        utils.check_json_test_packets(packet1, instance)
+
+        with pytest.raises(packet.UnknownPacket):
+            list(codec.decode([("UnknownTag", b"{}")]))
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import sys
+
+import pytest
+
+import packet
+from tests import utils
+from tests.test_framing import StreamConnection
+
+
+class OtherTestPacket(packet.Packet):
+    def __init__(self):
+        self.value = 0
+
+
+def test_router_dispatch():
+    received = []
+    instance = utils.JSONTestPacket()
+    router = packet.PacketRouter()
+    router.register(instance)
+    router.register(OtherTestPacket, received.append)
+    assert "JSONTestPacket" in router and "OtherTestPacket" in router
+
+    packet1 = utils.JSONTestPacket()
+    utils.modify_json_test_packet(packet1)
+    other = OtherTestPacket()
+    other.value = 5
+
+    connection = StreamConnection()
+    for p in (other, packet1, other):
+        p.send_to(connection, framed=True)
+    packets = list(router.receive_from(packet.FrameReader(connection)))
+
+    assert packets[1] is instance
+    utils.check_json_test_packets(packet1, instance)
+    assert [p.value for p in received] == [5, 5]
+    assert received[0] is not received[1] and packets[0] is received[0]
+
+
+def test_router_dispatch_data():
+    received = []
+    router = packet.PacketRouter()
+    router.register(OtherTestPacket, received.append)
+    router.register(utils.JSONTestPacket, tag="json")
+
+    other = OtherTestPacket()
+    other.value = 3
+    assert router.dispatch_data(other.dumps()).value == 3
+    assert router.dispatch(packet.Frame(None, 0, other.dumps())).value == 3
+    assert len(received) == 2
+
+    with pytest.raises(packet.UnknownPacket):
+        router.dispatch_data(utils.JSONTestPacket().dumps())
+    with pytest.raises(packet.UnknownPacket):
+        router.dispatch_data(b"not a packet")
+
+
+def test_router_register():
+    router = packet.PacketRouter()
+    router.register(OtherTestPacket)
+    with pytest.raises(ValueError):
+        router.register(OtherTestPacket())
+    with pytest.raises(TypeError):
+        router.register(object)
+
+    router.unregister("OtherTestPacket")
+    assert "OtherTestPacket" not in router
+    with pytest.raises(packet.UnknownPacket):
+        router.dispatch(packet.Frame("OtherTestPacket", 0, OtherTestPacket().dumps()))
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
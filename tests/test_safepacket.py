@@ -6,6 +6,7 @@ import sys
 import pytest
 
 import packet
+from packet import ciphers
 from tests import utils
 
 
@@ -29,6 +30,25 @@ def test_set_ctr_mode():
     assert packet.SafePacket.encryption_mode == packet.CTR_MODE
 
 
+def test_set_gcm_mode():
+    packet.SafePacket.encryption_mode = None
+    packet.set_gcm_mode()
+    assert packet.SafePacket.encryption_mode == packet.GCM_MODE
+
+    packet.SafePacket.encryption_mode = None
+    packet.set_packet_encryption_mode(packet.GCM_MODE)
+    assert packet.SafePacket.encryption_mode == packet.GCM_MODE
+
+
+def test_set_cipher_backend():
+    backend = packet.get_cipher_backend()
+    packet.set_cipher_backend("pyaes")
+    assert packet.get_cipher_backend() == "pyaes"
+    with pytest.raises(ValueError):
+        packet.set_cipher_backend("unknown")
+    packet.set_cipher_backend(backend)
+
+
 def test_set_packet_encryption_key():
     key = "key"
     packet.SafePacket.encryption_key = None
@@ -42,7 +62,7 @@ class ASTTestSafePacket(utils.ASTTestPacket, packet.SafePacket):
 
 def test_safe_packet():
     packet.set_packet_encryption_key("key")
-    for mode in [packet.CBC_MODE, packet.CTR_MODE]:
+    for mode in [packet.CBC_MODE, packet.GCM_MODE, packet.CTR_MODE]:
         packet.set_packet_encryption_mode(mode)
 
         packet1 = ASTTestSafePacket()
@@ -60,6 +80,122 @@ def test_safe_packet():
         utils.check_ast_test_packet(packet1, packet2)
 
 
+def test_cipher_backends_compatibility():
+    backend = packet.get_cipher_backend()
+    packet.set_packet_encryption_key("key")
+    # noinspection PyProtectedMember
+    backends = list(ciphers._BACKENDS)
+    for mode in [packet.CBC_MODE, packet.GCM_MODE, packet.CTR_MODE]:
+        packet.set_packet_encryption_mode(mode)
+        for backend1 in backends:
+            for backend2 in backends:
+                packet1 = ASTTestSafePacket()
+                packet2 = ASTTestSafePacket()
+                utils.modify_ast_test_packet(packet1)
+
+                packet.set_cipher_backend(backend1)
+                dump = packet1.dumps()
+                packet.set_cipher_backend(backend2)
+                packet2.loads(dump)
+
+                utils.check_ast_test_packet(packet1, packet2)
+    packet.set_cipher_backend(backend)
+
+
+def test_safe_packet_loads_memoryview():
+    # Framed packets are loaded from memoryviews
+    backend = packet.get_cipher_backend()
+    packet.set_packet_encryption_key("key")
+    # noinspection PyProtectedMember
+    for backend1 in list(ciphers._BACKENDS):
+        packet.set_cipher_backend(backend1)
+        for mode in [packet.CBC_MODE, packet.GCM_MODE, packet.CTR_MODE]:
+            packet.set_packet_encryption_mode(mode)
+            packet1 = ASTTestSafePacket()
+            packet2 = ASTTestSafePacket()
+            utils.modify_ast_test_packet(packet1)
+            packet2.loads(memoryview(b"  " + packet1.dumps())[2:])
+            utils.check_ast_test_packet(packet1, packet2)
+    packet.set_cipher_backend(backend)
+
+
+def test_gcm_tampered_data():
+    packet.set_packet_encryption_key("key")
+    packet.set_gcm_mode()
+
+    packet1 = ASTTestSafePacket()
+    dump = bytearray(packet1.dumps())
+    dump[20] ^= 1
+    with pytest.raises(packet.UnknownEncryption):
+        ASTTestSafePacket().loads(bytes(dump))
+
+
+def test_large_safe_packet():
+    packet.set_packet_encryption_key("key")
+    packet.set_packet_encryption_mode(packet.CTR_MODE)
+
+    packet1 = ASTTestSafePacket()
+    packet2 = ASTTestSafePacket()
+
+    # Larger than the cached CTR keystream
+    packet1.bytes = bytes(bytearray(range(256))) * 300
+    packet2.loads(packet1.dumps())
+
+    assert packet1.bytes == packet2.bytes
+
+
+def test_cipher_cache():
+    packet.set_packet_encryption_key("key1")
+    # noinspection PyProtectedMember
+    cipher = ciphers._get_cipher("key1", packet.CTR_MODE)
+    # noinspection PyProtectedMember
+    assert ciphers._get_cipher("key1", packet.CTR_MODE) is cipher
+
+    packet.set_packet_encryption_key("key2")
+    # noinspection PyProtectedMember
+    assert ciphers._get_cipher("key1", packet.CTR_MODE) is not cipher
+
+
+def test_safe_dumps_many_and_loads_many():
+    packet.set_packet_encryption_key("key")
+    for mode in [packet.CBC_MODE, packet.GCM_MODE, packet.CTR_MODE]:
+        packet.set_packet_encryption_mode(mode)
+
+        packets1 = [ASTTestSafePacket() for _ in range(3)]
+        packets2 = [ASTTestSafePacket() for _ in range(3)]
+        for p in packets1:
+            utils.modify_ast_test_packet(p)
+
+        dump = packet.SafePacket.dumps_many(packets1)
+        utils.check_encrypted(dump)
+        packet.SafePacket.loads_many(packets2, dump)
+
+        for p1, p2 in zip(packets1, packets2):
+            utils.check_ast_test_packet(p1, p2)
+
+
+class CompressedSafePacket(ASTTestSafePacket):
+    compression_threshold = 0
+
+
+def test_compressed_safe_packet():
+    packet.set_packet_encryption_key("key")
+    for mode in [packet.CBC_MODE, packet.GCM_MODE, packet.CTR_MODE]:
+        packet.set_packet_encryption_mode(mode)
+
+        packet1 = CompressedSafePacket()
+        packet2 = CompressedSafePacket()
+        packet3 = ASTTestSafePacket()
+        for p in (packet1, packet3):
+            utils.modify_ast_test_packet(p)
+            p.str = "compressed " * 100
+
+        dump = packet1.dumps()
+        assert len(dump) < len(packet3.dumps())
+        packet2.loads(dump)
+        utils.check_ast_test_packet(packet1, packet2)
+
+
 def test_fail_decryption():
     packet1 = ASTTestSafePacket()
     packet2 = ASTTestSafePacket()
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import socket
+import struct
+import sys
+import threading
+import time
+
+import pytest
+
+import packet
+from tests import utils
+from tests.test_router import OtherTestPacket
+
+server = pytest.importorskip("packet.server")
+
+
+class BrokenTestPacket(packet.Packet):
+    def __init__(self):
+        self.value = 0
+
+    def _update_dict(self, data):
+        raise RuntimeError("Unexpected error")
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_packet_server():
+    def on_packet(connection, p):
+        # Reply with the same packet
+        connection.send(p)
+
+    def on_other(connection, p):
+        time.sleep(0.001)
+        connection.send(p)
+
+    packet_server = server.PacketServer(("127.0.0.1", 0), workers=2, max_queue=4)
+    packet_server.register(utils.JSONTestPacket, on_packet)
+    packet_server.register(OtherTestPacket, on_other)
+    packet_server.start()
+
+    received = []
+    lock = threading.Lock()
+
+    def on_reply(connection, p):
+        with lock:
+            received.append(p)
+
+    clients = [server.PacketClient(packet_server.address) for _ in range(3)]
+    try:
+        for client in clients:
+            client.register(utils.JSONTestPacket, on_reply)
+            client.register(OtherTestPacket, on_reply)
+            client.connect(timeout=5)
+        wait_for(lambda: packet_server.stats()["connections"] == 3)
+
+        # Large packets are sent and received over many partial writes and reads
+        packet1 = utils.JSONTestPacket()
+        utils.modify_json_test_packet(packet1)
+        packet1.str = "x" * (4 * 1024 * 1024)
+        clients[0].send(packet1)
+        wait_for(lambda: len(received) == 1)
+        utils.check_json_test_packets(packet1, received[0])
+
+        # Packets of a connection are handled in order, even when the queue is full
+        others = []
+        for i in range(50):
+            other = OtherTestPacket()
+            other.value = i
+            others.append(other)
+        for client in clients[1:]:
+            for other in others:
+                client.send(other)
+        wait_for(lambda: len(received) == 101)
+        values = [p.value for p in received[1:]]
+        assert sorted(values) == sorted(list(range(50)) * 2)
+
+        wait_for(lambda: packet_server.stats()["queued"] == 0)
+        stats = packet_server.stats()
+        assert stats["frames_received"] == stats["frames_sent"] == stats["frames_handled"] == 101
+        assert stats["max_queued"] >= 4 and stats["pauses"] > 0
+        assert stats["accepted"] == 3 and stats["errors"] == stats["handler_errors"] == 0
+
+        clients[0].close()
+        wait_for(lambda: packet_server.stats()["connections"] == 2)
+        assert clients[0].connection.closed
+        assert clients[0].connection.send(packet1) == 0
+    finally:
+        for client in clients:
+            client.close()
+        packet_server.stop()
+    assert not packet_server.connections
+
+
+def test_packet_server_order():
+    # Every connection gets its replies in the order it sent the packets
+    def on_other(connection, p):
+        connection.send(p)
+
+    packet_server = server.PacketServer(("127.0.0.1", 0), workers=4, max_queue=2)
+    packet_server.register(OtherTestPacket, on_other)
+    packet_server.start()
+
+    results = {}
+    clients = []
+    try:
+        for i in range(4):
+            values = results[i] = []
+            client = server.PacketClient(packet_server.address)
+            client.register(OtherTestPacket, lambda connection, p, values=values: values.append(p.value))
+            client.connect(timeout=5)
+            clients.append(client)
+        other = OtherTestPacket()
+        for value in range(100):
+            other.value = value
+            for client in clients:
+                client.send(other)
+        wait_for(lambda: all(len(values) == 100 for values in results.values()))
+        for values in results.values():
+            assert values == list(range(100))
+    finally:
+        for client in clients:
+            client.close()
+        packet_server.stop()
+
+
+def test_packet_server_errors():
+    def on_packet(connection, p):
+        raise ValueError("Handler error")
+
+    packet_server = server.PacketServer(("127.0.0.1", 0), workers=1, max_frame_size=1024)
+    packet_server.register(utils.JSONTestPacket, on_packet)
+    packet_server.start()
+    client = server.PacketClient(packet_server.address)
+    try:
+        client.connect(timeout=5)
+        client.connection.send_frame(b"invalid data", "JSONTestPacket")
+        client.send(utils.JSONTestPacket())
+        wait_for(lambda: packet_server.stats()["handler_errors"] == 1)
+        assert packet_server.stats()["errors"] == 1
+
+        # Frames larger than max_frame_size close the connection
+        client.connection.send_frame(b"x" * 2048, "JSONTestPacket")
+        wait_for(lambda: client.connection._closed)
+        assert packet_server.stats()["errors"] == 2
+    finally:
+        client.close()
+        packet_server.stop()
+
+
+def test_packet_server_unexpected_errors():
+    handled = []
+    packet_server = server.PacketServer(("127.0.0.1", 0), workers=1)
+    packet_server.register(BrokenTestPacket, lambda connection, p: handled.append(p))
+    packet_server.register(OtherTestPacket, lambda connection, p: handled.append(p))
+    packet_server.start()
+    client = server.PacketClient(packet_server.address)
+    sock = socket.create_connection(packet_server.address)
+    try:
+        client.connect(timeout=5)
+        wait_for(lambda: packet_server.stats()["connections"] == 2)
+
+        # A frame with a tag which is not valid UTF-8 only closes its connection
+        sock.sendall(struct.pack("!IBB", 2, 0, 2) + b"\xff\xfe{}")
+        wait_for(lambda: packet_server.stats()["connections"] == 1)
+        assert sock.recv(16) == b""
+
+        # Unexpected errors loading a packet don't stop the worker
+        client.send(BrokenTestPacket())
+        client.send(OtherTestPacket())
+        wait_for(lambda: len(handled) == 1)
+        assert isinstance(handled[0], OtherTestPacket)
+        stats = packet_server.stats()
+        assert stats["errors"] == 2 and stats["frames_handled"] == 2 and stats["queued"] == 0
+        assert packet_server._running and not client.connection.closed
+    finally:
+        sock.close()
+        client.close()
+        packet_server.stop()
+
+
+if __name__ == "__main__":
+    pytest.main(sys.argv)
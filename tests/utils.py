@@ -122,3 +122,9 @@ def modify_ast_test_packet(packet1):
     packet1.set = {1, 2, 3}
     packet1.bytes = b"123"
     packet1.complex = 1 + 23j
+
+
+class BinaryTestPacket(ASTTestPacket):
+    def __init__(self):
+        super(BinaryTestPacket, self).__init__()
+        self.set_binary_serializer()